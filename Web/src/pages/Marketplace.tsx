@@ -44,6 +44,11 @@ interface MarketplaceItem {
   contact_info: string;
 }
 
+interface MarketplacePage {
+  next: string | null;
+  results: MarketplaceItem[];
+}
+
 const API_BASE = "http://localhost:8000/market/items/";
 
 export default function MarketplaceViewer() {
@@ -51,6 +56,7 @@ export default function MarketplaceViewer() {
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState<string | null>(null);
   const [selectedItem, setSelectedItem] = useState<MarketplaceItem | null>(null);
+  const [nextUrl, setNextUrl] = useState<string | null>(null);
 
   const navigate = useNavigate(); // 👈 Hook to navigate
 
@@ -58,12 +64,14 @@ export default function MarketplaceViewer() {
     fetchItems();
   }, []);
 
-  const fetchItems = async () => {
+  // The list is paginated; "next" loads the following page
+  const fetchItems = async (url: string = API_BASE) => {
     setLoading(true);
     setError(null);
     try {
-      const res = await axios.get<MarketplaceItem[]>(API_BASE);
-      setItems(res.data);
+      const res = await axios.get<MarketplacePage>(url);
+      setItems((current) => (url === API_BASE ? res.data.results : [...current, ...res.data.results]));
+      setNextUrl(res.data.next);
     } catch {
       setError("Failed to load marketplace items.");
     } finally {
@@ -120,6 +128,17 @@ export default function MarketplaceViewer() {
           ))}
         </div>
 
+        {nextUrl && !loading && (
+          <div className="flex justify-center mt-6">
+            <button
+              onClick={() => fetchItems(nextUrl)}
+              className="border border-primary text-primary px-4 py-2 rounded hover:bg-primary/10"
+            >
+              Load more
+            </button>
+          </div>
+        )}
+
         {selectedItem && (
           <div className="fixed inset-0 bg-black/50 flex items-center justify-center z-50">
             <div className="bg-white rounded-lg p-6 w-full max-w-3xl flex gap-6">
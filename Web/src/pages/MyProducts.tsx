@@ -58,8 +58,15 @@ export default function MyProducts() {
 
   const fetchItems = async () => {
     try {
-      const res = await axios.get<MarketplaceItem[]>(API_BASE);
-      const userItems = res.data.filter(
+      // The list is paginated; follow "next" through every page
+      const allItems: MarketplaceItem[] = [];
+      let url: string | null = `${API_BASE}?limit=100`;
+      while (url) {
+        const res: { data: { next: string | null; results: MarketplaceItem[] } } = await axios.get(url);
+        allItems.push(...res.data.results);
+        url = res.data.next;
+      }
+      const userItems = allItems.filter(
         (item) => item.seller_id === currentUser.idNumber
       );
       setItems(userItems);
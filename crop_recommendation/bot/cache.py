@@ -0,0 +1,208 @@
+"""
+Answer cache for agro_bot questions.
+
+Questions are normalized (case, punctuation, English and Swahili stopwords)
+and cut into character shingles. An identical normalized question hits a
+plain dict; otherwise MinHash signatures are banded into an LSH index, and
+the candidates that share a band are checked by their exact Jaccard
+similarity against `threshold`. A near duplicate must also have exactly the
+same content words (stemmed, stopwords dropped), so two long questions that
+differ only in the crop or the unit never share an answer.
+"How do I control fall armyworm in maize?" and "Fall armyworms on maize -
+how to control them" share an entry; "...in sorghum?" does not. Entries
+expire after `ttl` seconds and are evicted least recently used.
+"""
+
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from collections import Counter, OrderedDict, defaultdict
+import numpy as np
+
+# Question words (how/when/why, jinsi/lini/kwa nini...) are kept: they change what is being asked
+STOPWORDS = frozenset("""
+a about all also am an and any are as at be been but by can could did do does doing for from had has have
+i if in into is it its me my of on or our should so than that the their them then there these they this
+to up was we were will with would you your please tell help know want need way ways get
+na ya wa la za kwa ni katika kwenye je kama au lakini pia hii hiyo huu huo
+ili kuna nina mimi wewe sisi yeye wao hapa pale tafadhali naomba nataka ninaweza naweza unaweza
+sana tu bado kisha
+""".split())
+
+SUFFIXES = ("ments", "ment", "ings", "ing", "ions", "ion", "ies", "ed", "es", "s")
+
+SHINGLE_SIZE = 4
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+# Candidates sharing the most bands that are compared exactly, per lookup
+MAX_CANDIDATES = 8
+
+# Universal hashing (a * x + b) mod p over 32-bit shingle hashes; p is the first prime above 2**32
+_PRIME = np.uint64(4294967311)
+_rng = np.random.RandomState(2024)
+_A = _rng.randint(1, 2 ** 32, size=NUM_PERM, dtype=np.uint64)
+_B = _rng.randint(0, 2 ** 32, size=NUM_PERM, dtype=np.uint64)
+
+
+def normalize_question(question):
+    """
+    Casefolds, strips punctuation and stopwords, and drops a plural -s:
+    "How do I control Fall Armyworms in maize?" becomes "how control fall armyworm maize".
+    """
+    text = unicodedata.normalize("NFKC", str(question)).casefold()
+    text = re.sub(r"[^\w\s]|_", " ", text)
+    words = []
+    for word in text.split():
+        if word in STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        words.append(word)
+    return " ".join(words)
+
+
+def stem(word):
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 4:
+            return word[:-len(suffix)]
+    return word
+
+
+def content_tokens(normalized):
+    """The stemmed words of a normalized question; near duplicates must have the same set."""
+    return frozenset(stem(word) for word in normalized.split())
+
+
+def shingles(normalized):
+    """Character shingles of a normalized question, so typos and inflections still overlap."""
+    padded = f" {normalized} "
+    if len(padded) <= SHINGLE_SIZE:
+        return {padded}
+    return {padded[i:i + SHINGLE_SIZE] for i in range(len(padded) - SHINGLE_SIZE + 1)}
+
+
+def minhash(shingle_set):
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingle_set), dtype=np.uint64, count=len(shingle_set))
+    return ((hashes[:, None] * _A + _B) % _PRIME).min(axis=0)
+
+
+def band_keys(signature):
+    return [(band, signature[band * ROWS:(band + 1) * ROWS].tobytes()) for band in range(BANDS)]
+
+
+class AnswerCache:
+    def __init__(self, maxsize=5000, ttl=None, threshold=0.75):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # normalized question -> (answer, shingles, band keys, expires, tokens)
+        self._buckets = defaultdict(set)  # band key -> normalized questions
+        self._exact_hits = 0
+        self._similar_hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, question):
+        """Returns the cached answer for `question` or a close rephrasing of it, or None."""
+        if self.maxsize <= 0:
+            return None
+        normalized = normalize_question(question)
+        if not normalized:
+            return None
+
+        with self._lock:
+            entry = self._live(normalized)
+            if entry is not None:
+                self._exact_hits += 1
+                self._entries.move_to_end(normalized)
+                return entry[0]
+            if self.threshold >= 1 or not self._entries:
+                self._misses += 1
+                return None
+
+        query = shingles(normalized)
+        tokens = content_tokens(normalized)
+        keys = band_keys(minhash(query))
+
+        with self._lock:
+            collisions = Counter()
+            for key in keys:
+                collisions.update(self._buckets.get(key, ()))
+            best, best_similarity = None, self.threshold
+            for candidate, _ in collisions.most_common(MAX_CANDIDATES):
+                entry = self._live(candidate)
+                # Similar spelling is not enough: "beans" for "maize" or "acre" for "hectare" changes the answer
+                if entry is None or entry[4] != tokens:
+                    continue
+                stored = entry[1]
+                similarity = len(query & stored) / len(query | stored)
+                if similarity >= best_similarity:
+                    best, best_similarity = candidate, similarity
+            if best is None:
+                self._misses += 1
+                return None
+            self._similar_hits += 1
+            self._entries.move_to_end(best)
+            return self._entries[best][0]
+
+    def set(self, question, answer):
+        if self.maxsize <= 0:
+            return
+        normalized = normalize_question(question)
+        if not normalized:
+            return
+        query = shingles(normalized)
+        keys = band_keys(minhash(query))
+        expires = time.time() + self.ttl if self.ttl else None
+
+        with self._lock:
+            self._remove(normalized)
+            self._entries[normalized] = (answer, query, keys, expires, content_tokens(normalized))
+            for key in keys:
+                self._buckets[key].add(normalized)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+                self._evictions += 1
+
+    def _live(self, normalized):
+        entry = self._entries.get(normalized)
+        if entry is not None and entry[3] is not None and entry[3] <= time.time():
+            self._remove(normalized)
+            return None
+        return entry
+
+    def _remove(self, normalized):
+        entry = self._entries.pop(normalized, None)
+        if entry is None:
+            return
+        for key in entry[2]:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(normalized)
+                if not bucket:
+                    del self._buckets[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def stats(self):
+        with self._lock:
+            hits = self._exact_hits + self._similar_hits
+            lookups = hits + self._misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "threshold": self.threshold,
+                "exact_hits": self._exact_hits,
+                "similar_hits": self._similar_hits,
+                "misses": self._misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "evictions": self._evictions,
+            }
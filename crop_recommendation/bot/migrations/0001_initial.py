@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RateLimitBucket',
+            fields=[
+                ('name', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('requests', models.FloatField()),
+                ('tokens', models.FloatField()),
+                ('updated_at', models.FloatField()),
+                ('blocked_until', models.FloatField(default=0)),
+                ('version', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -1,3 +1,17 @@
 from django.db import models
 
-# Create your models here.
+
+class RateLimitBucket(models.Model):
+    """
+    Token-bucket state for an outbound API, shared by every worker (see bot/scheduler.py).
+    Updated with a conditional UPDATE on `version`, so concurrent takes never double-spend.
+    """
+    name = models.CharField(max_length=64, primary_key=True)
+    requests = models.FloatField()  # request slots left
+    tokens = models.FloatField()  # LLM tokens left
+    updated_at = models.FloatField()  # Unix time the counts were computed for
+    blocked_until = models.FloatField(default=0)  # Unix time; set by 429s and exhausted quotas
+    version = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}: {self.requests:.1f} requests, {self.tokens:.0f} tokens"
@@ -0,0 +1,286 @@
+"""
+Local retrieval over the project's own agronomy knowledge, for agro_bot.
+
+Passages come from the disease guide (disease_info.json), the crop table
+(extracted_crops_2.csv), the Swahili crop explanations and the education
+articles. They are kept in an in-memory BM25 inverted index. Articles are
+re-indexed one by one: instantly in this process through the Content signals
+(bot/signals.py), and in other processes by comparing fingerprints every
+BOT_RETRIEVAL_REFRESH_INTERVAL seconds.
+
+ground() decides what to do with a question: answer it from the top passage
+when the question names that passage's subject, most of the question's
+weight matches it and it clearly beats the runner-up; otherwise hand back the
+top-k passages to send to the LLM as short context.
+"""
+
+import csv
+import json
+import math
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from collections import Counter, defaultdict, namedtuple
+from django.conf import settings
+from django.utils.html import strip_tags
+from .cache import STOPWORDS, stem
+
+# Question words say what kind of answer is wanted, not what it is about
+QUESTION_WORDS = frozenset("how what when where which who whom why whose nini gani vipi jinsi namna lini wapi nani".split())
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# Words per article passage
+ARTICLE_PASSAGE_WORDS = 150
+
+# A local answer's passage must outscore the runner-up by this factor
+ANSWER_MARGIN = 1.25
+
+Passage = namedtuple("Passage", ["id", "title", "text", "source"])
+
+
+def tokenize(text):
+    text = unicodedata.normalize("NFKC", str(text)).casefold()
+    return [
+        stem(word) for word in re.findall(r"[^\W_]+", text)
+        if word not in STOPWORDS and word not in QUESTION_WORDS and len(word) > 1
+    ]
+
+
+class BM25Index:
+    """Inverted index with Okapi BM25 scoring; documents can be added and removed at any time."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings = defaultdict(dict)  # term -> {doc id: term frequency}
+        self._lengths = {}
+        self._passages = {}
+        self._total_length = 0
+
+    def add(self, passage):
+        # The title counts twice: it names what the passage is about
+        terms = Counter(tokenize(passage.title) * 2 + tokenize(passage.text))
+        with self._lock:
+            self._remove(passage.id)
+            for term, frequency in terms.items():
+                self._postings[term][passage.id] = frequency
+            length = sum(terms.values())
+            self._lengths[passage.id] = length
+            self._total_length += length
+            self._passages[passage.id] = passage
+
+    def remove(self, passage_id):
+        with self._lock:
+            self._remove(passage_id)
+
+    def _remove(self, passage_id):
+        passage = self._passages.pop(passage_id, None)
+        if passage is None:
+            return
+        self._total_length -= self._lengths.pop(passage_id)
+        for term in set(tokenize(passage.title) + tokenize(passage.text)):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(passage_id, None)
+                if not postings:
+                    del self._postings[term]
+
+    def search(self, query, k=3):
+        """Returns up to k (score, coverage, passage) tuples, best first. Coverage is the
+        share of the query's IDF weight found in the passage."""
+        terms = set(tokenize(query))
+        with self._lock:
+            count = len(self._passages)
+            if not terms or not count:
+                return []
+            average_length = self._total_length / count
+            scores = defaultdict(float)
+            matched = defaultdict(float)
+            total_weight = 0.0
+            for term in terms:
+                postings = self._postings.get(term, {})
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                total_weight += idf
+                for passage_id, frequency in postings.items():
+                    norm = K1 * (1 - B + B * self._lengths[passage_id] / average_length)
+                    scores[passage_id] += idf * frequency * (K1 + 1) / (frequency + norm)
+                    matched[passage_id] += idf
+            best = sorted(scores, key=scores.get, reverse=True)[:k]
+            return [(scores[i], matched[i] / total_weight, self._passages[i]) for i in best]
+
+    def __len__(self):
+        return len(self._passages)
+
+
+def _listed(label, items):
+    return f"{label}: {'; '.join(items)}." if items else ""
+
+
+def disease_passages(path):
+    with open(path, "r", encoding="utf-8") as f:
+        info = json.load(f)
+    for group, entries in info.items():
+        if group == "healthy_plants":
+            # The same generic maintenance list for every plant
+            continue
+        for name, details in entries.items():
+            text = " ".join(part for part in (
+                details.get("description", ""),
+                _listed("Treatment", details.get("treatment")),
+                _listed("Prevention", details.get("prevention")),
+            ) if part)
+            yield Passage(f"disease:{name}", name, text, "disease_info")
+
+
+def crop_passages(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            name = row["label"].strip()
+            text = (
+                f"{row['description'].strip()} {row['category']} ({row['food_type']}). "
+                f"Planting season: {row['planting_season']}. Harvesting season: {row['harvesting_season']}. "
+                f"Soil pH around {float(row['ph']):.1f}."
+            )
+            yield Passage(f"crop:{name}", name, text, "crops")
+
+
+def explanation_passages(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for name, text in json.load(f).items():
+            yield Passage(f"explanation:{name}", name, text, "crop_explanations")
+
+
+def article_passages(pk, title, body):
+    """Splits an article into passages of about ARTICLE_PASSAGE_WORDS words."""
+    words = strip_tags(body).split()
+    for number, start in enumerate(range(0, max(len(words), 1), ARTICLE_PASSAGE_WORDS)):
+        yield Passage(f"content:{pk}:{number}", title, " ".join(words[start:start + ARTICLE_PASSAGE_WORDS]), "education")
+
+
+def _fingerprint(title, body):
+    return zlib.crc32(f"{title}\0{body}".encode("utf-8"))
+
+
+class KnowledgeIndex:
+    """The BM25 index over all sources, built on first use."""
+
+    def __init__(self, refresh_interval=60):
+        self.refresh_interval = refresh_interval
+        self.index = BM25Index()
+        # Also held by the Content signal handlers, so article updates never interleave
+        self._lock = threading.Lock()
+        self._built = False
+        self._articles = {}  # Content pk -> (fingerprint, passage ids)
+        self._checked_at = 0.0
+
+    def ensure_built(self):
+        if self._built and (not self.refresh_interval or time.monotonic() - self._checked_at < self.refresh_interval):
+            return
+        with self._lock:
+            if not self._built:
+                for path, reader in (
+                    (settings.BASE_DIR / "disease_detection" / "ml_models" / "disease_info.json", disease_passages),
+                    (settings.BASE_DIR / "crop_predictor" / "data" / "extracted_crops_2.csv", crop_passages),
+                    (settings.BASE_DIR / "crop_predictor" / "crop_explanations.json", explanation_passages),
+                ):
+                    try:
+                        for passage in reader(path):
+                            self.index.add(passage)
+                    except Exception as e:
+                        print(f"Error indexing {path}: {e}")
+                self._built = True
+                self.sync_articles()
+            elif time.monotonic() - self._checked_at >= self.refresh_interval:
+                self.sync_articles()
+
+    def sync_articles(self):
+        """Re-indexes articles added, edited or deleted since the last sync (also by other processes)."""
+        from education.models import Content
+
+        self._checked_at = time.monotonic()
+        try:
+            rows = list(Content.objects.filter(type=Content.ARTICLE).values_list("pk", "title", "url_or_text"))
+        except Exception as e:
+            print(f"Error loading education articles: {e}")
+            return
+        current = set()
+        for pk, title, body in rows:
+            current.add(pk)
+            known = self._articles.get(pk)
+            if known is None or known[0] != _fingerprint(title, body):
+                self.update_article(pk, title, body)
+        for pk in set(self._articles) - current:
+            self.remove_article(pk)
+
+    def update_article(self, pk, title, body):
+        self.remove_article(pk)
+        passages = list(article_passages(pk, title, body))
+        for passage in passages:
+            self.index.add(passage)
+        self._articles[pk] = (_fingerprint(title, body), [passage.id for passage in passages])
+
+    def remove_article(self, pk):
+        _, passage_ids = self._articles.pop(pk, (None, []))
+        for passage_id in passage_ids:
+            self.index.remove(passage_id)
+
+    def content_saved(self, content):
+        with self._lock:
+            if not self._built:
+                return
+            if content.type == content.ARTICLE:
+                self.update_article(content.pk, content.title, content.url_or_text)
+            else:
+                self.remove_article(content.pk)
+
+    def content_deleted(self, content):
+        with self._lock:
+            if self._built:
+                self.remove_article(content.pk)
+
+    def search(self, question, k=3):
+        self.ensure_built()
+        return self.index.search(question, k)
+
+
+knowledge = KnowledgeIndex(refresh_interval=settings.BOT_RETRIEVAL_REFRESH_INTERVAL)
+
+
+def ground(question):
+    """
+    Returns (answer, passages). `answer` is the text of the top passage when it
+    answers the question with high confidence, otherwise None; `passages` are
+    the top-k passages worth sending along as context.
+    """
+    results = knowledge.search(question, max(settings.BOT_RETRIEVAL_TOP_K, 2))
+    results = [result for result in results if result[0] >= settings.BOT_RETRIEVAL_MIN_SCORE]
+    if not results:
+        return None, []
+
+    score, coverage, top = results[0]
+    names_subject = set(tokenize(top.title)) <= set(tokenize(question))
+    clear_winner = len(results) == 1 or score >= ANSWER_MARGIN * results[1][0]
+    if (settings.BOT_RETRIEVAL_LOCAL_ANSWERS and names_subject and clear_winner
+            and coverage >= settings.BOT_RETRIEVAL_ANSWER_COVERAGE):
+        return f"{top.title}: {top.text}", [top]
+    return None, [passage for _, _, passage in results[:settings.BOT_RETRIEVAL_TOP_K]]
+
+
+def build_context(passages, max_chars=None):
+    """Numbered passages, cut to max_chars in total (default BOT_RETRIEVAL_CONTEXT_CHARS)."""
+    budget = settings.BOT_RETRIEVAL_CONTEXT_CHARS if max_chars is None else max_chars
+    lines = []
+    for number, passage in enumerate(passages, 1):
+        line = f"[{number}] {passage.title}: {passage.text}"
+        if len(line) > budget:
+            # Not worth sending a passage cut down to a few words
+            if budget < 80:
+                break
+            line = line[:budget - 3].rsplit(" ", 1)[0] + "..."
+        lines.append(line)
+        budget -= len(line) + 1
+    return "\n".join(lines)
@@ -0,0 +1,375 @@
+"""
+Rate-limit-aware scheduling of Groq API calls.
+
+Every worker draws from one token bucket stored in the RateLimitBucket table:
+a request slot plus an estimate of the LLM tokens the call will use, both
+refilled at the configured per-minute quota. The provider's
+x-ratelimit-remaining-* / x-ratelimit-reset-* headers correct the shared
+counts after each response, and a 429 (or an exhausted quota) blocks the
+bucket for every worker until Retry-After / the reset time. A 429 that
+outlasts the retries raises SchedulerThrottledError, and retry_after() tells
+clients how long the bucket needs.
+
+Inside a process, callers wait in a bounded priority queue. One dispatcher
+thread admits the best waiting request whenever the bucket allows it, and
+fails requests whose deadline passes first, so farmers get a quick "busy"
+instead of a burst of 429s. Retries go to the front of the queue.
+"""
+
+import asyncio
+import contextlib
+import heapq
+import itertools
+import math
+import os
+import re
+import threading
+import time
+from concurrent.futures import Future
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F
+from crop_recommendation import http_clients
+
+# Priorities, lowest served first
+RETRY = 0
+INTERACTIVE = 1
+BACKGROUND = 2
+
+# Longest the dispatcher sleeps before looking at the queue again
+MAX_SLEEP = 1.0
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+class SchedulerBusyError(RuntimeError):
+    """Raised when more requests are waiting than the queue allows."""
+
+
+class SchedulerTimeoutError(RuntimeError):
+    """Raised when a request could not be sent before its deadline."""
+
+
+class SchedulerThrottledError(RuntimeError):
+    """Raised when the provider still answers 429 after the retries."""
+
+
+def parse_duration(value):
+    """Seconds in a rate-limit reset value: "7.66s", "2m59.56s", "120ms" or plain seconds."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+
+def _header_float(headers, name):
+    try:
+        return float(headers[name])
+    except (KeyError, ValueError):
+        return None
+
+
+def estimate_tokens(payload):
+    """Rough LLM token cost of a chat completion: about 4 characters per prompt token, plus max_tokens."""
+    prompt = sum(len(message.get("content", "")) for message in payload.get("messages", []))
+    return prompt // 4 + payload.get("max_tokens", 0)
+
+
+class RateLimitScheduler:
+    def __init__(self, name, requests_per_minute, tokens_per_minute, max_queue=100, max_wait=20):
+        self.name = name
+        self.request_rate = requests_per_minute / 60
+        self.token_rate = tokens_per_minute / 60
+        self.request_capacity = max(1, requests_per_minute)
+        self.token_capacity = max(1, tokens_per_minute)
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+
+        self._cond = threading.Condition()
+        self._heap = []
+        self._sequence = itertools.count()
+        self._worker = None
+        self._pid = None
+
+        self._admitted = 0
+        self._rejected = 0
+        self._timed_out = 0
+        self._throttled = 0
+        self._wait_seconds = 0.0
+        self._last_limits = {}
+
+    # Shared bucket
+
+    def _bucket(self, now):
+        from .models import RateLimitBucket
+
+        bucket, _ = RateLimitBucket.objects.get_or_create(name=self.name, defaults={
+            "requests": self.request_capacity, "tokens": self.token_capacity, "updated_at": now,
+        })
+        elapsed = max(0.0, now - bucket.updated_at)
+        bucket.requests = min(self.request_capacity, bucket.requests + elapsed * self.request_rate)
+        bucket.tokens = min(self.token_capacity, bucket.tokens + elapsed * self.token_rate)
+        return bucket
+
+    def _save(self, bucket, now):
+        from .models import RateLimitBucket
+
+        return RateLimitBucket.objects.filter(name=self.name, version=bucket.version).update(
+            requests=bucket.requests, tokens=bucket.tokens, updated_at=now,
+            blocked_until=bucket.blocked_until, version=F("version") + 1,
+        )
+
+    def _update(self, change):
+        """Applies change(bucket, now) to the shared bucket, retrying when another worker got there first."""
+        for _ in range(10):
+            now = time.time()
+            bucket = self._bucket(now)
+            result = change(bucket, now)
+            if self._save(bucket, now):
+                return result
+        return None
+
+    def _wait(self, bucket, cost, now):
+        """Seconds until the bucket has one request and `cost` tokens to give, 0 if it has them now."""
+        if bucket.blocked_until > now:
+            return bucket.blocked_until - now
+        if bucket.requests < 1 or bucket.tokens < cost:
+            return max(
+                (1 - bucket.requests) / self.request_rate if self.request_rate else MAX_SLEEP,
+                (cost - bucket.tokens) / self.token_rate if self.token_rate else MAX_SLEEP,
+                0.01,
+            )
+        return 0
+
+    def take(self, cost):
+        """
+        Takes one request and `cost` LLM tokens from the shared bucket. Returns 0 when
+        taken, otherwise the seconds until there will be enough.
+        """
+        cost = min(cost, self.token_capacity)
+        for _ in range(10):
+            now = time.time()
+            try:
+                bucket = self._bucket(now)
+                wait = self._wait(bucket, cost, now)
+                if wait:
+                    return wait
+                bucket.requests -= 1
+                bucket.tokens -= cost
+                if self._save(bucket, now):
+                    return 0
+            except Exception as e:
+                # Without the table, calls go out unscheduled rather than not at all
+                print(f"Rate limit bucket {self.name} unavailable: {e}")
+                close_old_connections()
+                return 0
+        return 0.01
+
+    def retry_after(self, cost=1):
+        """Whole seconds (at least 1) a turned-away client should wait, for the Retry-After header."""
+        now = time.time()
+        try:
+            wait = self._wait(self._bucket(now), min(cost, self.token_capacity), now)
+        except Exception as e:
+            print(f"Rate limit bucket {self.name} unavailable: {e}")
+            close_old_connections()
+            wait = 0
+        return max(1, math.ceil(wait))
+
+    def observe(self, response):
+        """Corrects the shared bucket from the provider's rate-limit headers and 429s."""
+        headers = response.headers
+        remaining_requests = _header_float(headers, "x-ratelimit-remaining-requests")
+        remaining_tokens = _header_float(headers, "x-ratelimit-remaining-tokens")
+        reset_requests = parse_duration(headers.get("x-ratelimit-reset-requests"))
+        reset_tokens = parse_duration(headers.get("x-ratelimit-reset-tokens"))
+        retry_after = parse_duration(headers.get("retry-after"))
+
+        block = 0.0
+        if response.status_code == 429:
+            with self._cond:
+                self._throttled += 1
+            block = retry_after or max(reset_requests or 0, reset_tokens or 0) or 1.0
+        if remaining_requests is not None and remaining_requests < 1 and reset_requests:
+            block = max(block, reset_requests)
+        if remaining_tokens is not None and remaining_tokens < 1 and reset_tokens:
+            block = max(block, reset_tokens)
+
+        self._last_limits = {
+            key: headers[key] for key in headers if key.startswith("x-ratelimit-") or key == "retry-after"
+        }
+        if remaining_requests is None and remaining_tokens is None and not block:
+            return
+
+        def change(bucket, now):
+            # The provider's counts are authoritative, but ours may already include calls still in flight
+            if remaining_requests is not None:
+                bucket.requests = min(bucket.requests, remaining_requests)
+            if remaining_tokens is not None:
+                bucket.tokens = min(bucket.tokens, remaining_tokens)
+            if block:
+                bucket.blocked_until = max(bucket.blocked_until, now + block)
+
+        try:
+            self._update(change)
+        except Exception as e:
+            print(f"Rate limit bucket {self.name} unavailable: {e}")
+            close_old_connections()
+
+    # Local priority queue
+
+    def _ensure_worker(self):
+        # Started on first use, and again in a forked child, which does not inherit threads
+        if self._worker is None or self._pid != os.getpid() or not self._worker.is_alive():
+            with self._cond:
+                if self._worker is None or self._pid != os.getpid() or not self._worker.is_alive():
+                    if self._pid != os.getpid():
+                        self._heap = []
+                    self._pid = os.getpid()
+                    self._worker = threading.Thread(target=self._run, name=f"{self.name}-scheduler", daemon=True)
+                    self._worker.start()
+
+    def submit(self, cost, priority=INTERACTIVE, deadline=None):
+        """Queues a request; the returned future resolves once it may be sent."""
+        self._ensure_worker()
+        if deadline is None:
+            deadline = time.monotonic() + self.max_wait
+        future = Future()
+        with self._cond:
+            if len(self._heap) >= self.max_queue:
+                self._rejected += 1
+                raise SchedulerBusyError("The assistant is busy, please try again shortly.")
+            heapq.heappush(self._heap, (priority, next(self._sequence), deadline, cost, future, time.monotonic()))
+            self._cond.notify()
+        return future
+
+    def acquire(self, cost, priority=INTERACTIVE, deadline=None):
+        self.submit(cost, priority, deadline).result()
+
+    async def aacquire(self, cost, priority=INTERACTIVE, deadline=None):
+        # Cancelling the awaiting task (client gone) also drops its place in the queue
+        await asyncio.wrap_future(self.submit(cost, priority, deadline))
+
+    def _expire(self, now):
+        expired = [entry for entry in self._heap if entry[2] <= now or entry[4].cancelled()]
+        if not expired:
+            return
+        self._heap = [entry for entry in self._heap if entry[2] > now and not entry[4].cancelled()]
+        heapq.heapify(self._heap)
+        for entry in expired:
+            if entry[4].set_running_or_notify_cancel():
+                self._timed_out += 1
+                entry[4].set_exception(SchedulerTimeoutError("The assistant is busy, please try again shortly."))
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    self._expire(time.monotonic())
+                    if self._heap:
+                        break
+                    self._cond.wait()
+                priority, sequence, deadline, cost, future, queued = self._heap[0]
+
+            wait = self.take(cost)
+            with self._cond:
+                if wait:
+                    # Deadlines are checked again on wake-up; a new, more urgent request also wakes us
+                    self._cond.wait(min(wait, MAX_SLEEP, max(0.0, deadline - time.monotonic())))
+                    continue
+                if self._heap and self._heap[0][4] is future:
+                    heapq.heappop(self._heap)
+                else:
+                    # Taken from the queue (expired or cancelled) while we asked the bucket
+                    self._heap = [entry for entry in self._heap if entry[4] is not future]
+                    heapq.heapify(self._heap)
+                if future.set_running_or_notify_cancel():
+                    self._admitted += 1
+                    self._wait_seconds += time.monotonic() - queued
+                    future.set_result(None)
+
+    # Scheduled calls
+
+    def _retry_delay(self, attempt, response=None):
+        # A 429 already blocks the shared bucket; other failures back off locally
+        if response is not None and response.status_code == 429:
+            return 0
+        return http_clients.backoff_delay(attempt, response)
+
+    def request(self, method, url, cost=1, priority=INTERACTIVE, retries=None, **kwargs):
+        """
+        http_clients.request() sent when the rate limits allow it. Raises
+        SchedulerBusyError / SchedulerTimeoutError when it cannot be sent before max_wait,
+        SchedulerThrottledError when the last attempt is still answered with a 429.
+        """
+        retries = settings.HTTP_RETRIES if retries is None else retries
+        deadline = time.monotonic() + self.max_wait
+        for attempt in range(retries + 1):
+            self.acquire(cost, priority, deadline)
+            try:
+                response = http_clients.request(method, url, retries=0, **kwargs)
+            except http_clients.RETRYABLE_EXCEPTIONS:
+                if attempt >= retries:
+                    raise
+                time.sleep(self._retry_delay(attempt))
+            else:
+                self.observe(response)
+                if response.status_code == 429 and attempt >= retries:
+                    raise SchedulerThrottledError("The assistant is busy, please try again shortly.")
+                if response.status_code not in http_clients.RETRYABLE_STATUS_CODES or attempt >= retries:
+                    return response
+                time.sleep(self._retry_delay(attempt, response))
+            priority = RETRY
+
+    @contextlib.asynccontextmanager
+    async def astream(self, method, url, cost=1, priority=INTERACTIVE, retries=None, **kwargs):
+        """http_clients.astream() sent when the rate limits allow it."""
+        retries = settings.HTTP_RETRIES if retries is None else retries
+        deadline = time.monotonic() + self.max_wait
+        for attempt in range(retries + 1):
+            await self.aacquire(cost, priority, deadline)
+            # Entered by hand: errors raised by the caller's block must not be taken for ours and retried
+            stack = contextlib.AsyncExitStack()
+            try:
+                response = await stack.enter_async_context(http_clients.astream(method, url, retries=0, **kwargs))
+            except http_clients.RETRYABLE_EXCEPTIONS:
+                if attempt >= retries:
+                    raise
+                delay = self._retry_delay(attempt)
+            else:
+                await sync_to_async(self.observe)(response)
+                if response.status_code == 429 and attempt >= retries:
+                    await stack.aclose()
+                    raise SchedulerThrottledError("The assistant is busy, please try again shortly.")
+                if response.status_code not in http_clients.RETRYABLE_STATUS_CODES or attempt >= retries:
+                    async with stack:
+                        yield response
+                    return
+                await stack.aclose()
+                delay = self._retry_delay(attempt, response)
+            await asyncio.sleep(delay)
+            priority = RETRY
+
+    def metrics(self):
+        with self._cond:
+            depth = len(self._heap)
+        return {
+            "queue_depth": depth,
+            "queue_capacity": self.max_queue,
+            "max_wait": self.max_wait,
+            "admitted": self._admitted,
+            "rejected": self._rejected,
+            "timed_out": self._timed_out,
+            "throttled": self._throttled,
+            "mean_queue_wait_ms": round(self._wait_seconds / self._admitted * 1000, 3) if self._admitted else 0,
+            "limits": self._last_limits,
+        }
@@ -0,0 +1,14 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from education.models import Content
+from .retrieval import knowledge
+
+
+@receiver(post_save, sender=Content)
+def index_saved_content(sender, instance, **kwargs):
+    knowledge.content_saved(instance)
+
+
+@receiver(post_delete, sender=Content)
+def unindex_deleted_content(sender, instance, **kwargs):
+    knowledge.content_deleted(instance)
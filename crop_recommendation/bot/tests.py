@@ -1,3 +1,373 @@
-from django.test import TestCase
+import json
+from unittest import mock
+import httpx
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from crop_recommendation import http_clients
+from education.models import Content
+from . import retrieval
+from .cache import AnswerCache, normalize_question
+from .retrieval import BM25Index, KnowledgeIndex, Passage, build_context, tokenize
+from .scheduler import RateLimitScheduler, SchedulerThrottledError, estimate_tokens, parse_duration
+
+
+class AnswerCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = AnswerCache(maxsize=100, ttl=None, threshold=0.75)
+
+    def test_normalizes_case_punctuation_and_stopwords(self):
+        self.assertEqual(normalize_question("How do I control Fall Armyworms in maize?"), "how control fall armyworm maize")
+        self.assertEqual(normalize_question("Jinsi ya kudhibiti viwavijeshi kwenye mahindi"), "jinsi kudhibiti viwavijeshi mahindi")
+
+    def test_rephrasings_hit(self):
+        self.cache.set("How do I control fall armyworm in maize?", "armyworm answer")
+        for question in (
+            "how to control fall armyworms on maize",
+            "Fall armyworms on maize - how to control them",
+            "HOW DO I CONTROL FALL ARMYWORM IN MAIZE",
+        ):
+            with self.subTest(question=question):
+                self.assertEqual(self.cache.get(question), "armyworm answer")
+
+    def test_different_crop_or_unit_misses(self):
+        cached = {
+            "What is the best time to plant maize in the northern highlands of Tanzania during the long rains season?": "maize",
+            "My tomato leaves are turning yellow with brown spots, what should I do?": "tomato",
+            "How much urea should I apply per acre of maize?": "per acre",
+            "How do I control fall armyworm in maize?": "armyworm",
+            "When should I plant maize?": "when",
+        }
+        for question, answer in cached.items():
+            self.cache.set(question, answer)
+        for question in (
+            "What is the best time to plant beans in the northern highlands of Tanzania during the long rains season?",
+            "My potato leaves are turning yellow with brown spots, what should I do?",
+            "How much urea should I apply per hectare of maize?",
+            "How do I control fall armyworm in sorghum?",
+            "How should I plant maize?",
+        ):
+            with self.subTest(question=question):
+                self.assertIsNone(self.cache.get(question))
+
+    def test_ttl_expiry(self):
+        cache = AnswerCache(maxsize=10, ttl=60)
+        with mock.patch("bot.cache.time.time", return_value=1000.0):
+            cache.set("When should I plant maize?", "November")
+        with mock.patch("bot.cache.time.time", return_value=1059.0):
+            self.assertEqual(cache.get("When should I plant maize?"), "November")
+        with mock.patch("bot.cache.time.time", return_value=1061.0):
+            self.assertIsNone(cache.get("When should I plant maize?"))
+        self.assertEqual(cache.stats()["size"], 0)
+
+    def test_lru_eviction_and_stats(self):
+        cache = AnswerCache(maxsize=2)
+        cache.set("When should I plant maize?", "maize")
+        cache.set("When should I plant beans?", "beans")
+        cache.get("When should I plant maize?")
+        cache.set("When should I plant cassava?", "cassava")
+        self.assertIsNone(cache.get("When should I plant beans?"))
+        self.assertEqual(cache.get("When should I plant maize?"), "maize")
+
+        stats = cache.stats()
+        self.assertEqual(stats["evictions"], 1)
+        self.assertEqual(stats["exact_hits"], 2)
+        self.assertEqual(stats["misses"], 1)
+        self.assertAlmostEqual(stats["hit_rate"], 2 / 3)
+
+    def test_disabled_cache(self):
+        cache = AnswerCache(maxsize=0)
+        cache.set("When should I plant maize?", "maize")
+        self.assertIsNone(cache.get("When should I plant maize?"))
+
+
+def _response(status, headers=None):
+    return httpx.Response(status, headers=headers, request=httpx.Request("POST", "https://api.example.test/"))
+
+
+class RateLimitSchedulerTests(TestCase):
+    def setUp(self):
+        # 2 requests and 600 tokens a minute, so one request refills every 30 seconds
+        self.scheduler = RateLimitScheduler("test", 2, 600)
+
+    def test_parse_duration(self):
+        self.assertEqual(parse_duration("7.66s"), 7.66)
+        self.assertAlmostEqual(parse_duration("2m59.56s"), 179.56)
+        self.assertEqual(parse_duration("120ms"), 0.12)
+        self.assertEqual(parse_duration("3"), 3.0)
+        self.assertIsNone(parse_duration("soon"))
+        self.assertIsNone(parse_duration(None))
+
+    def test_estimate_tokens(self):
+        payload = {"messages": [{"content": "x" * 400}, {"content": "y" * 40}], "max_tokens": 200}
+        self.assertEqual(estimate_tokens(payload), 310)
+
+    def test_take_until_the_bucket_is_empty(self):
+        self.assertEqual(self.scheduler.take(10), 0)
+        self.assertEqual(self.scheduler.take(10), 0)
+        self.assertAlmostEqual(self.scheduler.take(10), 30, delta=0.5)
+        self.assertEqual(self.scheduler.retry_after(10), 30)
+
+    def test_take_waits_for_tokens(self):
+        self.assertEqual(self.scheduler.take(500), 0)
+        # 400 more tokens than are left, at 10 tokens a second
+        self.assertAlmostEqual(self.scheduler.take(500), 40, delta=0.5)
+
+    def test_429_blocks_the_bucket_for_retry_after(self):
+        self.scheduler.observe(_response(429, {"retry-after": "7"}))
+        self.assertAlmostEqual(self.scheduler.take(1), 7, delta=0.5)
+        self.assertEqual(self.scheduler.retry_after(), 7)
+        self.assertEqual(self.scheduler.metrics()["throttled"], 1)
+
+    def test_remaining_headers_cap_the_bucket(self):
+        self.scheduler.observe(_response(200, {
+            "x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": "12s",
+        }))
+        self.assertAlmostEqual(self.scheduler.take(1), 12, delta=0.5)
+
+    def test_final_429_raises_throttled(self):
+        with mock.patch.object(self.scheduler, "acquire"), \
+                mock.patch.object(http_clients, "request", return_value=_response(429, {"retry-after": "3"})) as send:
+            with self.assertRaises(SchedulerThrottledError):
+                self.scheduler.request("POST", "https://api.example.test/", retries=1)
+        self.assertEqual(send.call_count, 2)
+
+
+class ThrottledHostBreakerTests(SimpleTestCase):
+    def send(self, status, host):
+        transport = httpx.MockTransport(lambda request: httpx.Response(status))
+        with mock.patch.object(http_clients, "get_client", return_value=httpx.Client(transport=transport)):
+            for _ in range(10):
+                http_clients.request("GET", f"https://{host}/", retries=0)
+        return http_clients.get_breaker(host).state
+
+    def test_429_does_not_open_the_breaker(self):
+        self.assertEqual(self.send(429, "throttled.example.test"), "closed")
+
+    def test_503_opens_the_breaker(self):
+        with self.assertRaises(http_clients.CircuitOpenError):
+            self.send(503, "down.example.test")
+
+
+class AgroBotThrottledTests(TestCase):
+    def test_final_429_is_a_503_with_retry_after(self):
+        from . import views
+
+        with mock.patch.object(views, "local_grounding", return_value=(None, "")), \
+                mock.patch.object(views.groq_scheduler, "acquire"), \
+                mock.patch.object(http_clients, "request", return_value=_response(429, {"retry-after": "12"})):
+            response = self.client.post("/api/bot/ask/", {"question": "How do I store onions for a long time?"})
+        self.assertEqual(response.status_code, 503)
+        self.assertIn(response["Retry-After"], {"11", "12"})
+
+
+class BotMetricsTests(TestCase):
+    def test_staff_only(self):
+        self.assertIn(self.client.get("/api/bot/metrics/").status_code, (401, 403))
+        user = get_user_model().objects.create_user(username="farmer", password="x")
+        self.client.force_login(user)
+        self.assertEqual(self.client.get("/api/bot/metrics/").status_code, 403)
+
+        user.is_staff = True
+        user.save()
+        response = self.client.get("/api/bot/metrics/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()), {"cache", "groq"})
+
+
+def _chunk(token):
+    return "data: " + json.dumps({"choices": [{"delta": {"content": token}}]}) + "\n\n"
+
+
+class StreamTokensTests(SimpleTestCase):
+    async def test_parses_deltas_until_done(self):
+        from .views import stream_tokens
+
+        body = (
+            ": keep-alive\n\n" + _chunk("Plant") + "data: {not json}\n\n"
+            + 'data: {"choices": [{"delta": {"role": "assistant"}}]}\n\n' + _chunk(" early")
+            + "data: [DONE]\n\n" + _chunk("ignored")
+        )
+        response = httpx.Response(200, content=body.encode())
+        self.assertEqual([token async for token in stream_tokens(response)], ["Plant", " early"])
+
+
+class AgroBotStreamTests(TestCase):
+    def setUp(self):
+        from . import views
+
+        self.upstream = mock.Mock(return_value=httpx.Response(
+            200, content=(_chunk("Plant") + _chunk(" in November") + "data: [DONE]\n\n").encode()
+        ))
+        client = httpx.AsyncClient(transport=httpx.MockTransport(self.upstream))
+        for patcher in (
+            mock.patch.object(views, "local_grounding", return_value=(None, "")),
+            mock.patch.object(views.groq_scheduler, "aacquire"),
+            mock.patch.object(http_clients, "get_async_client", return_value=client),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def ask(self, question, path="/api/bot/ask/stream/"):
+        response = await self.async_client.post(path, {"question": question}, content_type="application/json")
+        body = b"".join([chunk async for chunk in response.streaming_content]).decode()
+        return response, body
+
+    async def test_server_sent_events(self):
+        response, body = await self.ask("When should I plant sunflower in Dodoma?")
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        self.assertEqual(body, (
+            'data: {"token": "Plant"}\n\n'
+            'data: {"token": " in November"}\n\n'
+            'event: done\ndata: {"answer": "Plant in November"}\n\n'
+        ))
+
+    async def test_ndjson_and_cached_replay(self):
+        question = "When should I plant sesame in Lindi?"
+        response, body = await self.ask(question, "/api/bot/ask/stream/?format=ndjson")
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lines = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(lines[-1], {"done": True, "answer": "Plant in November"})
+
+        _, body = await self.ask(question, "/api/bot/ask/stream/?format=ndjson")
+        self.assertEqual([json.loads(line) for line in body.splitlines()], [
+            {"token": "Plant in November"}, {"done": True, "answer": "Plant in November"},
+        ])
+        self.assertEqual(self.upstream.call_count, 1)
+
+    async def test_upstream_error_keeps_its_status(self):
+        self.upstream.return_value = httpx.Response(400, json={"error": "bad model"})
+        response = await self.async_client.post(
+            "/api/bot/ask/stream/", {"question": "Which cassava variety resists mosaic?"}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("bad model", response.json()["details"])
+
+    async def test_missing_question(self):
+        response = await self.async_client.post("/api/bot/ask/stream/", {}, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+
+PASSAGES = [
+    Passage("disease:streak", "Maize streak virus", "Leafhoppers spread it. Treat by removing infected plants and planting resistant seed.", "disease_info"),
+    Passage("disease:rust", "Bean rust", "Orange pustules on bean leaves. Treat with a copper fungicide and rotate crops.", "disease_info"),
+    Passage("crop:maize", "Maize", "A cereal grown in the long rains. Planting season: March. Soil pH around 6.0.", "crops"),
+    Passage("crop:cassava", "Cassava", "A drought tolerant root crop. Planting season: October. Soil pH around 5.5.", "crops"),
+]
+
+
+class RetrievalTests(SimpleTestCase):
+    def setUp(self):
+        self.index = BM25Index()
+        for passage in PASSAGES:
+            self.index.add(passage)
+
+    def test_tokenize_drops_question_and_stop_words(self):
+        self.assertEqual(tokenize("How do I treat Maize Streak in the fields?"), ["treat", "maize", "streak", "field"])
+        self.assertEqual(tokenize("Jinsi ya kupanda mihogo"), ["kupanda", "mihogo"])
+
+    def test_search_ranks_the_matching_passage_first(self):
+        (score, coverage, passage), *rest = self.index.search("bean rust fungicide")
+        self.assertEqual(passage.id, "disease:rust")
+        self.assertEqual(coverage, 1.0)
+        self.assertTrue(all(score > other for other, _, _ in rest))
+        self.assertEqual(self.index.search("the and of"), [])
+
+    def test_add_replaces_and_remove_forgets(self):
+        self.index.add(Passage("crop:cassava", "Cassava", "Grown from stem cuttings.", "crops"))
+        self.assertEqual(len(self.index), 4)
+        self.assertEqual(self.index.search("drought tolerant root"), [])
+        self.index.remove("disease:rust")
+        self.assertNotIn("disease:rust", [p.id for _, _, p in self.index.search("bean rust")])
+
+    def test_build_context_is_numbered_and_cut_to_budget(self):
+        context = build_context(PASSAGES[:2], max_chars=10_000)
+        self.assertTrue(context.startswith("[1] Maize streak virus: "))
+        self.assertIn("\n[2] Bean rust: ", context)
+
+        # The second passage is cut at a word; what is left after it is too little for a third
+        context = build_context(PASSAGES, max_chars=200)
+        self.assertLessEqual(len(context), 200)
+        self.assertTrue(context.endswith("fungicide and..."))
+        self.assertNotIn("[3]", context)
+
+    def test_article_passages_strip_tags_and_split(self):
+        body = "<p>" + " ".join(f"word{i}" for i in range(retrieval.ARTICLE_PASSAGE_WORDS + 5)) + "</p>"
+        passages = list(retrieval.article_passages(7, "Composting", body))
+        self.assertEqual([p.id for p in passages], ["content:7:0", "content:7:1"])
+        self.assertEqual(passages[1].text, " ".join(f"word{i}" for i in range(retrieval.ARTICLE_PASSAGE_WORDS, retrieval.ARTICLE_PASSAGE_WORDS + 5)))
+        self.assertNotIn("<p>", passages[0].text)
+
+
+def _knowledge(passages=PASSAGES):
+    knowledge = KnowledgeIndex(refresh_interval=0)
+    # Skips the data files and articles; only the given passages are indexed
+    knowledge._built = True
+    for passage in passages:
+        knowledge.index.add(passage)
+    return knowledge
+
+
+@override_settings(
+    BOT_RETRIEVAL_LOCAL_ANSWERS=True, BOT_RETRIEVAL_ANSWER_COVERAGE=0.8, BOT_RETRIEVAL_TOP_K=2, BOT_RETRIEVAL_MIN_SCORE=0.5
+)
+class GroundTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(retrieval, "knowledge", _knowledge())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_answers_a_question_naming_the_subject(self):
+        answer, passages = retrieval.ground("How do I treat maize streak virus?")
+        self.assertEqual(answer, f"Maize streak virus: {PASSAGES[0].text}")
+        self.assertEqual(passages, [PASSAGES[0]])
+
+    def test_partial_match_becomes_context(self):
+        answer, passages = retrieval.ground("When should I plant maize after the long rains in Mbeya?")
+        self.assertIsNone(answer)
+        self.assertEqual(passages[0].id, "crop:maize")
+        self.assertLessEqual(len(passages), 2)
+
+    def test_unrelated_question(self):
+        self.assertEqual(retrieval.ground("What is the price of a motorbike?"), (None, []))
+
+    def test_bot_answers_locally_without_calling_groq(self):
+        with mock.patch.object(http_clients, "request") as send:
+            response = self.client.post("/api/bot/ask/", {"question": "Maize streak virus - how to treat it?"})
+        self.assertEqual(response.json(), {"answer": f"Maize streak virus: {PASSAGES[0].text}", "source": "local"})
+        send.assert_not_called()
+
+    @override_settings(BOT_RETRIEVAL_LOCAL_ANSWERS=False)
+    def test_local_answers_can_be_turned_off(self):
+        answer, passages = retrieval.ground("How do I treat maize streak virus?")
+        self.assertIsNone(answer)
+        self.assertEqual(passages[0].id, "disease:streak")
+
+
+class ArticleIndexingTests(TestCase):
+    def test_articles_follow_content_changes(self):
+        knowledge = _knowledge([])
+        with mock.patch("bot.signals.knowledge", knowledge):
+            article = Content.objects.create(title="Drip irrigation", url_or_text="<p>Drip lines save water in dry seasons.</p>")
+            self.assertEqual(knowledge.search("drip irrigation water")[0][2].id, f"content:{article.pk}:0")
+
+            article.url_or_text = "Mulch keeps the soil moist."
+            article.save()
+            self.assertEqual(knowledge.search("save water dry seasons"), [])
+            self.assertTrue(knowledge.search("mulch soil moist"))
+
+            article.delete()
+            self.assertEqual(len(knowledge.index), 0)
+
+    def test_other_processes_catch_up_by_fingerprint(self):
+        article = Content.objects.create(title="Drip irrigation", url_or_text="Drip lines save water.")
+        knowledge = _knowledge([])
+        knowledge.sync_articles()
+        self.assertTrue(knowledge.search("drip lines"))
+        Content.objects.filter(pk=article.pk).update(url_or_text="Mulch keeps the soil moist.")
+        knowledge.sync_articles()
+        self.assertEqual(knowledge.search("drip lines save water")[0][2].title, "Drip irrigation")
+        self.assertTrue(knowledge.search("mulch moist"))
+        Content.objects.filter(pk=article.pk).delete()
+        knowledge.sync_articles()
+        self.assertEqual(len(knowledge.index), 0)
 
-# Create your tests here.
@@ -1,6 +1,8 @@
 from django.urls import path
-from .views import agro_bot
+from .views import agro_bot, agro_bot_stream, bot_metrics
 
 urlpatterns = [
     path('ask/', agro_bot, name='agro_bot'),
+    path('ask/stream/', agro_bot_stream, name='agro_bot_stream'),
+    path('metrics/', bot_metrics, name='bot_metrics'),
 ]
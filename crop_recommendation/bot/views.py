@@ -1,49 +1,246 @@
+import json
+import contextlib
 import httpx
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from crop_recommendation import http_clients
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAdminUser
 from rest_framework.response import Response
+from .cache import AnswerCache
+from .retrieval import build_context, ground
+from .scheduler import (
+    RateLimitScheduler, SchedulerBusyError, SchedulerThrottledError, SchedulerTimeoutError, estimate_tokens
+)
 
-@api_view(['POST'])
-@permission_classes([AllowAny])
-def agro_bot(request):
-    question = request.data.get('question')
-    if not question:
-        return Response({'error': 'Please provide a question'}, status=400)
+GROQ_URL = "https://api.groq.com/openai/v1/chat/completions"
+SYSTEM_PROMPT = "You are an expert agriculture assistant helping small-scale farmers in Africa. Answer clearly and concisely."
+
+# Turned away by the Groq rate limits: 503 with a Retry-After
+SCHEDULER_ERRORS = (SchedulerBusyError, SchedulerTimeoutError, SchedulerThrottledError)
+
+groq_scheduler = RateLimitScheduler(
+    "groq", settings.GROQ_REQUESTS_PER_MINUTE, settings.GROQ_TOKENS_PER_MINUTE,
+    max_queue=settings.GROQ_QUEUE_MAX, max_wait=settings.GROQ_QUEUE_MAX_WAIT,
+)
+
+answer_cache = AnswerCache(
+    maxsize=settings.BOT_CACHE_MAXSIZE, ttl=settings.BOT_CACHE_TTL, threshold=settings.BOT_CACHE_THRESHOLD
+)
 
-    api_key = settings.GROQ_API_KEY
-    if not api_key:
-        return Response({'error': 'API key not configured'}, status=500)
 
-    url = "https://api.groq.com/openai/v1/chat/completions"
-    headers = {
+def groq_headers(api_key):
+    return {
         "Authorization": f"Bearer {api_key}",
         "Content-Type": "application/json"
     }
+
+
+def build_payload(question, stream=False, context=""):
+    system_prompt = SYSTEM_PROMPT
+    if context:
+        system_prompt += f"\n\nReference notes (use them only if relevant):\n{context}"
     payload = {
         "model": "meta-llama/llama-4-scout-17b-16e-instruct",
         "messages": [
-            {"role": "system", "content": "You are an expert agriculture assistant helping small-scale farmers in Africa. Answer clearly and concisely."},
+            {"role": "system", "content": system_prompt},
             {"role": "user", "content": question}
         ],
         "max_tokens": 200,
         "temperature": 0.7
     }
+    if stream:
+        payload["stream"] = True
+    return payload
+
 
+def local_grounding(question):
+    """Returns (local answer or None, context for the LLM); retrieval problems never fail a question."""
     try:
-        with httpx.Client(timeout=15.0) as client:
-            response = client.post(url, headers=headers, json=payload)
-            response.raise_for_status()
-            data = response.json()
-            # OpenAI-compatible response format:
-            answer = data.get("choices", [{}])[0].get("message", {}).get("content", "")
+        answer, passages = ground(question)
+    except Exception as e:
+        print(f"Error searching the knowledge index: {e}")
+        return None, ""
+    return answer, build_context(passages)
 
-            if not answer:
-                return Response({'error': 'No answer received from Groq API'}, status=500)
 
-            return Response({'answer': answer})
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def agro_bot(request):
+    question = request.data.get('question')
+    if not question:
+        return Response({'error': 'Please provide a question'}, status=400)
 
+    api_key = settings.GROQ_API_KEY
+    if not api_key:
+        return Response({'error': 'API key not configured'}, status=500)
+
+    cached = answer_cache.get(question)
+    if cached is not None:
+        return Response({'answer': cached})
+
+    local_answer, context = local_grounding(question)
+    if local_answer:
+        return Response({'answer': local_answer, 'source': 'local'})
+
+    payload = build_payload(question, context=context)
+    try:
+        response = groq_scheduler.request(
+            "POST", GROQ_URL, cost=estimate_tokens(payload), headers=groq_headers(api_key), json=payload, timeout=15.0
+        )
+        response.raise_for_status()
+        data = response.json()
+        # OpenAI-compatible response format:
+        answer = data.get("choices", [{}])[0].get("message", {}).get("content", "")
+
+        if not answer:
+            return Response({'error': 'No answer received from Groq API'}, status=500)
+
+        answer_cache.set(question, answer)
+        return Response({'answer': answer})
+
+    except SCHEDULER_ERRORS as e:
+        retry_after = groq_scheduler.retry_after(estimate_tokens(payload))
+        return Response({'error': str(e)}, status=503, headers={'Retry-After': str(retry_after)})
+    except http_clients.CircuitOpenError as e:
+        return Response({'error': 'Groq API is temporarily unavailable', 'details': str(e)}, status=503)
     except httpx.HTTPStatusError as exc:
         return Response({'error': f'API returned status {exc.response.status_code}', 'details': exc.response.text}, status=exc.response.status_code)
     except Exception as e:
         return Response({'error': 'Failed to get answer from Groq API', 'details': str(e)}, status=500)
+
+
+async def stream_tokens(response):
+    """Yields the content deltas of an OpenAI-compatible `stream: true` response."""
+    async for line in response.aiter_lines():
+        if not line.startswith("data:"):
+            continue
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            break
+        try:
+            chunk = json.loads(data)
+        except json.JSONDecodeError:
+            continue
+        choices = chunk.get("choices") or [{}]
+        token = (choices[0].get("delta") or {}).get("content")
+        if token:
+            yield token
+
+
+def _sse(data, event=None):
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+def _ndjson(data):
+    return json.dumps(data) + "\n"
+
+
+async def _replay(chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+@csrf_exempt
+@require_POST
+async def agro_bot_stream(request):
+    """
+    POST {"question": ...}. Relays the answer token by token as it is generated:
+    Server-Sent Events by default ("data: {"token": ...}" events, then an
+    "event: done" with the full answer), or NDJSON lines with ?format=ndjson or
+    Accept: application/x-ndjson. Errors before the first token get the same
+    JSON bodies and statuses as /ask/.
+    """
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except json.JSONDecodeError:
+            data = None
+        question = data.get('question') if isinstance(data, dict) else None
+    else:
+        question = request.POST.get('question')
+    if not question:
+        return JsonResponse({'error': 'Please provide a question'}, status=400)
+
+    api_key = settings.GROQ_API_KEY
+    if not api_key:
+        return JsonResponse({'error': 'API key not configured'}, status=500)
+
+    ndjson = request.GET.get('format') == 'ndjson' or 'application/x-ndjson' in request.headers.get('Accept', '')
+
+    # Cached and local answers are complete already; they go out as one token
+    answer, context = answer_cache.get(question), ""
+    if answer is None:
+        answer, context = await sync_to_async(local_grounding)(question)
+    if answer is not None:
+        body = (
+            [_ndjson({'token': answer}), _ndjson({'done': True, 'answer': answer})] if ndjson
+            else [_sse({'token': answer}), _sse({'answer': answer}, event='done')]
+        )
+        return _event_stream(_replay(body), ndjson)
+
+    # Open the upstream stream here so its status can still become ours
+    stack = contextlib.AsyncExitStack()
+    payload = build_payload(question, stream=True, context=context)
+    try:
+        response = await stack.enter_async_context(groq_scheduler.astream(
+            "POST", GROQ_URL, cost=estimate_tokens(payload), headers=groq_headers(api_key), json=payload, timeout=15.0
+        ))
+        if response.is_error:
+            body = (await response.aread()).decode(errors='replace')
+            await stack.aclose()
+            return JsonResponse(
+                {'error': f'API returned status {response.status_code}', 'details': body}, status=response.status_code
+            )
+    except SCHEDULER_ERRORS as e:
+        await stack.aclose()
+        response = JsonResponse({'error': str(e)}, status=503)
+        response['Retry-After'] = str(await sync_to_async(groq_scheduler.retry_after)(estimate_tokens(payload)))
+        return response
+    except http_clients.CircuitOpenError as e:
+        await stack.aclose()
+        return JsonResponse({'error': 'Groq API is temporarily unavailable', 'details': str(e)}, status=503)
+    except Exception as e:
+        await stack.aclose()
+        return JsonResponse({'error': 'Failed to get answer from Groq API', 'details': str(e)}, status=500)
+
+    async def events():
+        parts = []
+        try:
+            async for token in stream_tokens(response):
+                parts.append(token)
+                yield _ndjson({'token': token}) if ndjson else _sse({'token': token})
+            answer = "".join(parts)
+            if not answer:
+                error = {'error': 'No answer received from Groq API'}
+                yield _ndjson(error) if ndjson else _sse(error, event='error')
+            else:
+                answer_cache.set(question, answer)
+                yield _ndjson({'done': True, 'answer': answer}) if ndjson else _sse({'answer': answer}, event='done')
+        except Exception as e:
+            error = {'error': 'Failed to get answer from Groq API', 'details': str(e)}
+            yield _ndjson(error) if ndjson else _sse(error, event='error')
+        finally:
+            # Also runs when the client disconnects, releasing the upstream connection
+            await stack.aclose()
+
+    return _event_stream(events(), ndjson)
+
+
+def _event_stream(events, ndjson):
+    streaming = StreamingHttpResponse(events, content_type='application/x-ndjson' if ndjson else 'text/event-stream')
+    streaming['Cache-Control'] = 'no-cache'
+    # Stops nginx from buffering the stream
+    streaming['X-Accel-Buffering'] = 'no'
+    return streaming
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def bot_metrics(request):
+    """Answer cache and Groq scheduler counters (with the last rate-limit headers) for this process."""
+    return Response({'cache': answer_cache.stats(), 'groq': groq_scheduler.metrics()})
@@ -0,0 +1,165 @@
+import json
+import math
+import os
+import re
+import threading
+import numpy as np
+from django.conf import settings
+
+REGIONS_PATH = os.path.join(os.path.dirname(__file__), "data", "data.json")
+
+# Suffixes that boundary datasets add to names ("Arusha Urban", "Kilosa District Council")
+NAME_SUFFIXES = {"region", "district", "council", "municipal", "municipality", "urban", "rural", "city", "town"}
+
+
+def normalize_name(name):
+    words = re.sub(r"[^a-z0-9]+", " ", str(name).casefold()).split()
+    while len(words) > 1 and words[-1] in NAME_SUFFIXES:
+        words.pop()
+    return "".join(words)
+
+
+def load_known_names(path=REGIONS_PATH):
+    """
+    Maps normalized names to the spelling used in data.json:
+    {"regions": {norm: Region}, "districts": {(norm region, norm district): District}}.
+    """
+    regions, districts = {}, {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for entry in json.load(f):
+                region = entry["region"]
+                regions[normalize_name(region)] = region
+                for district in entry.get("districts", []):
+                    districts[(normalize_name(region), normalize_name(district["district"]))] = district["district"]
+    except Exception as e:
+        print(f"Error loading region names: {e}")
+    return {"regions": regions, "districts": districts}
+
+
+class Ring:
+    """A closed polygon ring as edge arrays, tested with vectorized ray casting."""
+
+    def __init__(self, coords):
+        points = np.asarray(coords, dtype=np.float64)[:, :2]
+        self.x1, self.y1 = points[:, 0], points[:, 1]
+        self.x2, self.y2 = np.roll(self.x1, -1), np.roll(self.y1, -1)
+
+    def contains(self, x, y):
+        crosses = (self.y1 > y) != (self.y2 > y)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x_cross = self.x1 + (y - self.y1) * (self.x2 - self.x1) / (self.y2 - self.y1)
+        return np.count_nonzero(crosses & (x < x_cross)) % 2 == 1
+
+
+class Area:
+    """A (multi)polygon with its region and district names."""
+
+    def __init__(self, region, district, polygons):
+        # polygons: [[outer ring, hole, ...], ...] in GeoJSON (lon, lat) order
+        self.region = region
+        self.district = district
+        self.polygons = [[Ring(ring) for ring in polygon] for polygon in polygons]
+        coords = np.concatenate([np.asarray(polygon[0], dtype=np.float64)[:, :2] for polygon in polygons])
+        self.west, self.south = coords.min(axis=0)
+        self.east, self.north = coords.max(axis=0)
+
+    def contains(self, lon, lat):
+        if not (self.west <= lon <= self.east and self.south <= lat <= self.north):
+            return False
+        for outer, *holes in self.polygons:
+            if outer.contains(lon, lat) and not any(hole.contains(lon, lat) for hole in holes):
+                return True
+        return False
+
+
+class BoundaryIndex:
+    """
+    District boundaries behind a uniform grid index: each grid cell lists the
+    areas whose bounding box overlaps it, so a lookup tests only a handful of polygons.
+    """
+
+    def __init__(self, areas, cell_degrees=0.25):
+        self.areas = areas
+        self.cell_degrees = cell_degrees
+        self.grid = {}
+        for area in areas:
+            for row in range(self._cell(area.south), self._cell(area.north) + 1):
+                for col in range(self._cell(area.west), self._cell(area.east) + 1):
+                    self.grid.setdefault((row, col), []).append(area)
+
+    def _cell(self, value):
+        return math.floor(value / self.cell_degrees)
+
+    def lookup(self, lat, lon):
+        """Returns (region, district) containing the point, or (None, None)."""
+        lat, lon = float(lat), float(lon)
+        for area in self.grid.get((self._cell(lat), self._cell(lon)), ()):
+            if area.contains(lon, lat):
+                return area.region, area.district
+        return None, None
+
+    @classmethod
+    def from_geojson(cls, path, region_field="region", district_field="district", cell_degrees=0.25):
+        """
+        Builds the index from a FeatureCollection of district (Multi)Polygons.
+        Names are matched to the spelling in data.json where possible.
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            collection = json.load(f)
+
+        known = load_known_names()
+        areas = []
+        for feature in collection.get("features", []):
+            geometry = feature.get("geometry") or {}
+            properties = feature.get("properties") or {}
+            if geometry.get("type") == "Polygon":
+                polygons = [geometry["coordinates"]]
+            elif geometry.get("type") == "MultiPolygon":
+                polygons = geometry["coordinates"]
+            else:
+                continue
+
+            region = properties.get(region_field)
+            district = properties.get(district_field)
+            region_key = normalize_name(region) if region else None
+            district_key = normalize_name(district) if district else None
+            region_name = known["regions"].get(region_key, region)
+            district_name = known["districts"].get((region_key, district_key), district)
+            areas.append(Area(region_name, district_name, polygons))
+
+        return cls(areas, cell_degrees=cell_degrees)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_boundary_index():
+    """Loads REGION_BOUNDARIES_PATH once per process; None when the file is absent or invalid."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                path = settings.REGION_BOUNDARIES_PATH
+                if not path or not os.path.exists(path):
+                    _index = False
+                else:
+                    try:
+                        _index = BoundaryIndex.from_geojson(
+                            path,
+                            region_field=settings.REGION_BOUNDARIES_REGION_FIELD,
+                            district_field=settings.REGION_BOUNDARIES_DISTRICT_FIELD,
+                        )
+                    except Exception as e:
+                        print(f"Error loading region boundaries: {e}")
+                        _index = False
+    return _index or None
+
+
+def locate(lat, lon):
+    """Returns (region, district) from the local boundaries, or (None, None) if unknown."""
+    index = get_boundary_index()
+    if index is None:
+        return None, None
+    return index.lookup(lat, lon)
@@ -0,0 +1,329 @@
+import hashlib
+import math
+import re
+import threading
+import unicodedata
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+# Returned by cache lookups that found nothing (None is a valid cached value)
+MISSING = object()
+
+
+class LRUCache:
+    """
+    Thread-safe in-process LRU cache with a per-entry TTL and hit/miss counters.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=MISSING):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires is None or expires > time.time():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None, expires=None):
+        ttl = self.ttl if ttl is None else ttl
+        if expires is None and ttl is not None:
+            expires = time.time() + ttl
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def peek(self, key, default=MISSING):
+        """Like get() but without touching recency or the hit/miss counters."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and (entry[1] is None or entry[1] > time.time()):
+                return entry[0]
+            return default
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._data), "maxsize": self.maxsize}
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key within a process:
+    the first caller runs the function and the others wait for its result.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+def acquire_lease(name, seconds):
+    """
+    Takes a lease row shared by all workers; returns False while another worker holds it.
+    Expired leases are reclaimed, so a crashed holder blocks others for at most `seconds`.
+    """
+    from .models import CachedLookup
+
+    now = _now()
+    try:
+        CachedLookup.objects.filter(namespace="lease", key=name, expires_at__lte=now).delete()
+        with transaction.atomic():
+            CachedLookup.objects.create(namespace="lease", key=name, expires_at=now + timedelta(seconds=seconds))
+        return True
+    except IntegrityError:
+        return False
+    except Exception as e:
+        print(f"Could not take lease {name}: {e}")
+        return True
+
+
+def release_lease(name):
+    from .models import CachedLookup
+
+    try:
+        CachedLookup.objects.filter(namespace="lease", key=name).delete()
+    except Exception as e:
+        print(f"Could not release lease {name}: {e}")
+
+
+class TwoTierCache:
+    """
+    An LRUCache in front of the CachedLookup table.
+
+    The in-process tier answers repeat lookups without a query; the table is
+    shared by all workers and survives restarts. Values stored as None are
+    negative entries and expire after `negative_ttl` instead of `ttl`.
+    """
+
+    def __init__(self, namespace, maxsize, ttl, negative_ttl=None):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+        self.memory = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.db_hits = 0
+        self.db_misses = 0
+        self._flight = SingleFlight()
+
+    def get(self, key):
+        return self.get_many([key]).get(key, MISSING)
+
+    def get_many(self, keys, record_stats=True):
+        """Returns a dict with an entry for every key found in either tier."""
+        found = {}
+        pending = []
+        for key in keys:
+            value = self.memory.get(key) if record_stats else self.memory.peek(key)
+            if value is MISSING:
+                pending.append(key)
+            else:
+                found[key] = value
+
+        if pending:
+            from .models import CachedLookup
+
+            try:
+                rows = CachedLookup.objects.filter(
+                    namespace=self.namespace, key__in=pending, expires_at__gt=_now()
+                ).values_list("key", "value", "expires_at")
+                for key, value, expires_at in rows:
+                    found[key] = value
+                    self.memory.set(key, value, expires=expires_at.timestamp())
+            except Exception as e:
+                print(f"Cache lookup failed for {self.namespace}: {e}")
+
+            if record_stats:
+                hits = sum(1 for key in pending if key in found)
+                self.db_hits += hits
+                self.db_misses += len(pending) - hits
+
+        return found
+
+    def set(self, key, value):
+        self.set_many({key: value})
+
+    def get_or_fetch(self, key, fetch, lease_timeout=None, poll_interval=0.1):
+        """
+        Returns the cached value for `key`, calling `fetch()` on a miss.
+
+        Concurrent misses in this process share one call. With `lease_timeout`,
+        workers also coordinate through a lease row: one fetches while the others
+        poll the table for up to `lease_timeout` seconds before fetching themselves.
+        """
+        value = self.get(key)
+        if value is not MISSING:
+            return value
+        return self._flight.do(key, lambda: self._fetch_shared(key, fetch, lease_timeout, poll_interval))
+
+    def _fetch_shared(self, key, fetch, lease_timeout, poll_interval):
+        value = self.get_many([key], record_stats=False).get(key, MISSING)
+        if value is not MISSING:
+            return value
+
+        lease = f"{self.namespace}:{key}"
+        leased = False
+        if lease_timeout:
+            deadline = time.time() + lease_timeout
+            while not (leased := acquire_lease(lease, lease_timeout)):
+                if time.time() >= deadline:
+                    break
+                time.sleep(poll_interval)
+                value = self.get_many([key], record_stats=False).get(key, MISSING)
+                if value is not MISSING:
+                    return value
+
+        try:
+            value = fetch()
+            self.set(key, value)
+            return value
+        finally:
+            if leased:
+                release_lease(lease)
+
+    def set_many(self, mapping):
+        from .models import CachedLookup
+
+        now = _now()
+        objs = []
+        for key, value in mapping.items():
+            ttl = self.ttl if value is not None else self.negative_ttl
+            expires_at = now + timedelta(seconds=ttl)
+            self.memory.set(key, value, expires=expires_at.timestamp())
+            objs.append(CachedLookup(namespace=self.namespace, key=key, value=value, expires_at=expires_at))
+
+        try:
+            CachedLookup.objects.bulk_create(
+                objs,
+                update_conflicts=True,
+                unique_fields=["namespace", "key"],
+                update_fields=["value", "expires_at", "updated_at"],
+            )
+        except Exception as e:
+            print(f"Cache write failed for {self.namespace}: {e}")
+
+    def stats(self):
+        memory = self.memory.stats()
+        return {
+            "memory_hits": memory["hits"],
+            "db_hits": self.db_hits,
+            "misses": self.db_misses,
+            "size": memory["size"],
+            "maxsize": memory["maxsize"],
+        }
+
+
+def _now():
+    return datetime.now(dt_timezone.utc)
+
+
+def grid_cell(lat, lon, cell_degrees):
+    """Quantizes a coordinate to a fixed grid cell of `cell_degrees` on each side."""
+    row = math.floor(float(lat) / cell_degrees)
+    col = math.floor(float(lon) / cell_degrees)
+    return f"{cell_degrees:g}:{row}:{col}"
+
+
+# === Soil properties ===
+soil_cache = TwoTierCache(
+    "soil",
+    maxsize=settings.SOIL_CACHE_MAXSIZE,
+    ttl=settings.SOIL_CACHE_TTL,
+)
+
+
+def soil_cache_key(lat, lon, property, depth):
+    return f"{grid_cell(lat, lon, settings.SOIL_CACHE_CELL_DEGREES)}|{property}|{depth}"
+
+
+# === Geocoding ===
+geocode_cache = TwoTierCache(
+    "geocode",
+    maxsize=settings.GEOCODE_CACHE_MAXSIZE,
+    ttl=settings.GEOCODE_CACHE_TTL,
+    negative_ttl=settings.GEOCODE_NEGATIVE_TTL,
+)
+reverse_geocode_cache = TwoTierCache(
+    "reverse_geocode",
+    maxsize=settings.GEOCODE_CACHE_MAXSIZE,
+    ttl=settings.GEOCODE_CACHE_TTL,
+    negative_ttl=settings.GEOCODE_NEGATIVE_TTL,
+)
+
+
+def normalize_address(address):
+    """
+    Normalizes an address so spelling variants share a cache entry:
+    "  Dodoma ,TANZANIA." and "dodoma, tanzania" both become "dodoma, tanzania".
+    """
+    text = unicodedata.normalize("NFKC", str(address)).casefold()
+    text = re.sub(r"[^\w\s,]", " ", text)
+    parts = [" ".join(part.split()) for part in text.split(",")]
+    normalized = ", ".join(part for part in parts if part)
+    if len(normalized) > 200:
+        normalized = hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+    return normalized
+
+
+def reverse_geocode_cache_key(lat, lon):
+    return grid_cell(lat, lon, settings.REVERSE_GEOCODE_CELL_DEGREES)
+
+
+# === Weather ===
+weather_cache = TwoTierCache(
+    "weather",
+    maxsize=settings.WEATHER_CACHE_MAXSIZE,
+    ttl=settings.WEATHER_CACHE_TTL,
+    negative_ttl=settings.WEATHER_NEGATIVE_TTL,
+)
+
+
+def weather_cache_key(lat, lon):
+    return grid_cell(lat, lon, settings.WEATHER_CACHE_CELL_DEGREES)
@@ -0,0 +1,151 @@
+import csv
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from crop_predictor.soil_store import write_layer
+
+# Tanzania, the coverage area of crop_predictor/data/data.json (west, south, east, north)
+DEFAULT_BBOX = (29.3, -11.8, 40.5, -0.9)
+
+
+class Command(BaseCommand):
+    help = (
+        "Builds an offline soil tile for one property/depth from a GeoTIFF or CSV export. "
+        "Values must already be in the units returned by the iSDA API. "
+        "Running workers map a rebuilt tile within SOIL_TILE_CHECK_INTERVAL seconds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("property", help="iSDA property name, e.g. nitrogen_total")
+        parser.add_argument("depth", help='Depth as used by the iSDA API, e.g. "0-20" or "0"')
+        parser.add_argument("source", help="GeoTIFF (.tif/.tiff, needs rasterio) or CSV with lat,lon,value columns")
+        parser.add_argument(
+            "--bbox",
+            default=",".join(str(v) for v in DEFAULT_BBOX),
+            help="west,south,east,north to clip to (default: Tanzania)",
+        )
+        parser.add_argument("--scale", type=float, default=1.0, help="Multiplier applied to every value")
+        parser.add_argument("--value-column", default="value", help="CSV column holding the values")
+        parser.add_argument("--output", default=None, help="Tile directory (default: SOIL_TILE_DIR)")
+
+    def handle(self, *args, **options):
+        try:
+            bbox = tuple(float(v) for v in options["bbox"].split(","))
+            assert len(bbox) == 4
+        except (ValueError, AssertionError):
+            raise CommandError("--bbox must be west,south,east,north")
+
+        source = options["source"]
+        if source.lower().endswith((".tif", ".tiff")):
+            data, west, north, cell_width, cell_height = read_geotiff(source)
+        elif source.lower().endswith(".csv"):
+            data, west, north, cell_width, cell_height = read_csv_grid(source, options["value_column"])
+        else:
+            raise CommandError("Source must be a .tif/.tiff or .csv file")
+
+        data, west, north = clip(data, west, north, cell_width, cell_height, bbox)
+        data *= options["scale"]
+
+        meta = write_layer(
+            options["output"] or settings.SOIL_TILE_DIR,
+            options["property"],
+            options["depth"],
+            data,
+            west,
+            north,
+            cell_width,
+            cell_height,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {options['property']} {options['depth']}: {meta['rows']}x{meta['cols']} cells "
+            f"of {cell_width:g}x{cell_height:g} degrees"
+        ))
+
+
+def read_geotiff(path):
+    """Reads band 1 as float32 in EPSG:4326, reprojecting if needed. Nodata becomes NaN."""
+    try:
+        import rasterio
+        from rasterio.warp import Resampling, calculate_default_transform, reproject
+    except ImportError:
+        raise CommandError("Reading GeoTIFFs needs the 'rasterio' package (pip install rasterio)")
+
+    with rasterio.open(path) as src:
+        data = src.read(1, masked=True).astype(np.float32).filled(np.nan)
+        transform, crs = src.transform, src.crs
+
+        if crs is not None and crs.to_epsg() != 4326:
+            dst_transform, width, height = calculate_default_transform(
+                crs, "EPSG:4326", src.width, src.height, *src.bounds
+            )
+            reprojected = np.full((height, width), np.nan, dtype=np.float32)
+            reproject(
+                data,
+                reprojected,
+                src_transform=transform,
+                src_crs=crs,
+                src_nodata=np.nan,
+                dst_transform=dst_transform,
+                dst_crs="EPSG:4326",
+                dst_nodata=np.nan,
+                resampling=Resampling.nearest,
+            )
+            data, transform = reprojected, dst_transform
+
+    if transform.b != 0 or transform.d != 0:
+        raise CommandError("Rotated rasters are not supported")
+    return data, transform.c, transform.f, transform.a, -transform.e
+
+
+def read_csv_grid(path, value_column):
+    """Reads points on a regular grid into an array; grid spacing is inferred from the coordinates."""
+    lats, lons, values = [], [], []
+    with open(path, "r", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        missing = {"lat", "lon", value_column} - set(reader.fieldnames or [])
+        if missing:
+            raise CommandError(f"CSV is missing columns: {', '.join(sorted(missing))}")
+        for row in reader:
+            if row[value_column] in ("", None):
+                continue
+            lats.append(float(row["lat"]))
+            lons.append(float(row["lon"]))
+            values.append(float(row[value_column]))
+
+    if not values:
+        raise CommandError("CSV contains no values")
+
+    lats, lons, values = np.array(lats), np.array(lons), np.array(values, dtype=np.float32)
+    cell_width = _grid_step(lons)
+    cell_height = _grid_step(lats)
+
+    # CSV points are cell centres
+    west = lons.min() - cell_width / 2
+    north = lats.max() + cell_height / 2
+    cols = np.rint((lons - west) / cell_width - 0.5).astype(int)
+    rows = np.rint((north - lats) / cell_height - 0.5).astype(int)
+
+    data = np.full((rows.max() + 1, cols.max() + 1), np.nan, dtype=np.float32)
+    data[rows, cols] = values
+    return data, west, north, cell_width, cell_height
+
+
+def _grid_step(coords):
+    steps = np.diff(np.unique(np.round(coords, 8)))
+    if steps.size == 0:
+        raise CommandError("Need at least two distinct coordinates per axis to infer the grid")
+    return float(steps.min())
+
+
+def clip(data, west, north, cell_width, cell_height, bbox):
+    bbox_west, bbox_south, bbox_east, bbox_north = bbox
+    # Both ends are clamped to the raster: a negative end would slice from the far edge instead
+    col_start = min(data.shape[1], max(0, int(np.floor((bbox_west - west) / cell_width))))
+    col_end = min(data.shape[1], max(0, int(np.ceil((bbox_east - west) / cell_width))))
+    row_start = min(data.shape[0], max(0, int(np.floor((north - bbox_north) / cell_height))))
+    row_end = min(data.shape[0], max(0, int(np.ceil((north - bbox_south) / cell_height))))
+    if col_start >= col_end or row_start >= row_end:
+        raise CommandError("The source does not overlap the bounding box")
+
+    clipped = np.array(data[row_start:row_end, col_start:col_end], dtype=np.float32)
+    return clipped, west + col_start * cell_width, north - row_start * cell_height
@@ -0,0 +1,70 @@
+import time
+import warnings
+import joblib
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from crop_predictor.services import FEATURE_NAMES
+from crop_predictor.tree_engine import compile_ensemble
+
+
+class Command(BaseCommand):
+    help = (
+        "Compiles the crop model (LightGBM or scikit-learn forest) into NumPy arrays, "
+        "checks it against the native predict_proba and benchmarks both. "
+        "Serve the output by setting CROP_COMPILED_MODEL_PATH."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--model", default=None, help="Native model file (default: ML_MODELS['crop']['path'])")
+        parser.add_argument("--output", default=None, help="Output .npz (default: next to the model)")
+        parser.add_argument("--samples", type=int, default=2000, help="Random rows used for the check")
+        parser.add_argument("--tolerance", type=float, default=1e-6, help="Largest allowed probability difference")
+        parser.add_argument("--repeat", type=int, default=50, help="Timing repetitions")
+
+    def handle(self, *args, **options):
+        config = settings.ML_MODELS["crop"]
+        model_path = options["model"] or config["path"]
+        output = options["output"] or model_path.rsplit(".", 1)[0] + ".npz"
+
+        try:
+            model = joblib.load(model_path)
+        except Exception as e:
+            raise CommandError(f"Could not load {model_path}: {e}")
+        try:
+            compiled = compile_ensemble(model)
+        except TypeError as e:
+            raise CommandError(str(e))
+
+        # The model sees scaled features, so standard normal rows cover its input range
+        rng = np.random.default_rng(0)
+        X = rng.standard_normal((options["samples"], len(FEATURE_NAMES)))
+
+        with warnings.catch_warnings():
+            warnings.filterwarnings("ignore", message="X does not have valid feature names")
+            expected = np.asarray(model.predict_proba(X))
+            difference = float(np.abs(compiled.predict_proba(X) - expected).max())
+            if difference > options["tolerance"]:
+                raise CommandError(f"Compiled model differs from the native one by {difference:.3g}")
+            self.stdout.write(f"Max probability difference: {difference:.3g}")
+
+            for label, rows in (("1 row", X[:1]), (f"{len(X)} rows", X)):
+                native = _time(model.predict_proba, rows, options["repeat"])
+                fast = _time(compiled.predict_proba, rows, options["repeat"])
+                self.stdout.write(
+                    f"{label}: native {native * 1000:.3f} ms, compiled {fast * 1000:.3f} ms "
+                    f"({native / fast:.1f}x)"
+                )
+
+        compiled.save(output)
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {output}: {len(compiled.roots)} trees, {len(compiled.feature)} nodes"
+        ))
+
+
+def _time(func, X, repeat):
+    func(X)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(X)
+    return (time.perf_counter() - start) / repeat
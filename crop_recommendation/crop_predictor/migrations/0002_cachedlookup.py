@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crop_predictor', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CachedLookup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('namespace', models.CharField(max_length=32)),
+                ('key', models.CharField(max_length=255)),
+                ('value', models.JSONField(blank=True, null=True)),
+                ('expires_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'unique_together': {('namespace', 'key')},
+            },
+        ),
+    ]
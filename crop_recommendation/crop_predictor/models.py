@@ -28,3 +28,20 @@ class CropRecommendation(models.Model):
 
     def __str__(self):
         return f"Crop: {self.crop_name}"
+
+class CachedLookup(models.Model):
+    """
+    Result of an external lookup (soil, geocoding, weather) shared by every worker.
+    A null value records a failed lookup (negative caching).
+    """
+    namespace = models.CharField(max_length=32)
+    key = models.CharField(max_length=255)
+    value = models.JSONField(null=True, blank=True)
+    expires_at = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('namespace', 'key')
+
+    def __str__(self):
+        return f"{self.namespace}:{self.key}"
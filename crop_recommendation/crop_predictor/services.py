@@ -1,13 +1,13 @@
 import os
 import json
+import warnings
+from collections import namedtuple
 import numpy as np
-import pandas as pd
 import joblib
+from sklearn.preprocessing import StandardScaler
+from prediction_api import registry, sidecar
+from .tree_engine import CompiledEnsemble
 
-# Define model, scaler, and explanation paths
-BASE_MODEL_PATH = os.path.join("D:\\", 'agrosmart', 'crop_recommendation', 'crop_predictor', 'ml_models', 'crop')
-MODEL_PATH = os.path.join(BASE_MODEL_PATH, "crop_recomendation.joblib")
-SCALER_PATH = os.path.join(BASE_MODEL_PATH, "scaler.joblib")
 EXPLANATION_PATH = os.path.join(os.path.dirname(__file__), "crop_explanations.json")
 
 # Load crop explanations
@@ -18,19 +18,97 @@ except Exception as e:
     print(f"Error loading crop explanations: {e}")
     CROP_CONDITIONS = {}
 
-# Load the trained model
-try:
-    crop_model = joblib.load(MODEL_PATH)
-except Exception as e:
-    print(f"Error loading model: {e}")
-    crop_model = None
+FEATURE_NAMES = ["Nitrogen", "Phosphorus", "Potassium", "Temperature", "Humidity", "pH_Value", "Rainfall"]
+
+# The model and its scaler are loaded and swapped together
+CropModel = namedtuple("CropModel", ["model", "scaler"])
+
+
+def load_crop_model(config):
+    if config.get("compiled_path"):
+        # The compiled arrays only need NumPy, so the native model (and lightgbm) is never imported
+        model = CompiledEnsemble.load(config["compiled_path"])
+    else:
+        model = joblib.load(config["path"])
+    return CropModel(model, joblib.load(config["scaler_path"]))
+
+
+def crop_model_files(config):
+    return [config.get("compiled_path") or config.get("path"), config.get("scaler_path")]
+
+
+def warm_up_crop_model(crop_model):
+    predict_crop_batch(np.zeros((1, len(FEATURE_NAMES))), crop_model=crop_model)
+
+
+registry.register("crop", load_crop_model, warmup=warm_up_crop_model, files=crop_model_files)
+
+
+def scale_features(features, scaler):
+    """Scales an (n, 7) feature matrix with the fitted scaler, without building DataFrames."""
+    X = np.asarray(features, dtype=np.float64).reshape(-1, len(FEATURE_NAMES))
+    if isinstance(scaler, StandardScaler):
+        if scaler.mean_ is not None:
+            X = X - scaler.mean_
+        if scaler.scale_ is not None:
+            X = X / scaler.scale_
+        return X
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", message="X does not have valid feature names")
+        return scaler.transform(X)
+
+
+def predict_crop_batch(features: np.ndarray, k=2, crop_model=None):
+    """
+    Scores an (n, 7) matrix of (N, P, K, temperature, humidity, ph, rainfall)
+    rows with one scaler pass and one model call.
+    Returns (indices, scores): (n, k) arrays of indices into the model's classes_
+    and their probabilities, best first. Models without predict_proba give k=1
+    and a score of 1.0.
+    """
+    crop_model = crop_model or registry.get("crop")
+    if crop_model is None:
+        raise RuntimeError("Model not loaded properly.")
+    model, scaler = crop_model
+
+    X = scale_features(features, scaler)
+
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", message="X does not have valid feature names")
+        if not hasattr(model, "predict_proba"):
+            predicted = np.asarray(model.predict(X))
+            indices = np.searchsorted(model.classes_, predicted).reshape(-1, 1)
+            return indices, np.ones(indices.shape)
+        probabilities = np.asarray(model.predict_proba(X))
+
+    k = max(1, min(k, probabilities.shape[1]))
+    top = np.argpartition(-probabilities, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(probabilities, top, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind="stable")
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+
+def format_predictions(indices, scores, class_labels):
+    """Turns predict_crop_batch output into one {"recommended_crops": [...]} dict per row."""
+    return [
+        {
+            "recommended_crops": [
+                {"crop": str(class_labels[i]), "score": round(float(score), 4)}
+                for i, score in zip(row_indices, row_scores)
+            ]
+        }
+        for row_indices, row_scores in zip(indices, scores)
+    ]
+
+
+def _predict_with_labels(features):
+    """Returns (indices, scores, class_labels), from the inference sidecar when one is configured."""
+    if sidecar.enabled():
+        return sidecar.get_client().predict_crop(features)
+    crop_model = registry.get("crop")
+    indices, scores = predict_crop_batch(features, crop_model=crop_model)
+    return indices, scores, crop_model.model.classes_
 
-# Load the scaler
-try:
-    scaler = joblib.load(SCALER_PATH)
-except Exception as e:
-    print(f"Error loading scaler: {e}")
-    scaler = None
 
 def predict_crop_new(N, P, K, temperature, humidity, ph, rainfall):
     """
@@ -38,56 +116,26 @@ def predict_crop_new(N, P, K, temperature, humidity, ph, rainfall):
     Returns a dictionary of recommended crops with their scores.
     """
     try:
-        if crop_model is None:
-            raise Exception("Model not loaded properly.")
-        if scaler is None:
-            raise Exception("Scaler not loaded properly.")
-
-        # Prepare input data as a DataFrame with correct feature names
-        df = pd.DataFrame([{
-            "Nitrogen": N,
-            "Phosphorus": P,
-            "Potassium": K,
-            "Temperature": temperature,
-            "Humidity": humidity,
-            "pH_Value": ph,
-            "Rainfall": rainfall
-        }])
-
-        print(f"Model Input: {df.values.tolist()}")
-
-        # Apply scaler (pass DataFrame to scaler to retain feature names)
-        scaled_df = scaler.transform(df)
-
-        # Pass scaled data as DataFrame (optional but cleaner)
-        scaled_df = pd.DataFrame(scaled_df, columns=df.columns)
-
-        # Use model probabilities if available
-        if hasattr(crop_model, "predict_proba"):
-            probabilities = crop_model.predict_proba(scaled_df)[0]
-            class_labels = crop_model.classes_
-
-            # Pair crops with their probabilities and sort by score
-            crop_scores = sorted(zip(class_labels, probabilities), key=lambda x: x[1], reverse=True)
-            top_crops = crop_scores[:2]  # Get top 2
-
-            output = {
-                "recommended_crops": [
-                    {"crop": crop, "score": round(score, 4)}
-                    for crop, score in top_crops
-                ]
-            }
-        else:
-            # Fallback: predict only the best crop
-            crop_prediction = crop_model.predict(scaled_df)
-            output = {
-                "recommended_crops": [
-                    {"crop": str(crop_prediction[0]), "score": 1.0}
-                ]
-            }
-
+        features = np.array([[N, P, K, temperature, humidity, ph, rainfall]], dtype=np.float64)
+        print(f"Model Input: {features.tolist()}")
+        output = format_predictions(*_predict_with_labels(features))[0]
     except Exception as e:
         print(f"Error in predict_crop_new: {e}")
         output = {}
 
     return output
+
+
+def predict_crops(rows):
+    """
+    Predicts the top crops for many rows of
+    (N, P, K, temperature, humidity, ph, rainfall) with a single model call.
+    Returns one predict_crop_new-style dictionary per row.
+    """
+    if not rows:
+        return []
+    try:
+        return format_predictions(*_predict_with_labels(np.asarray(rows, dtype=np.float64)))
+    except Exception as e:
+        print(f"Error in predict_crops: {e}")
+        return [{} for _ in rows]
@@ -0,0 +1,182 @@
+import json
+import math
+import os
+import threading
+import time
+import numpy as np
+from django.conf import settings
+
+# Category codes must not be blended by interpolation
+CATEGORICAL_PROPERTIES = {"land_cover_2019"}
+
+
+def layer_name(property, depth):
+    return f"{property}_{depth}"
+
+
+class SoilLayer:
+    """
+    One property/depth grid on a regular lat/lon raster, read through np.memmap.
+    Row 0 is the northern edge and column 0 the western edge.
+    """
+
+    def __init__(self, data_path, meta):
+        self.west = meta["west"]
+        self.north = meta["north"]
+        self.cell_width = meta["cell_width"]
+        self.cell_height = meta["cell_height"]
+        self.rows = meta["rows"]
+        self.cols = meta["cols"]
+        self.nodata = meta.get("nodata")
+        self.data = np.memmap(data_path, dtype=np.dtype(meta["dtype"]), mode="r", shape=(self.rows, self.cols))
+
+    def _cell_value(self, row, col):
+        if not (0 <= row < self.rows and 0 <= col < self.cols):
+            return None
+        value = float(self.data[row, col])
+        if math.isnan(value) or (self.nodata is not None and value == self.nodata):
+            return None
+        return value
+
+    def value(self, lat, lon, interpolate=False):
+        x = (float(lon) - self.west) / self.cell_width
+        y = (self.north - float(lat)) / self.cell_height
+        nearest = self._cell_value(math.floor(y), math.floor(x))
+        if not interpolate or nearest is None:
+            return nearest
+
+        # Bilinear interpolation between the four surrounding cell centres
+        x -= 0.5
+        y -= 0.5
+        col, row = math.floor(x), math.floor(y)
+        dx, dy = x - col, y - row
+        corners = [
+            self._cell_value(row, col),
+            self._cell_value(row, col + 1),
+            self._cell_value(row + 1, col),
+            self._cell_value(row + 1, col + 1),
+        ]
+        if any(value is None for value in corners):
+            return nearest
+        top = corners[0] * (1 - dx) + corners[1] * dx
+        bottom = corners[2] * (1 - dx) + corners[3] * dx
+        return top * (1 - dy) + bottom * dy
+
+
+class SoilRasterStore:
+    """
+    Offline soil tiles built by the build_soil_tiles command.
+    Each layer is a raw `<property>_<depth>.bin` array with a `.json` sidecar
+    describing its grid; layers are opened lazily and kept mapped. Every
+    `check_interval` seconds (0 = never) a layer's files are stat'ed, and a
+    layer rebuilt in place is mapped again; lookups already holding the old
+    mapping finish on it.
+    """
+
+    def __init__(self, directory, check_interval=30):
+        self.directory = directory
+        self.check_interval = check_interval
+        self._layers = {}  # name -> (layer, file signature, last check)
+        self._lock = threading.Lock()
+
+    def _signature(self, name):
+        """Inode and mtime of the data and meta files, or None when either is missing."""
+        try:
+            data = os.stat(os.path.join(self.directory, f"{name}.bin"))
+            meta = os.stat(os.path.join(self.directory, f"{name}.json"))
+        except OSError:
+            return None
+        return data.st_ino, data.st_mtime_ns, meta.st_ino, meta.st_mtime_ns
+
+    def layer(self, property, depth):
+        name = layer_name(property, depth)
+        now = time.monotonic()
+        entry = self._layers.get(name)
+        if entry is not None and (not self.check_interval or now - entry[2] < self.check_interval):
+            return entry[0]
+
+        # Missing layers are looked up again next time, so new tiles are picked up
+        with self._lock:
+            entry = self._layers.get(name)
+            if entry is not None and (not self.check_interval or now - entry[2] < self.check_interval):
+                return entry[0]
+            signature = self._signature(name)
+            if signature is None:
+                self._layers.pop(name, None)
+                return None
+            if entry is not None:
+                if signature == entry[1]:
+                    self._layers[name] = (entry[0], signature, now)
+                    return entry[0]
+                if signature[1] > signature[3]:
+                    # write_layer replaces the data, then the meta: keep the old mapping until both are in
+                    return entry[0]
+            layer = self._open(name)
+            if layer is None:
+                return entry[0] if entry is not None else None
+            self._layers[name] = (layer, signature, now)
+            return layer
+
+    def _open(self, name):
+        data_path = os.path.join(self.directory, f"{name}.bin")
+        meta_path = os.path.join(self.directory, f"{name}.json")
+        if not (os.path.exists(data_path) and os.path.exists(meta_path)):
+            return None
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                return SoilLayer(data_path, json.load(f))
+        except Exception as e:
+            print(f"Error opening soil layer {name}: {e}")
+            return None
+
+    def value(self, lat, lon, property, depth, interpolate=False):
+        layer = self.layer(property, depth)
+        if layer is None:
+            return None
+        value = layer.value(lat, lon, interpolate=interpolate and property not in CATEGORICAL_PROPERTIES)
+        if value is None:
+            return None
+        # Tiles are float32; drop the representation noise (5.8 not 5.800000190734863)
+        return int(value) if property in CATEGORICAL_PROPERTIES else round(value, 4)
+
+
+def write_layer(directory, property, depth, data, west, north, cell_width, cell_height, nodata=None):
+    """Writes a 2-D array as a layer, replacing any previous version atomically."""
+    os.makedirs(directory, exist_ok=True)
+    name = layer_name(property, depth)
+    data = np.ascontiguousarray(data, dtype=np.float32)
+    meta = {
+        "property": property,
+        "depth": depth,
+        "west": float(west),
+        "north": float(north),
+        "cell_width": float(cell_width),
+        "cell_height": float(cell_height),
+        "rows": int(data.shape[0]),
+        "cols": int(data.shape[1]),
+        "nodata": None if nodata is None else float(nodata),
+        "dtype": "float32",
+    }
+
+    data_path = os.path.join(directory, f"{name}.bin")
+    meta_path = os.path.join(directory, f"{name}.json")
+    data.tofile(data_path + ".tmp")
+    with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(data_path + ".tmp", data_path)
+    os.replace(meta_path + ".tmp", meta_path)
+    return meta
+
+
+_store = None
+
+
+def get_soil_store():
+    """Returns the process-wide store, or None when SOIL_TILE_DIR does not exist."""
+    global _store
+    directory = settings.SOIL_TILE_DIR
+    if not directory or not os.path.isdir(directory):
+        return None
+    if _store is None or _store.directory != directory:
+        _store = SoilRasterStore(directory, check_interval=settings.SOIL_TILE_CHECK_INTERVAL)
+    return _store
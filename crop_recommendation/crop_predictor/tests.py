@@ -1,10 +1,34 @@
 # crop_predictor/tests.py
-from django.test import AsyncTestCase
+import asyncio
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from unittest import mock
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase, override_settings
 import httpx
 from django.urls import reverse
 from rest_framework import status
+from crop_recommendation import http_clients
+from crop_recommendation.http_clients import CircuitBreaker
+from . import utils
+from .boundaries import BoundaryIndex, normalize_name
+from .cache import (
+    LRUCache, MISSING, SingleFlight, acquire_lease, geocode_cache, grid_cell, normalize_address, release_lease,
+    reverse_geocode_cache, soil_cache, soil_cache_key, weather_cache,
+)
+from .management.commands.build_soil_tiles import clip
+from .models import CachedLookup
+from .services import CropModel, format_predictions, predict_crop_batch, predict_crops, scale_features
+from .soil_store import SoilRasterStore, write_layer
+from .tree_engine import CompiledEnsemble, compile_ensemble
 
-class CropRecommendationTestCase(AsyncTestCase):
+class CropRecommendationTestCase(TestCase):
 
     async def test_recommend_crop(self):
         url = reverse('recommend_crop')  # Ensure this is a valid URL in your urls.py
@@ -18,3 +42,717 @@ class CropRecommendationTestCase(AsyncTestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         # Add additional assertions if needed (e.g., checking the response body)
 
+
+class CircuitBreakerTests(SimpleTestCase):
+
+    def half_open(self, host):
+        breaker = http_clients.get_breaker(host)
+        breaker.opened_at = time.monotonic() - breaker.reset_timeout - 1
+        return breaker
+
+    def test_opens_after_threshold_and_lets_one_trial_through(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "closed")
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+
+        breaker.opened_at -= 31
+        self.assertEqual(breaker.state, "half-open")
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, "closed")
+
+    def test_failed_trial_reopens(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+        breaker.record_failure()
+        breaker.opened_at -= 31
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+
+    def test_unexpected_error_releases_the_trial(self):
+        breaker = self.half_open("broken-sync.example.test")
+        client = mock.Mock(request=mock.Mock(side_effect=ValueError("bad request")))
+        with mock.patch.object(http_clients, "get_client", return_value=client), self.assertRaises(ValueError):
+            http_clients.request("GET", "https://broken-sync.example.test/")
+        self.assertTrue(breaker.allow())
+
+    def test_unexpected_error_releases_the_async_trial(self):
+        breaker = self.half_open("broken-async.example.test")
+        transport = httpx.MockTransport(mock.Mock(side_effect=ValueError("bad request")))
+
+        async def call():
+            with mock.patch.object(http_clients, "get_async_client", return_value=httpx.AsyncClient(transport=transport)):
+                with self.assertRaises(ValueError):
+                    await http_clients.arequest("GET", "https://broken-async.example.test/")
+                with self.assertRaises(ValueError):
+                    async with http_clients.astream("GET", "https://broken-async.example.test/"):
+                        pass
+
+        breaker.allow = mock.Mock(wraps=breaker.allow)
+        asyncio.run(call())
+        self.assertEqual(breaker.allow.call_count, 2)
+        self.assertTrue(breaker.allow())
+
+
+class RecommendCropCircuitOpenTests(TestCase):
+
+    def test_open_circuit_is_a_503(self):
+        with mock.patch("crop_predictor.views.get_lat_lon", side_effect=http_clients.CircuitOpenError("Circuit open")):
+            response = self.client.post(
+                reverse('recommend_crop'), {'address': 'Dodoma, Tanzania'}, content_type='application/json'
+            )
+        self.assertEqual(response.status_code, 503)
+
+
+class SoilTileTests(SimpleTestCase):
+
+    # 4 x 4 cells of 1 degree, from 30E to 34E and 2S to 6S
+    data = np.arange(16, dtype=np.float32).reshape(4, 4)
+
+    def test_clip_inside(self):
+        clipped, west, north = clip(self.data, 30, -2, 1, 1, (31, -5, 33, -3))
+        np.testing.assert_array_equal(clipped, self.data[1:3, 1:3])
+        self.assertEqual((west, north), (31, -3))
+
+    def test_clip_partial_overlap(self):
+        clipped, west, north = clip(self.data, 30, -2, 1, 1, (28, -10, 31, -1))
+        np.testing.assert_array_equal(clipped, self.data[:, :1])
+        self.assertEqual((west, north), (30, -2))
+
+    def test_clip_outside_fails(self):
+        for bbox in ((20, -5, 25, -3), (40, -5, 45, -3), (31, -20, 33, -10), (31, 5, 33, 10)):
+            with self.subTest(bbox=bbox), self.assertRaises(CommandError):
+                clip(self.data, 30, -2, 1, 1, bbox)
+
+    def test_build_and_read_csv_tile(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source = os.path.join(directory, "ph.csv")
+            with open(source, "w", encoding="utf-8") as f:
+                f.write("lat,lon,value\n")
+                for lat in (-3.5, -4.5):
+                    for lon in (33.5, 34.5):
+                        f.write(f"{lat},{lon},{lon - lat}\n")
+            output = os.path.join(directory, "tiles")
+            call_command("build_soil_tiles", "ph", "0-20", source, "--output", output, stdout=io.StringIO())
+
+            store = SoilRasterStore(output)
+            self.assertEqual(store.value(-3.5, 33.5, "ph", "0-20"), 37.0)
+            self.assertEqual(store.value(-4.4, 34.6, "ph", "0-20"), 39.0)
+            self.assertEqual(store.value(-4.0, 34.0, "ph", "0-20", interpolate=True), 38.0)
+            self.assertIsNone(store.value(-10, 34.0, "ph", "0-20"))
+            self.assertIsNone(store.value(-3.5, 33.5, "nitrogen_total", "0-20"))
+
+            with self.assertRaises(CommandError):
+                call_command("build_soil_tiles", "ph", "0-20", source, "--output", output, "--bbox", "20,-5,25,-3")
+
+
+    def write(self, directory, value):
+        write_layer(directory, "ph", "0-20", np.full((2, 2), value), west=30, north=-2, cell_width=1, cell_height=1)
+
+    def test_rebuilt_tile_is_mapped_again(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.write(directory, 5.5)
+            store = SoilRasterStore(directory, check_interval=60)
+            frozen = SoilRasterStore(directory, check_interval=0)
+            with mock.patch("crop_predictor.soil_store.time.monotonic", return_value=1000.0):
+                self.assertEqual(store.value(-2.5, 30.5, "ph", "0-20"), 5.5)
+                self.assertEqual(frozen.value(-2.5, 30.5, "ph", "0-20"), 5.5)
+                self.write(directory, 6.5)
+                # Not checked again before the interval
+                self.assertEqual(store.value(-2.5, 30.5, "ph", "0-20"), 5.5)
+            with mock.patch("crop_predictor.soil_store.time.monotonic", return_value=1061.0):
+                self.assertEqual(store.value(-2.5, 30.5, "ph", "0-20"), 6.5)
+                self.assertEqual(frozen.value(-2.5, 30.5, "ph", "0-20"), 5.5)
+
+                os.remove(os.path.join(directory, "ph_0-20.json"))
+            with mock.patch("crop_predictor.soil_store.time.monotonic", return_value=1122.0):
+                self.assertIsNone(store.value(-2.5, 30.5, "ph", "0-20"))
+
+def _json_response(data, status_code=200):
+    return httpx.Response(status_code, json=data, request=httpx.Request("GET", "https://maps.example.test/"))
+
+
+class GeocodeCacheTests(TestCase):
+
+    def setUp(self):
+        geocode_cache.memory.clear()
+        reverse_geocode_cache.memory.clear()
+
+    def test_normalize_address(self):
+        self.assertEqual(normalize_address("  Dodoma ,TANZANIA."), "dodoma, tanzania")
+        self.assertEqual(normalize_address("dodoma, tanzania"), "dodoma, tanzania")
+        self.assertEqual(len(normalize_address("x" * 300)), 40)
+
+    def test_address_is_geocoded_once(self):
+        found = {"status": "OK", "results": [{"geometry": {"location": {"lat": -6.17, "lng": 35.74}}}]}
+        with mock.patch.object(http_clients, "request", return_value=_json_response(found)) as send:
+            self.assertEqual(utils.get_lat_lon("Dodoma, Tanzania"), (-6.17, 35.74))
+            self.assertEqual(utils.get_lat_lon("  dodoma ,TANZANIA"), (-6.17, 35.74))
+            # The shared table answers once this process forgets
+            geocode_cache.memory.clear()
+            self.assertEqual(utils.get_lat_lon("Dodoma, Tanzania"), (-6.17, 35.74))
+        self.assertEqual(send.call_count, 1)
+
+    def test_unknown_address_is_cached_but_errors_are_not(self):
+        with mock.patch.object(http_clients, "request", return_value=_json_response({"status": "ZERO_RESULTS"})) as send:
+            self.assertEqual(utils.get_lat_lon("Nowhere"), (None, None))
+            self.assertEqual(utils.get_lat_lon("Nowhere"), (None, None))
+        self.assertEqual(send.call_count, 1)
+
+        with mock.patch.object(http_clients, "request", return_value=_json_response({}, 500)) as send:
+            utils.get_lat_lon("Arusha")
+            utils.get_lat_lon("Arusha")
+        self.assertEqual(send.call_count, 2)
+
+    def test_reverse_geocode_is_cached_per_cell(self):
+        found = {"address": {"state": "Dodoma Region"}}
+        with mock.patch.object(utils, "locate", return_value=(None, None)), \
+                mock.patch.object(http_clients, "request", return_value=_json_response(found)) as send:
+            self.assertEqual(utils.reverse_geocode(-6.171, 35.741), "Dodoma Region")
+            self.assertEqual(utils.reverse_geocode(-6.172, 35.742), "Dodoma Region")
+        self.assertEqual(send.call_count, 1)
+
+
+class LRUCacheTests(SimpleTestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertIs(cache.get("b"), MISSING)
+        self.assertEqual((cache.get("a"), cache.get("c")), (1, 3))
+        self.assertEqual(cache.stats(), {"hits": 3, "misses": 1, "size": 2, "maxsize": 2})
+
+    def test_ttl_and_cached_none(self):
+        cache = LRUCache(maxsize=10, ttl=60)
+        with mock.patch("crop_predictor.cache.time.time", return_value=1000.0):
+            cache.set("failed", None)
+        with mock.patch("crop_predictor.cache.time.time", return_value=1059.0):
+            self.assertIsNone(cache.get("failed"))
+        with mock.patch("crop_predictor.cache.time.time", return_value=1061.0):
+            self.assertIs(cache.get("failed"), MISSING)
+
+
+class SingleFlightTests(SimpleTestCase):
+
+    def test_concurrent_calls_share_one_run(self):
+        flight = SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            release.wait(5)
+            return "sunny"
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flight.do("cell", fetch))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ["sunny"] * 5)
+        self.assertEqual(len(calls), 1)
+
+    def test_errors_reach_the_caller_and_are_not_kept(self):
+        flight = SingleFlight()
+        with self.assertRaises(ValueError):
+            flight.do("cell", mock.Mock(side_effect=ValueError("down")))
+        self.assertEqual(flight.do("cell", lambda: "rain"), "rain")
+
+
+class WeatherCacheTests(TestCase):
+
+    def setUp(self):
+        weather_cache.memory.clear()
+
+    def test_grid_cell(self):
+        self.assertEqual(grid_cell(-6.17, 35.74, 0.1), "0.1:-62:357")
+        self.assertEqual(grid_cell(-6.11, 35.79, 0.1), grid_cell(-6.17, 35.74, 0.1))
+
+    def test_weather_is_fetched_once_per_cell(self):
+        with mock.patch.object(utils, "fetch_weather_data", return_value=[24.5, 60, 0]) as fetch:
+            self.assertEqual(utils.get_weather_data(-6.17, 35.74), (24.5, 60, 0))
+            self.assertEqual(utils.get_weather_data(-6.11, 35.79), (24.5, 60, 0))
+        self.assertEqual(fetch.call_count, 1)
+
+    def test_failed_fetch_is_cached_briefly(self):
+        with mock.patch.object(utils, "fetch_weather_data", return_value=None) as fetch:
+            self.assertEqual(utils.get_weather_data(-3.37, 36.68), (None, None, None))
+            self.assertEqual(utils.get_weather_data(-3.37, 36.68), (None, None, None))
+        self.assertEqual(fetch.call_count, 1)
+
+    def test_lease_is_exclusive_until_released(self):
+        self.assertTrue(acquire_lease("weather:test", 15))
+        self.assertFalse(acquire_lease("weather:test", 15))
+        release_lease("weather:test")
+        self.assertTrue(acquire_lease("weather:test", 15))
+
+
+class SoilFetchTests(TestCase):
+
+    def setUp(self):
+        soil_cache.memory.clear()
+        patcher = mock.patch.object(utils, "get_soil_store", return_value=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.lock = threading.Lock()
+        self.running = 0
+        self.peak = 0
+        self.requested = []
+
+    def fake_property(self, lat, lon, prop, depth="0-20", retries=None):
+        with self.lock:
+            self.requested.append(prop)
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        time.sleep(0.05)
+        with self.lock:
+            self.running -= 1
+        # One failed property must not affect the others
+        return None if prop == "ph" else f"{prop}@{depth}"
+
+    def test_properties_are_fetched_concurrently_up_to_the_limit(self):
+        with mock.patch.object(utils, "get_soil_property", side_effect=self.fake_property):
+            soil = utils.get_soil_properties(-2.5112, 32.9012, max_concurrency=3)
+        self.assertCountEqual(self.requested, [prop for _, prop, _ in utils.SOIL_PROPERTIES])
+        self.assertEqual(self.peak, 3)
+        self.assertEqual(list(soil), [label for label, _, _ in utils.SOIL_PROPERTIES])
+        self.assertIsNone(soil["Soil pH (0-20cm)"])
+        self.assertEqual(soil["Land Cover (2019)"], "land_cover_2019@0")
+        self.assertEqual(soil["Nitrogen Total (0-20cm)"], "nitrogen_total@0-20")
+
+    @override_settings(ISDA_MAX_CONCURRENCY=2)
+    def test_default_limit_comes_from_settings(self):
+        with mock.patch.object(utils, "get_soil_property", side_effect=self.fake_property):
+            utils.get_soil_properties(-2.5212, 32.9112)
+        self.assertEqual(self.peak, 2)
+
+
+class SoilCacheTests(TestCase):
+
+    def setUp(self):
+        soil_cache.memory.clear()
+        patcher = mock.patch.object(utils, "get_soil_store", return_value=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fetch(self, lat, lon, failing=()):
+        def fake_property(lat, lon, prop, depth="0-20", retries=None):
+            return None if prop in failing else f"{prop}@{depth}"
+
+        with mock.patch.object(utils, "get_soil_property", side_effect=fake_property) as get:
+            soil = utils.get_soil_properties(lat, lon)
+        return soil, sorted(call.args[2] for call in get.call_args_list)
+
+    def test_points_in_one_cell_share_a_key(self):
+        self.assertEqual(soil_cache_key(-6.1712, 35.7412, "ph", "0-20"), soil_cache_key(-6.1714, 35.7414, "ph", "0-20"))
+        self.assertNotEqual(soil_cache_key(-6.1712, 35.7412, "ph", "0-20"), soil_cache_key(-6.1812, 35.7412, "ph", "0-20"))
+        self.assertNotEqual(soil_cache_key(-6.1712, 35.7412, "ph", "0-20"), soil_cache_key(-6.1712, 35.7412, "ph", "20-50"))
+
+    def test_memory_then_table(self):
+        before = soil_cache.stats()
+        first, fetched = self.fetch(-6.1712, 35.7412)
+        self.assertEqual(len(fetched), len(utils.SOIL_PROPERTIES))
+
+        second, fetched = self.fetch(-6.1714, 35.7414)
+        self.assertEqual((second, fetched), (first, []))
+        after = soil_cache.stats()
+        self.assertEqual(after["memory_hits"] - before["memory_hits"], len(utils.SOIL_PROPERTIES))
+
+        # Another worker (or a restart) finds the values in the shared table
+        soil_cache.memory.clear()
+        third, fetched = self.fetch(-6.1712, 35.7412)
+        self.assertEqual((third, fetched), (first, []))
+        final = soil_cache.stats()
+        self.assertEqual(final["db_hits"] - after["db_hits"], len(utils.SOIL_PROPERTIES))
+        self.assertEqual(final["misses"] - before["misses"], len(utils.SOIL_PROPERTIES))
+
+    def test_only_missing_properties_are_fetched(self):
+        soil_cache.set_many({
+            soil_cache_key(-3.3712, 36.6812, "ph", "0-20"): 6.4,
+            soil_cache_key(-3.3712, 36.6812, "land_cover_2019", "0"): 40,
+        })
+        soil, fetched = self.fetch(-3.3712, 36.6812)
+        self.assertNotIn("ph", fetched)
+        self.assertNotIn("land_cover_2019", fetched)
+        self.assertEqual(len(fetched), len(utils.SOIL_PROPERTIES) - 2)
+        self.assertEqual(soil["Soil pH (0-20cm)"], 6.4)
+
+    def test_failed_properties_are_not_cached(self):
+        soil, _ = self.fetch(-8.9112, 33.4612, failing={"ph"})
+        self.assertIsNone(soil["Soil pH (0-20cm)"])
+        key = soil_cache_key(-8.9112, 33.4612, "ph", "0-20")
+        self.assertIs(soil_cache.memory.peek(key), MISSING)
+        self.assertFalse(CachedLookup.objects.filter(namespace="soil", key=key).exists())
+
+        soil, fetched = self.fetch(-8.9112, 33.4612)
+        self.assertEqual(fetched, ["ph"])
+        self.assertEqual(soil["Soil pH (0-20cm)"], "ph@0-20")
+
+
+class RetryTests(SimpleTestCase):
+
+    def send(self, statuses, host, **kwargs):
+        responses = iter(statuses)
+        transport = httpx.MockTransport(lambda request: httpx.Response(next(responses)))
+        with mock.patch.object(http_clients, "get_client", return_value=httpx.Client(transport=transport)), \
+                mock.patch.object(http_clients.time, "sleep") as sleep:
+            response = http_clients.request("GET", f"https://{host}/", **kwargs)
+        return response, sleep
+
+    def test_transient_status_is_retried(self):
+        response, sleep = self.send([503, 502, 200], "flaky.example.test", retries=2)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sleep.call_count, 2)
+        self.assertEqual(http_clients.get_breaker("flaky.example.test").failures, 0)
+
+    def test_last_response_is_returned_when_retries_run_out(self):
+        response, _ = self.send([503, 503], "down-twice.example.test", retries=1)
+        self.assertEqual(response.status_code, 503)
+
+    def test_client_errors_are_not_retried(self):
+        response, sleep = self.send([404], "missing.example.test", retries=2)
+        self.assertEqual(response.status_code, 404)
+        sleep.assert_not_called()
+
+    def test_backoff_delay(self):
+        with self.settings(HTTP_BACKOFF_BASE=0.5, HTTP_BACKOFF_MAX=8.0):
+            for attempt in range(6):
+                self.assertLessEqual(http_clients.backoff_delay(attempt), min(8.0, 0.5 * 2 ** attempt))
+            self.assertEqual(http_clients.backoff_delay(0, httpx.Response(429, headers={"Retry-After": "3"})), 3)
+            self.assertEqual(http_clients.backoff_delay(0, httpx.Response(429, headers={"Retry-After": "120"})), 8.0)
+
+    def test_open_circuit_skips_soil_property(self):
+        with mock.patch.object(http_clients, "request", side_effect=http_clients.CircuitOpenError("open")):
+            self.assertIsNone(utils.get_soil_property(-6.17, 35.74, "ph"))
+
+
+class AsyncClientTests(SimpleTestCase):
+
+    @staticmethod
+    async def clients():
+        return http_clients.get_async_client(), http_clients.get_async_client()
+
+    def test_one_client_per_loop(self):
+        first, again = asyncio.run(self.clients())
+        self.assertIs(first, again)
+
+    def test_client_is_closed_with_its_loop(self):
+        first, _ = asyncio.run(self.clients())
+        self.assertTrue(first.is_closed)
+        # As under WSGI, where async views run on a fresh loop per request
+        second, _ = async_to_sync(self.clients)()
+        self.assertIsNot(second, first)
+        self.assertTrue(second.is_closed)
+
+    def test_client_stays_open_while_its_loop_runs(self):
+        async def use():
+            client = http_clients.get_async_client()
+            await asyncio.sleep(0)
+            return client.is_closed
+
+        self.assertFalse(asyncio.run(use()))
+
+
+class BoundaryIndexTests(SimpleTestCase):
+
+    def write_geojson(self, features):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "boundaries.geojson")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"type": "FeatureCollection", "features": features}, f)
+        return path
+
+    def square(self, west, south, size, hole=None):
+        rings = [[[west, south], [west + size, south], [west + size, south + size], [west, south + size], [west, south]]]
+        if hole:
+            rings.append(hole)
+        return rings
+
+    def test_normalize_name(self):
+        self.assertEqual(normalize_name("Arusha Urban"), "arusha")
+        self.assertEqual(normalize_name("Kilosa District Council"), "kilosa")
+        self.assertEqual(normalize_name("Dar-es-Salaam"), "daressalaam")
+        self.assertEqual(normalize_name("Region"), "region")
+
+    def test_lookup(self):
+        path = self.write_geojson([
+            {
+                "properties": {"region": "ARUSHA REGION", "district": "Karatu District Council"},
+                "geometry": {"type": "Polygon", "coordinates": self.square(35.0, -4.0, 1.0, hole=[
+                    [35.4, -3.6], [35.6, -3.6], [35.6, -3.4], [35.4, -3.4], [35.4, -3.6],
+                ])},
+            },
+            {
+                "properties": {"region": "Dodoma", "district": "Kondoa"},
+                "geometry": {"type": "MultiPolygon", "coordinates": [self.square(36.0, -5.0, 0.5), self.square(37.0, -5.0, 0.5)]},
+            },
+            {"properties": {"region": "Nowhere"}, "geometry": {"type": "Point", "coordinates": [30, -6]}},
+        ])
+        index = BoundaryIndex.from_geojson(path)
+        self.assertEqual(len(index.areas), 2)
+        # Names are respelled as in data.json
+        self.assertEqual(index.lookup(-3.8, 35.2), ("Arusha", "Karatu"))
+        self.assertEqual(index.lookup(-3.5, 35.5), (None, None))
+        self.assertEqual(index.lookup(-4.8, 37.2), ("Dodoma", "Kondoa"))
+        self.assertEqual(index.lookup(-4.8, 36.7), (None, None))
+        self.assertEqual(index.lookup(-6.0, 30.0), (None, None))
+
+
+SOIL = {
+    "Nitrogen Total (0-20cm)": 1.2, "Potassium Extractable (0-20cm)": 110, "Phosphorus Extractable (0-20cm)": 14,
+    "Soil pH (0-20cm)": 6.1, "Bulk Density (0-20cm)": 1.3, "Land Cover (2019)": 40,
+    "Cation Exchange Capacity (0-20cm)": 12,
+}
+
+
+class RecommendCropViewTests(TestCase):
+
+    def setUp(self):
+        patches = {
+            "get_lat_lon": mock.Mock(return_value=(-6.17, 35.74)),
+            "get_soil_properties": mock.Mock(return_value=SOIL),
+            "get_weather_data": mock.Mock(return_value=(24.5, 60, 0)),
+            "reverse_geocode": mock.Mock(return_value="Dodoma"),
+            "predict_crop_new": mock.Mock(return_value={"recommended_crops": [{"crop": "maize", "score": 0.8}]}),
+        }
+        for name, value in patches.items():
+            patcher = mock.patch(f"crop_predictor.views.{name}", value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.mocks = patches
+
+    def post(self, data):
+        return self.client.post(reverse('recommend_crop'), data, content_type='application/json')
+
+    def test_address(self):
+        response = self.post({'address': 'Dodoma, Tanzania'})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body['location'], {
+            'latitude': -6.17, 'longitude': 35.74, 'region': 'Dodoma', 'address': 'Dodoma, Tanzania',
+        })
+        self.assertEqual(body['weather'], {'temperature': 24.5, 'humidity': 60, 'rainfall': 0})
+        self.assertEqual(body['recommendations']['Maize']['score'], 0.8)
+        self.mocks["predict_crop_new"].assert_called_once_with(1.2, 14, 110, 24.5, 60, 6.1, 0)
+
+    def test_coordinates_skip_geocoding(self):
+        response = self.post({'latitude': -3.37, 'longitude': 36.68})
+        self.assertEqual(response.status_code, 200)
+        self.mocks["get_lat_lon"].assert_not_called()
+
+    def test_bad_requests(self):
+        self.assertEqual(self.post(['not', 'an', 'object']).status_code, 400)
+        self.assertEqual(self.post({}).status_code, 400)
+        self.mocks["get_soil_properties"].return_value = {}
+        self.assertEqual(self.post({'address': 'Dodoma'}).status_code, 400)
+
+
+class RecommendCropBatchTests(TestCase):
+
+    def setUp(self):
+        geocoded = {'Dodoma': (-6.1712, 35.7412), 'Atlantis': (None, None)}
+        patches = {
+            "get_lat_lon": mock.Mock(side_effect=lambda address: geocoded[address]),
+            "get_soil_properties": mock.Mock(return_value=SOIL),
+            "get_weather_data": mock.Mock(return_value=(24.5, 60, 0)),
+            "reverse_geocode": mock.Mock(return_value="Dodoma"),
+            "predict_crops": mock.Mock(side_effect=lambda rows: [
+                {"recommended_crops": [{"crop": "maize", "score": 0.8}]} for _ in rows
+            ]),
+        }
+        for name, value in patches.items():
+            patcher = mock.patch(f"crop_predictor.views.{name}", value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.mocks = patches
+
+    def post(self, plots, **extra):
+        return self.client.post(
+            reverse('recommend_crop_batch'), {'plots': plots}, content_type='application/json', **extra
+        )
+
+    def test_plots_share_lookups_and_one_model_call(self):
+        response = self.post([
+            {'address': 'Dodoma'},
+            {'address': 'Dodoma'},
+            {'latitude': -6.1714, 'longitude': 35.7414},
+            {'latitude': -3.37, 'longitude': 36.68},
+        ])
+        self.assertEqual(response.status_code, 200)
+        results = response.json()
+        self.assertEqual([result['index'] for result in results], [0, 1, 2, 3])
+        self.assertTrue(all('recommendations' in result for result in results))
+        self.assertEqual(self.mocks["get_lat_lon"].call_count, 1)
+        # Three plots fall in one soil cell
+        self.assertEqual(self.mocks["get_soil_properties"].call_count, 2)
+        self.mocks["predict_crops"].assert_called_once()
+
+    def test_per_plot_errors(self):
+        results = self.post([
+            'Dodoma', {}, {'latitude': 'north', 'longitude': 35}, {'address': 'Atlantis'}, {'address': 'Dodoma'},
+        ]).json()
+        self.assertEqual([('error' in result) for result in results], [True, True, True, True, False])
+
+    async def stream(self, plots):
+        response = await self.async_client.post(
+            reverse('recommend_crop_batch') + '?format=ndjson', {'plots': plots}, content_type='application/json'
+        )
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        return response.streaming_content
+
+    async def test_ndjson(self):
+        lines = [json.loads(line) async for line in await self.stream([{'address': 'Dodoma'}, {}, {'address': 'Dodoma'}])]
+        self.assertEqual(sorted(line['index'] for line in lines), [0, 1, 2])
+        self.assertTrue(all('recommendations' in line for line in lines if line['index'] != 1))
+        # One lookup and one model call for the shared cell
+        self.assertEqual(self.mocks["get_soil_properties"].call_count, 1)
+        self.assertEqual(self.mocks["predict_crops"].call_count, 1)
+
+    async def test_ndjson_lines_arrive_as_plots_finish(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        slow_cell = (-3.3712, 36.6812)
+
+        def soil(lat, lon):
+            # Blocks (in its worker thread) until the fast plot has been received
+            if (lat, lon) == slow_cell:
+                release.wait(5)
+            return SOIL
+
+        self.mocks["get_soil_properties"].side_effect = soil
+        lines = await self.stream([{'latitude': slow_cell[0], 'longitude': slow_cell[1]}, {'address': 'Dodoma'}])
+        first = json.loads(await anext(lines))
+        self.assertEqual(first['index'], 1)
+        release.set()
+        second = json.loads(await anext(lines))
+        self.assertEqual(second['index'], 0)
+        self.assertIn('recommendations', second)
+
+    def test_bad_requests(self):
+        self.assertEqual(self.post([]).status_code, 400)
+        self.assertEqual(self.post({'address': 'Dodoma'}).status_code, 400)
+        with self.settings(RECOMMEND_BATCH_MAX_PLOTS=2):
+            self.assertEqual(self.post([{'address': 'Dodoma'}] * 3).status_code, 400)
+
+
+def _crop_training_data(n=300, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n, 7)) * [20, 10, 10, 5, 15, 0.8, 60] + [50, 40, 40, 25, 70, 6.5, 100]
+    labels = np.array(["beans", "maize", "rice"])[(X[:, 0] > 50).astype(int) + (X[:, 6] > 100).astype(int)]
+    return X, labels
+
+
+class PredictCropBatchTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        from sklearn.linear_model import LogisticRegression
+        from sklearn.preprocessing import StandardScaler
+
+        cls.X, labels = _crop_training_data()
+        scaler = StandardScaler().fit(cls.X)
+        cls.model = LogisticRegression(max_iter=500).fit(scaler.transform(cls.X), labels)
+        cls.crop_model = CropModel(cls.model, scaler)
+
+    def test_scale_features_matches_the_scaler(self):
+        np.testing.assert_allclose(scale_features(self.X[:5], self.crop_model.scaler), self.crop_model.scaler.transform(self.X[:5]))
+
+    def test_top_k_matches_predict_proba(self):
+        indices, scores = predict_crop_batch(self.X[:20], k=2, crop_model=self.crop_model)
+        probabilities = self.model.predict_proba(self.crop_model.scaler.transform(self.X[:20]))
+        self.assertEqual(indices.shape, (20, 2))
+        np.testing.assert_array_equal(indices[:, 0], probabilities.argmax(axis=1))
+        np.testing.assert_allclose(scores, np.take_along_axis(probabilities, indices, axis=1))
+        self.assertTrue((scores[:, 0] >= scores[:, 1]).all())
+
+    def test_k_is_capped_at_the_class_count(self):
+        indices, _ = predict_crop_batch(self.X[:3], k=10, crop_model=self.crop_model)
+        self.assertEqual(indices.shape, (3, 3))
+
+    def test_model_without_predict_proba(self):
+        model = mock.Mock(spec=["predict", "classes_"], classes_=np.array(["beans", "maize"]))
+        model.predict.return_value = np.array(["maize", "beans"])
+        indices, scores = predict_crop_batch(self.X[:2], crop_model=CropModel(model, self.crop_model.scaler))
+        np.testing.assert_array_equal(indices, [[1], [0]])
+        np.testing.assert_array_equal(scores, [[1.0], [1.0]])
+
+    def test_format_predictions(self):
+        formatted = format_predictions(np.array([[1, 0]]), np.array([[0.71234, 0.2]]), np.array(["beans", "maize"]))
+        self.assertEqual(formatted, [{"recommended_crops": [
+            {"crop": "maize", "score": 0.7123}, {"crop": "beans", "score": 0.2},
+        ]}])
+
+    def test_predict_crops(self):
+        with mock.patch("crop_predictor.services.registry.get", return_value=self.crop_model):
+            results = predict_crops(self.X[:4].tolist())
+        self.assertEqual(len(results), 4)
+        self.assertEqual(len(results[0]["recommended_crops"]), 2)
+        self.assertEqual(predict_crops([]), [])
+
+
+class CompiledEnsembleTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.X, cls.labels = _crop_training_data(n=400, seed=1)
+        cls.X_test = _crop_training_data(n=50, seed=2)[0]
+
+    def assert_matches(self, model, X):
+        compiled = compile_ensemble(model)
+        np.testing.assert_allclose(compiled.predict_proba(X), model.predict_proba(X), atol=1e-9)
+        np.testing.assert_array_equal(compiled.predict(X), model.predict(X))
+        return compiled
+
+    def test_sklearn_forest(self):
+        from sklearn.ensemble import RandomForestClassifier
+
+        self.assert_matches(RandomForestClassifier(n_estimators=10, random_state=0).fit(self.X, self.labels), self.X_test)
+
+    def test_sklearn_tree(self):
+        from sklearn.tree import DecisionTreeClassifier
+
+        self.assert_matches(DecisionTreeClassifier(max_depth=5, random_state=0).fit(self.X, self.labels), self.X_test)
+
+    def test_lightgbm_multiclass_with_missing_values(self):
+        import lightgbm
+
+        model = lightgbm.LGBMClassifier(n_estimators=20, num_leaves=8, verbose=-1).fit(self.X, self.labels)
+        X = self.X_test.copy()
+        X[::5, 0] = np.nan
+        X[1::5, 6] = 0.0
+        self.assert_matches(model, X)
+
+    def test_lightgbm_binary(self):
+        import lightgbm
+
+        model = lightgbm.LGBMClassifier(n_estimators=20, num_leaves=8, verbose=-1).fit(self.X, self.labels == "maize")
+        self.assert_matches(model, self.X_test)
+
+    def test_save_and_load(self):
+        from sklearn.ensemble import RandomForestClassifier
+
+        compiled = compile_ensemble(RandomForestClassifier(n_estimators=5, random_state=0).fit(self.X, self.labels))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "crop.npz")
+            compiled.save(path)
+            loaded = CompiledEnsemble.load(path)
+        np.testing.assert_array_equal(loaded.predict_proba(self.X_test), compiled.predict_proba(self.X_test))
+        np.testing.assert_array_equal(loaded.classes_, ["beans", "maize", "rice"])
+
+    def test_unsupported_model(self):
+        from sklearn.neighbors import KNeighborsClassifier
+
+        with self.assertRaises(TypeError):
+            compile_ensemble(KNeighborsClassifier().fit(self.X, self.labels))
@@ -0,0 +1,236 @@
+"""
+Pure-NumPy inference for tree-ensemble classifiers.
+
+compile_ensemble() flattens a trained LightGBM or scikit-learn forest into
+contiguous node arrays (feature, threshold, left, right, leaf value), and
+CompiledEnsemble.predict_proba() walks every tree for a whole batch at once.
+Neither step needs lightgbm at serving time: the arrays are saved to an .npz
+file and loaded with NumPy alone.
+"""
+
+import json
+import numpy as np
+
+# Missing-value handling per split, following LightGBM's semantics
+MISSING_NONE, MISSING_ZERO, MISSING_NAN = 0, 1, 2
+ZERO_THRESHOLD = 1e-35
+
+
+class CompiledEnsemble:
+    """
+    Node arrays for all trees. Leaves have left == -1. `leaf_value` holds one
+    column per output: a single raw score for boosted trees (added to the class
+    given by `tree_class`), or a class distribution for forests (averaged).
+    """
+
+    def __init__(self, feature, threshold, left, right, missing_type, default_left, leaf_value,
+                 roots, tree_class, classes, n_features, transform, sigmoid=1.0, average=False,
+                 float32_input=False):
+        self.feature = np.ascontiguousarray(feature, dtype=np.int32)
+        self.threshold = np.ascontiguousarray(threshold, dtype=np.float64)
+        self.left = np.ascontiguousarray(left, dtype=np.int32)
+        self.right = np.ascontiguousarray(right, dtype=np.int32)
+        self.missing_type = np.ascontiguousarray(missing_type, dtype=np.int8)
+        self.default_left = np.ascontiguousarray(default_left, dtype=bool)
+        self.leaf_value = np.ascontiguousarray(leaf_value, dtype=np.float64)
+        self.roots = np.ascontiguousarray(roots, dtype=np.int32)
+        self.tree_class = np.ascontiguousarray(tree_class, dtype=np.int32)
+        self.classes_ = np.asarray(classes)
+        self.n_features = int(n_features)
+        self.transform = transform
+        self.sigmoid = float(sigmoid)
+        self.average = bool(average)
+        self.float32_input = bool(float32_input)
+        self._zero_missing = bool((self.missing_type[self.left >= 0] == MISSING_ZERO).any())
+        # children[2 * node + go_right], so one gather picks the next node
+        self._children = np.column_stack([self.left, self.right]).ravel()
+
+        n_outputs = len(self.classes_) if transform != "sigmoid" else 1
+        self._class_matrix = np.zeros((len(self.roots), n_outputs))
+        if self.leaf_value.shape[1] == 1:
+            self._class_matrix[np.arange(len(self.roots)), self.tree_class] = 1.0
+
+    def apply(self, X):
+        """Returns the (n_samples, n_trees) leaf index reached in every tree."""
+        X = np.asarray(X, dtype=np.float32 if self.float32_input else np.float64)
+        X = np.ascontiguousarray(X, dtype=np.float64).reshape(-1, self.n_features)
+        n_samples, n_trees = X.shape[0], len(self.roots)
+        values = X.ravel()
+        check_missing = self._zero_missing or bool(np.isnan(values).any())
+
+        # One slot per (sample, tree); only slots still on an internal node are walked further
+        node = np.tile(self.roots, n_samples)
+        offset = np.repeat(np.arange(n_samples) * self.n_features, n_trees)
+        active = np.flatnonzero(self.left[node] >= 0)
+        while active.size:
+            current = node[active]
+            x = values[offset[active] + self.feature[current]]
+            if check_missing:
+                go_right = ~self._go_left_missing(x, current)
+            else:
+                go_right = x > self.threshold[current]
+            child = self._children[2 * current + go_right]
+            node[active] = child
+            active = active[self.left[child] >= 0]
+
+        return node.reshape(n_samples, n_trees)
+
+    def _go_left_missing(self, x, nodes):
+        missing_type = self.missing_type[nodes]
+        is_nan = np.isnan(x)
+        x = np.where(is_nan & (missing_type != MISSING_NAN), 0.0, x)
+        missing = ((missing_type == MISSING_ZERO) & (np.abs(x) <= ZERO_THRESHOLD)) | (
+            (missing_type == MISSING_NAN) & is_nan
+        )
+        return np.where(missing, self.default_left[nodes], x <= self.threshold[nodes])
+
+    def predict_raw(self, X):
+        leaves = self.apply(X)
+        if self.leaf_value.shape[1] == 1:
+            raw = self.leaf_value[leaves, 0] @ self._class_matrix
+        else:
+            raw = np.zeros((leaves.shape[0], self.leaf_value.shape[1]))
+            for tree in range(leaves.shape[1]):
+                raw += self.leaf_value[leaves[:, tree]]
+        if self.average:
+            # LightGBM random-forest mode averages over iterations instead of summing
+            raw /= max(1, len(self.roots) // (int(self.tree_class.max()) + 1))
+        return raw
+
+    def predict_proba(self, X):
+        raw = self.predict_raw(X)
+        if self.transform == "softmax":
+            raw = raw - raw.max(axis=1, keepdims=True)
+            np.exp(raw, out=raw)
+            raw /= raw.sum(axis=1, keepdims=True)
+            return raw
+        if self.transform == "sigmoid":
+            positive = 1.0 / (1.0 + np.exp(-self.sigmoid * raw[:, 0]))
+            return np.column_stack([1.0 - positive, positive])
+        # "mean": forests average normalized class distributions
+        return raw / len(self.roots)
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+    def save(self, path):
+        meta = {
+            "n_features": self.n_features,
+            "transform": self.transform,
+            "sigmoid": self.sigmoid,
+            "average": self.average,
+            "float32_input": self.float32_input,
+        }
+        np.savez(
+            path,
+            feature=self.feature,
+            threshold=self.threshold,
+            left=self.left,
+            right=self.right,
+            missing_type=self.missing_type,
+            default_left=self.default_left,
+            leaf_value=self.leaf_value,
+            roots=self.roots,
+            tree_class=self.tree_class,
+            classes=self.classes_.astype(str) if self.classes_.dtype == object else self.classes_,
+            meta=np.array(json.dumps(meta)),
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            return cls(
+                data["feature"], data["threshold"], data["left"], data["right"],
+                data["missing_type"], data["default_left"], data["leaf_value"],
+                data["roots"], data["tree_class"], data["classes"], **meta,
+            )
+
+
+def compile_ensemble(model):
+    """Flattens a fitted LightGBM or scikit-learn tree classifier into a CompiledEnsemble."""
+    if hasattr(model, "booster_"):
+        return _compile_lightgbm(model)
+    if hasattr(model, "estimators_") and all(hasattr(tree, "tree_") for tree in np.ravel(model.estimators_)):
+        return _compile_sklearn_forest(model, list(np.ravel(model.estimators_)))
+    if hasattr(model, "tree_"):
+        return _compile_sklearn_forest(model, [model])
+    raise TypeError(f"Cannot compile {type(model).__name__}; expected LightGBM or a scikit-learn tree classifier")
+
+
+def _compile_lightgbm(model):
+    dump = model.booster_.dump_model()
+    objective = dump.get("objective", "")
+    if objective.startswith("multiclass ") or objective == "multiclass":
+        transform, sigmoid = "softmax", 1.0
+    elif objective.startswith("binary"):
+        transform = "sigmoid"
+        sigmoid = next((float(part.split(":")[1]) for part in objective.split() if part.startswith("sigmoid:")), 1.0)
+    else:
+        raise TypeError(f"Unsupported LightGBM objective: {objective}")
+
+    arrays = {key: [] for key in ("feature", "threshold", "left", "right", "missing_type", "default_left", "leaf_value")}
+    roots, tree_class = [], []
+    trees_per_iteration = dump.get("num_tree_per_iteration", 1)
+
+    def add(node):
+        index = len(arrays["feature"])
+        for values in arrays.values():
+            values.append(0)
+        if "leaf_value" in node:
+            arrays["left"][index] = arrays["right"][index] = -1
+            arrays["leaf_value"][index] = node["leaf_value"]
+            return index
+        if node.get("decision_type", "<=") != "<=":
+            raise TypeError("Categorical splits are not supported")
+        arrays["feature"][index] = node["split_feature"]
+        arrays["threshold"][index] = node["threshold"]
+        arrays["missing_type"][index] = {"None": MISSING_NONE, "Zero": MISSING_ZERO, "NaN": MISSING_NAN}[node.get("missing_type", "None")]
+        arrays["default_left"][index] = node.get("default_left", True)
+        arrays["left"][index] = add(node["left_child"])
+        arrays["right"][index] = add(node["right_child"])
+        return index
+
+    for position, tree in enumerate(dump["tree_info"]):
+        roots.append(add(tree["tree_structure"]))
+        tree_class.append(position % trees_per_iteration)
+
+    return CompiledEnsemble(
+        arrays["feature"], arrays["threshold"], arrays["left"], arrays["right"],
+        arrays["missing_type"], arrays["default_left"], np.asarray(arrays["leaf_value"])[:, None],
+        roots, tree_class, model.classes_, dump["max_feature_idx"] + 1, transform,
+        sigmoid=sigmoid, average=dump.get("average_output", False),
+    )
+
+
+def _compile_sklearn_forest(model, trees):
+    features, thresholds, lefts, rights, missing, default_left, values, roots = [], [], [], [], [], [], [], []
+    offset = 0
+    for estimator in trees:
+        tree = estimator.tree_
+        is_leaf = tree.children_left < 0
+        value = tree.value[:, 0, :].astype(np.float64)
+        value /= np.maximum(value.sum(axis=1, keepdims=True), np.finfo(np.float64).tiny)
+
+        features.append(np.where(is_leaf, 0, tree.feature))
+        thresholds.append(np.where(is_leaf, 0.0, tree.threshold))
+        lefts.append(np.where(is_leaf, -1, tree.children_left + offset))
+        rights.append(np.where(is_leaf, -1, tree.children_right + offset))
+        go_left = getattr(tree, "missing_go_to_left", np.zeros(tree.node_count, dtype=np.uint8))
+        missing.append(np.full(tree.node_count, MISSING_NAN))
+        default_left.append(np.asarray(go_left, dtype=bool))
+        # Trees may have seen a subset of the classes; map their columns onto the ensemble's
+        if hasattr(estimator, "classes_") and len(estimator.classes_) != len(model.classes_):
+            expanded = np.zeros((tree.node_count, len(model.classes_)))
+            expanded[:, np.searchsorted(model.classes_, estimator.classes_)] = value
+            value = expanded
+        values.append(value)
+        roots.append(offset)
+        offset += tree.node_count
+
+    return CompiledEnsemble(
+        np.concatenate(features), np.concatenate(thresholds), np.concatenate(lefts), np.concatenate(rights),
+        np.concatenate(missing), np.concatenate(default_left), np.concatenate(values),
+        roots, np.zeros(len(roots)), model.classes_, model.n_features_in_, "mean",
+        float32_input=True,
+    )
@@ -3,4 +3,5 @@ from . import views
 
 urlpatterns = [
     path('recommend/', views.recommend_crop, name='recommend_crop'),
+    path('recommend/batch/', views.recommend_crop_batch, name='recommend_crop_batch'),
  ]
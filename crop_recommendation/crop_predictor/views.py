@@ -1,49 +1,49 @@
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import AllowAny
-from rest_framework.response import Response
-from .services import CROP_CONDITIONS, predict_crop_new
-from .utils import get_lat_lon, get_soil_properties, get_weather_data
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from crop_recommendation import http_clients
+from .cache import grid_cell, normalize_address
+from .services import CROP_CONDITIONS, predict_crop_new, predict_crops
 from .utils import get_lat_lon, get_soil_properties, get_weather_data, reverse_geocode
 
+# Model inference runs here so it never blocks the event loop
+inference_executor = ThreadPoolExecutor(max_workers=settings.CROP_INFERENCE_WORKERS)
 
 
-@api_view(['POST'])
-@permission_classes([AllowAny])
-def recommend_crop(request):
-    address = request.data.get('address')
-    lat = request.data.get('latitude')
-    lon = request.data.get('longitude')
+def _in_thread(func):
+    """
+    Runs a blocking helper in a worker thread. Database connections opened by
+    the caches in that thread are closed afterwards, as at the end of a request.
+    """
+    def run(*args):
+        try:
+            return func(*args)
+        finally:
+            close_old_connections()
 
-    if address and (not lat or not lon):
-        lat, lon = get_lat_lon(address)
+    return sync_to_async(run, thread_sensitive=False)
 
-    if not lat or not lon:
-        return Response({'error': 'Either an address or valid latitude and longitude are required.'}, status=400)
 
-    soil_data = get_soil_properties(lat, lon)
-    if not soil_data:
-        return Response({'error': 'Failed to retrieve soil properties.'}, status=400)
-
-    temperature, humidity, rainfall = get_weather_data(lat, lon)
-    if temperature is None or humidity is None or rainfall is None:
-        return Response({'error': 'Failed to retrieve weather data.'}, status=400)
-
-    N = soil_data.get("Nitrogen Total (0-20cm)")
-    P = soil_data.get("Phosphorus Extractable (0-20cm)")
-    K = soil_data.get("Potassium Extractable (0-20cm)")
-    ph = soil_data.get("Soil pH (0-20cm)")
+def _request_data(request):
+    if request.content_type == 'application/json':
+        try:
+            return json.loads(request.body or b'{}')
+        except json.JSONDecodeError:
+            return None
+    return request.POST
 
-    print('Model Input:', N, P, K, temperature, humidity, ph, rainfall)
 
-    try:
-        ai_recommendations = predict_crop_new(N, P, K, temperature, humidity, ph, rainfall)
-    except Exception as e:
-        return Response({'error': f"Error in AI model prediction: {str(e)}"}, status=500)
-
-    recommended_crops = ai_recommendations.get("recommended_crops", [])
+def build_recommendations(ai_recommendations):
+    """Attaches the crop explanation to each recommended crop."""
     detailed_recommendations = {}
 
-    for item in recommended_crops:
+    for item in ai_recommendations.get("recommended_crops", []):
         crop_name = item.get("crop")
         score = item.get("score", 0)
         explanation = CROP_CONDITIONS.get(crop_name.title())
@@ -53,9 +53,25 @@ def recommend_crop(request):
             "score": score
         }
 
-    region = reverse_geocode(float(lat), float(lon))
+    return detailed_recommendations
+
 
-    response_data = {
+def model_features(soil_data, temperature, humidity, rainfall):
+    """Returns the model input row (N, P, K, temperature, humidity, ph, rainfall)."""
+    return (
+        soil_data.get("Nitrogen Total (0-20cm)"),
+        soil_data.get("Phosphorus Extractable (0-20cm)"),
+        soil_data.get("Potassium Extractable (0-20cm)"),
+        temperature,
+        humidity,
+        soil_data.get("Soil pH (0-20cm)"),
+        rainfall,
+    )
+
+
+def build_response(lat, lon, region, address, soil_data, weather, ai_recommendations):
+    temperature, humidity, rainfall = weather
+    return {
         'location': {
             'latitude': lat,
             'longitude': lon,
@@ -68,7 +84,216 @@ def recommend_crop(request):
             'humidity': humidity,
             'rainfall': rainfall,
         },
-        'recommendations': detailed_recommendations
+        'recommendations': build_recommendations(ai_recommendations)
     }
 
-    return Response(response_data, status=200)
+
+@csrf_exempt
+@require_POST
+async def recommend_crop(request):
+    data = _request_data(request)
+    if not isinstance(data, dict):
+        return JsonResponse({'error': 'Request body must be a JSON object.'}, status=400)
+
+    address = data.get('address')
+    lat = data.get('latitude')
+    lon = data.get('longitude')
+
+    try:
+        if address and (not lat or not lon):
+            lat, lon = await _in_thread(get_lat_lon)(address)
+
+        if not lat or not lon:
+            return JsonResponse({'error': 'Either an address or valid latitude and longitude are required.'}, status=400)
+
+        # Soil, weather and region only depend on the coordinates, so fetch them together
+        soil_data, (temperature, humidity, rainfall), region = await asyncio.gather(
+            _in_thread(get_soil_properties)(lat, lon),
+            _in_thread(get_weather_data)(lat, lon),
+            _in_thread(reverse_geocode)(float(lat), float(lon)),
+        )
+    except http_clients.CircuitOpenError as e:
+        return JsonResponse({'error': 'Location or weather service is temporarily unavailable.', 'details': str(e)}, status=503)
+
+    if not soil_data:
+        return JsonResponse({'error': 'Failed to retrieve soil properties.'}, status=400)
+
+    if temperature is None or humidity is None or rainfall is None:
+        return JsonResponse({'error': 'Failed to retrieve weather data.'}, status=400)
+
+    features = model_features(soil_data, temperature, humidity, rainfall)
+    print('Model Input:', *features)
+
+    try:
+        loop = asyncio.get_running_loop()
+        ai_recommendations = await loop.run_in_executor(inference_executor, predict_crop_new, *features)
+    except Exception as e:
+        return JsonResponse({'error': f"Error in AI model prediction: {str(e)}"}, status=500)
+
+    response_data = build_response(
+        lat, lon, region, address, soil_data, (temperature, humidity, rainfall), ai_recommendations
+    )
+    return JsonResponse(response_data, status=200)
+
+
+class _BatchLookups:
+    """
+    Lookups shared by the plots of one batch: each distinct address is geocoded
+    once and each soil grid cell is fetched (and run through the model) once,
+    with at most RECOMMEND_BATCH_CONCURRENCY blocking calls in flight.
+    """
+
+    def __init__(self):
+        self._semaphore = asyncio.Semaphore(settings.RECOMMEND_BATCH_CONCURRENCY)
+        self._tasks = {}
+
+    async def _bounded(self, func, *args):
+        async with self._semaphore:
+            return await _in_thread(func)(*args)
+
+    def shared(self, key, make):
+        task = self._tasks.get(key)
+        if task is None:
+            task = self._tasks[key] = asyncio.ensure_future(make())
+        return task
+
+    def geocode(self, address):
+        return self.shared(('address', normalize_address(address)), lambda: self._bounded(get_lat_lon, address))
+
+    def cell(self, lat, lon):
+        async def fetch():
+            return await asyncio.gather(
+                self._bounded(get_soil_properties, lat, lon),
+                self._bounded(get_weather_data, lat, lon),
+                self._bounded(reverse_geocode, lat, lon),
+            )
+
+        return self.shared(('cell', grid_cell(lat, lon, settings.SOIL_CACHE_CELL_DEGREES)), fetch)
+
+    def cancel(self):
+        for task in self._tasks.values():
+            task.cancel()
+
+
+async def _prepare_plot(index, plot, lookups):
+    """
+    Returns (error result, None) for a plot that cannot be recommended, or
+    (None, (lat, lon, soil_data, weather, region)) for one ready for the model.
+    """
+    if not isinstance(plot, dict):
+        return {'index': index, 'error': 'Each plot must be an object.'}, None
+    lat, lon = plot.get('latitude'), plot.get('longitude')
+    if lat and lon:
+        try:
+            lat, lon = float(lat), float(lon)
+        except (TypeError, ValueError):
+            return {'index': index, 'error': 'Latitude and longitude must be numbers.'}, None
+    elif plot.get('address'):
+        try:
+            lat, lon = await lookups.geocode(plot['address'])
+        except Exception:
+            lat = lon = None
+        if not lat or not lon:
+            return {'index': index, 'error': 'Failed to geocode the address.'}, None
+    else:
+        return {'index': index, 'error': 'Either an address or valid latitude and longitude are required.'}, None
+
+    try:
+        soil_data, weather, region = await lookups.cell(lat, lon)
+    except Exception as e:
+        return {'index': index, 'error': f'Failed to retrieve data: {e}'}, None
+    if not soil_data:
+        return {'index': index, 'error': 'Failed to retrieve soil properties.'}, None
+    if any(value is None for value in weather):
+        return {'index': index, 'error': 'Failed to retrieve weather data.'}, None
+    return None, (lat, lon, soil_data, weather, region)
+
+
+async def _predict(rows):
+    """predict_crops() on the inference executor; a failure becomes the result of every row."""
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(inference_executor, predict_crops, rows)
+    except Exception as e:
+        return [e] * len(rows)
+
+
+def _plot_result(index, plot, data, ai_recommendations):
+    if isinstance(ai_recommendations, Exception):
+        return {'index': index, 'error': f"Error in AI model prediction: {str(ai_recommendations)}"}
+    lat, lon, soil_data, weather, region = data
+    return {'index': index, **build_response(lat, lon, region, plot.get('address'), soil_data, weather, ai_recommendations)}
+
+
+async def recommend_plots(plots):
+    """
+    Recommends crops for many plots given as {"address": ...} and/or
+    {"latitude": ..., "longitude": ...}, with the lookups shared as in
+    _BatchLookups and one model call for all rows. Returns one result per plot,
+    in order, with an "error" key for plots that failed.
+    """
+    lookups = _BatchLookups()
+    prepared = await asyncio.gather(*(_prepare_plot(index, plot, lookups) for index, plot in enumerate(plots)))
+
+    ready = [index for index, (result, _) in enumerate(prepared) if result is None]
+    rows = [model_features(prepared[index][1][2], *prepared[index][1][3]) for index in ready]
+    predictions = await _predict(rows) if rows else []
+
+    results = [result for result, _ in prepared]
+    for index, ai_recommendations in zip(ready, predictions):
+        results[index] = _plot_result(index, plots[index], prepared[index][1], ai_recommendations)
+    return results
+
+
+async def stream_plots(plots):
+    """
+    Like recommend_plots(), but yields each plot's result as soon as it is
+    ready, in completion order; the model runs once per soil grid cell.
+    Unfinished lookups are cancelled if the consumer stops early.
+    """
+    lookups = _BatchLookups()
+
+    async def recommend(index, plot):
+        result, data = await _prepare_plot(index, plot, lookups)
+        if result is not None:
+            return result
+        lat, lon, soil_data, weather, _ = data
+        row = model_features(soil_data, *weather)
+        cell = grid_cell(lat, lon, settings.SOIL_CACHE_CELL_DEGREES)
+        (ai_recommendations,) = await lookups.shared(('model', cell), lambda: _predict([row]))
+        return _plot_result(index, plot, data, ai_recommendations)
+
+    tasks = [asyncio.ensure_future(recommend(index, plot)) for index, plot in enumerate(plots)]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield await finished
+    finally:
+        for task in tasks:
+            task.cancel()
+        lookups.cancel()
+
+
+@csrf_exempt
+@require_POST
+async def recommend_crop_batch(request):
+    """
+    POST {"plots": [{"address": ...} | {"latitude": ..., "longitude": ...}, ...]}.
+    Returns a JSON array of per-plot results in order, or with ?format=ndjson or
+    Accept: application/x-ndjson streams one result per line as each plot
+    finishes (match lines to plots by their "index").
+    """
+    data = _request_data(request)
+    plots = data.get('plots') if isinstance(data, dict) else None
+    if not isinstance(plots, list) or not plots:
+        return JsonResponse({'error': 'Provide a non-empty "plots" list.'}, status=400)
+    if len(plots) > settings.RECOMMEND_BATCH_MAX_PLOTS:
+        return JsonResponse(
+            {'error': f'At most {settings.RECOMMEND_BATCH_MAX_PLOTS} plots are allowed per request.'}, status=400
+        )
+
+    if request.GET.get('format') == 'ndjson' or 'application/x-ndjson' in request.headers.get('Accept', ''):
+        return StreamingHttpResponse(
+            (json.dumps(result) + '\n' async for result in stream_plots(plots)),
+            content_type='application/x-ndjson',
+        )
+    return JsonResponse(await recommend_plots(plots), safe=False)
@@ -0,0 +1,307 @@
+"""
+Process-wide HTTP clients for outbound integrations (geocoding, iSDA,
+OpenWeatherMap, Nominatim, Groq).
+
+One pooled client per process keeps connections alive between calls, each host
+gets its own connection cap and circuit breaker, and transient failures are
+retried with exponential backoff plus jitter.
+"""
+
+import asyncio
+import contextlib
+import random
+import threading
+import time
+import weakref
+from urllib.parse import urlsplit
+
+import httpx
+from django.conf import settings
+
+RETRYABLE_STATUS_CODES = {429, 502, 503, 504}
+# A 429 means the host is up but throttling us; it is retried without tripping the breaker
+FAILURE_STATUS_CODES = {502, 503, 504}
+RETRYABLE_EXCEPTIONS = (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError)
+
+
+class CircuitOpenError(httpx.HTTPError):
+    """Raised without contacting the host while its circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls for
+    `reset_timeout` seconds, then lets a single trial call through (half-open).
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def release(self):
+        """Ends a half-open trial that neither succeeded nor failed (e.g. an error on our side)."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+_lock = threading.Lock()
+_client = None
+_async_clients = weakref.WeakKeyDictionary()
+_breakers = {}
+_host_semaphores = {}
+_async_host_semaphores = weakref.WeakKeyDictionary()
+
+
+def _client_options():
+    http2 = settings.HTTP_CLIENT_HTTP2
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            print("HTTP/2 requested but the 'h2' package is not installed; using HTTP/1.1.")
+            http2 = False
+
+    return {
+        "http2": http2,
+        "timeout": httpx.Timeout(settings.HTTP_READ_TIMEOUT, connect=settings.HTTP_CONNECT_TIMEOUT),
+        "limits": httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_MAX_CONNECTIONS,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+        ),
+    }
+
+
+def get_client():
+    """Returns the shared synchronous client, creating it on first use."""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = httpx.Client(**_client_options())
+    return _client
+
+
+async def _close_on_loop_shutdown(client):
+    try:
+        yield
+    finally:
+        await client.aclose()
+
+
+def get_async_client():
+    """
+    Returns the shared async client for the running event loop. Short-lived
+    loops (async_to_sync, asyncio.run) finalize their async generators before
+    closing, which also closes the loop's client and its connections.
+    """
+    loop = asyncio.get_running_loop()
+    entry = _async_clients.get(loop)
+    if entry is None:
+        client = httpx.AsyncClient(**_client_options())
+        closer = _close_on_loop_shutdown(client)
+        # Step it to its yield: the loop now tracks it and closes it in shutdown_asyncgens()
+        try:
+            closer.asend(None).send(None)
+        except StopIteration:
+            pass
+        entry = _async_clients[loop] = (client, closer)
+    return entry[0]
+
+
+def get_breaker(host):
+    with _lock:
+        breaker = _breakers.get(host)
+        if breaker is None:
+            breaker = CircuitBreaker(settings.HTTP_CIRCUIT_FAILURES, settings.HTTP_CIRCUIT_RESET_TIMEOUT)
+            _breakers[host] = breaker
+        return breaker
+
+
+def _host_semaphore(host):
+    with _lock:
+        semaphore = _host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = threading.BoundedSemaphore(settings.HTTP_MAX_CONNECTIONS_PER_HOST)
+            _host_semaphores[host] = semaphore
+        return semaphore
+
+
+def _async_host_semaphore(host):
+    semaphores = _async_host_semaphores.setdefault(asyncio.get_running_loop(), {})
+    semaphore = semaphores.get(host)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(settings.HTTP_MAX_CONNECTIONS_PER_HOST)
+        semaphores[host] = semaphore
+    return semaphore
+
+
+def backoff_delay(attempt, response=None):
+    """Full-jitter exponential backoff, honouring a numeric Retry-After header."""
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), settings.HTTP_BACKOFF_MAX)
+    ceiling = min(settings.HTTP_BACKOFF_MAX, settings.HTTP_BACKOFF_BASE * (2 ** attempt))
+    return random.uniform(0, ceiling)
+
+
+def request(method, url, retries=None, **kwargs):
+    """
+    Sends a request through the shared client.
+
+    Transient failures (timeouts, connection errors, 429/502/503/504) are retried
+    up to `retries` times (default HTTP_RETRIES). Raises CircuitOpenError while
+    the host's breaker is open; other responses are returned as-is.
+    """
+    retries = settings.HTTP_RETRIES if retries is None else retries
+    host = urlsplit(url).netloc
+    breaker = get_breaker(host)
+
+    for attempt in range(retries + 1):
+        if not breaker.allow():
+            raise CircuitOpenError(f"Circuit open for {host}")
+
+        try:
+            with _host_semaphore(host):
+                response = get_client().request(method, url, **kwargs)
+        except RETRYABLE_EXCEPTIONS as e:
+            breaker.record_failure()
+            if attempt >= retries:
+                raise
+            print(f"{type(e).__name__} calling {host}, retrying ({attempt + 1}/{retries})...")
+            time.sleep(backoff_delay(attempt))
+            continue
+        except BaseException:
+            # Otherwise a half-open trial would stay taken and the circuit never close
+            breaker.release()
+            raise
+
+        if response.status_code in FAILURE_STATUS_CODES:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        if response.status_code in RETRYABLE_STATUS_CODES and attempt < retries:
+            print(f"HTTP {response.status_code} from {host}, retrying ({attempt + 1}/{retries})...")
+            time.sleep(backoff_delay(attempt, response))
+            continue
+        return response
+
+
+async def arequest(method, url, retries=None, **kwargs):
+    """Async counterpart of request() using the loop's shared AsyncClient."""
+    retries = settings.HTTP_RETRIES if retries is None else retries
+    host = urlsplit(url).netloc
+    breaker = get_breaker(host)
+
+    for attempt in range(retries + 1):
+        if not breaker.allow():
+            raise CircuitOpenError(f"Circuit open for {host}")
+
+        try:
+            async with _async_host_semaphore(host):
+                response = await get_async_client().request(method, url, **kwargs)
+        except RETRYABLE_EXCEPTIONS as e:
+            breaker.record_failure()
+            if attempt >= retries:
+                raise
+            print(f"{type(e).__name__} calling {host}, retrying ({attempt + 1}/{retries})...")
+            await asyncio.sleep(backoff_delay(attempt))
+            continue
+        except BaseException:
+            # Includes cancellation; otherwise a half-open trial would stay taken
+            breaker.release()
+            raise
+
+        if response.status_code in FAILURE_STATUS_CODES:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        if response.status_code in RETRYABLE_STATUS_CODES and attempt < retries:
+            print(f"HTTP {response.status_code} from {host}, retrying ({attempt + 1}/{retries})...")
+            await asyncio.sleep(backoff_delay(attempt, response))
+            continue
+        return response
+
+
+@contextlib.asynccontextmanager
+async def astream(method, url, retries=None, **kwargs):
+    """
+    Like arequest(), but yields a response whose body has not been read yet,
+    for iterating with aiter_lines()/aiter_bytes(). Retries only happen before
+    the body starts; the connection (and the host's slot) is held until the
+    block exits.
+    """
+    retries = settings.HTTP_RETRIES if retries is None else retries
+    host = urlsplit(url).netloc
+    breaker = get_breaker(host)
+    client = get_async_client()
+
+    for attempt in range(retries + 1):
+        if not breaker.allow():
+            raise CircuitOpenError(f"Circuit open for {host}")
+
+        async with _async_host_semaphore(host):
+            try:
+                response = await client.send(client.build_request(method, url, **kwargs), stream=True)
+            except RETRYABLE_EXCEPTIONS as e:
+                breaker.record_failure()
+                if attempt >= retries:
+                    raise
+                print(f"{type(e).__name__} calling {host}, retrying ({attempt + 1}/{retries})...")
+                delay = backoff_delay(attempt)
+            except BaseException:
+                # Includes cancellation; otherwise a half-open trial would stay taken
+                breaker.release()
+                raise
+            else:
+                if response.status_code in FAILURE_STATUS_CODES:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                if response.status_code in RETRYABLE_STATUS_CODES and attempt < retries:
+                    await response.aclose()
+                    print(f"HTTP {response.status_code} from {host}, retrying ({attempt + 1}/{retries})...")
+                    delay = backoff_delay(attempt, response)
+                else:
+                    try:
+                        yield response
+                    finally:
+                        await response.aclose()
+                    return
+        await asyncio.sleep(delay)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from decouple import config
 from pathlib import Path
 
@@ -62,6 +63,135 @@ INSTALLED_APPS = [
 AUTH_USER_MODEL = 'authentication.User'
 GROQ_API_KEY = config('GROQ_API_KEY')
 
+# Groq calls are scheduled against these quotas, shared by all workers (bot/scheduler.py); the response
+# rate-limit headers correct them. Requests that cannot be sent within GROQ_QUEUE_MAX_WAIT get a 503.
+GROQ_REQUESTS_PER_MINUTE = config('GROQ_REQUESTS_PER_MINUTE', default=30, cast=int)
+GROQ_TOKENS_PER_MINUTE = config('GROQ_TOKENS_PER_MINUTE', default=30000, cast=int)
+GROQ_QUEUE_MAX = config('GROQ_QUEUE_MAX', default=100, cast=int)  # waiting requests per process
+GROQ_QUEUE_MAX_WAIT = config('GROQ_QUEUE_MAX_WAIT', default=20, cast=float)  # seconds
+
+# ML models served through prediction_api.registry: loaded lazily on first use and
+# reloaded when their files change (checked every MODEL_RELOAD_CHECK_INTERVAL seconds, 0 = never)
+ML_MODELS = {
+    'crop': {
+        'version': config('CROP_MODEL_VERSION', default='1'),
+        'path': config('CROP_MODEL_PATH', default=str(BASE_DIR / 'crop_predictor' / 'ml_models' / 'crop' / 'crop_recomendation.joblib')),
+        'scaler_path': config('CROP_SCALER_PATH', default=str(BASE_DIR / 'crop_predictor' / 'ml_models' / 'crop' / 'scaler.joblib')),
+        # Arrays written by `manage.py compile_crop_model`; when set, the model is served without lightgbm
+        'compiled_path': config('CROP_COMPILED_MODEL_PATH', default=''),
+    },
+    'disease': {
+        'version': config('DISEASE_MODEL_VERSION', default='1'),
+        'path': config('DISEASE_MODEL_PATH', default=str(BASE_DIR / 'disease_detection' / 'ml_models' / 'plant_disease_model1.keras')),
+        # "keras", or "tflite" to serve the quantized model written by `manage.py export_disease_tflite`
+        'backend': config('DISEASE_MODEL_BACKEND', default='keras'),
+        'tflite_path': config('DISEASE_TFLITE_MODEL_PATH', default=str(BASE_DIR / 'disease_detection' / 'ml_models' / 'plant_disease_model1.tflite')),
+    },
+}
+MODEL_RELOAD_CHECK_INTERVAL = config('MODEL_RELOAD_CHECK_INTERVAL', default=30, cast=int)  # seconds
+MODEL_WARMUP = config('MODEL_WARMUP', default=True, cast=bool)
+MODEL_PRELOAD = config('MODEL_PRELOAD', default=False, cast=bool)  # load every model at startup
+DISEASE_TFLITE_THREADS = config('DISEASE_TFLITE_THREADS', default=os.cpu_count() or 1, cast=int)  # tflite backend only
+
+# Micro-batching of disease model inference (disease_detection/batching.py)
+DISEASE_BATCHING = config('DISEASE_BATCHING', default=True, cast=bool)
+DISEASE_BATCH_MAX_SIZE = config('DISEASE_BATCH_MAX_SIZE', default=16, cast=int)
+DISEASE_BATCH_MAX_WAIT_MS = config('DISEASE_BATCH_MAX_WAIT_MS', default=5, cast=float)
+DISEASE_BATCH_MAX_QUEUE = config('DISEASE_BATCH_MAX_QUEUE', default=256, cast=int)
+
+# Disease upload limits; JPEGs are decoded at reduced size, keeping the shorter side at least DISEASE_DECODE_MIN_SIDE
+DISEASE_MAX_UPLOAD_BYTES = config('DISEASE_MAX_UPLOAD_BYTES', default=10 * 1024 * 1024, cast=int)
+DISEASE_MAX_IMAGE_PIXELS = config('DISEASE_MAX_IMAGE_PIXELS', default=40_000_000, cast=int)
+DISEASE_DECODE_MIN_SIDE = config('DISEASE_DECODE_MIN_SIDE', default=256, cast=int)  # pixels; 0 = full resolution
+
+# Multi-image disease detection (/detector/detect/batch)
+DISEASE_BATCH_MAX_IMAGES = config('DISEASE_BATCH_MAX_IMAGES', default=20, cast=int)
+DISEASE_PREPROCESS_WORKERS = config('DISEASE_PREPROCESS_WORKERS', default=os.cpu_count() or 1, cast=int)
+
+# Disease detection jobs (POST /detector/jobs, then poll); processed by web workers and/or `manage.py run_disease_jobs`
+DISEASE_JOB_WORKERS = config('DISEASE_JOB_WORKERS', default=os.cpu_count() or 1, cast=int)
+DISEASE_JOBS_IN_PROCESS = config('DISEASE_JOBS_IN_PROCESS', default=True, cast=bool)
+DISEASE_JOB_TIMEOUT = config('DISEASE_JOB_TIMEOUT', default=300, cast=int)  # seconds before a running job is retried
+DISEASE_JOB_MAX_ATTEMPTS = config('DISEASE_JOB_MAX_ATTEMPTS', default=3, cast=int)
+DISEASE_JOB_RETENTION = config('DISEASE_JOB_RETENTION', default=7 * 24 * 3600, cast=int)  # seconds
+
+# Cached results for resent disease photos (disease_detection/cache.py)
+DISEASE_CACHE_MAXSIZE = config('DISEASE_CACHE_MAXSIZE', default=2048, cast=int)  # 0 disables the cache
+DISEASE_CACHE_MAX_DISTANCE = config('DISEASE_CACHE_MAX_DISTANCE', default=6, cast=int)  # bits; -1 = exact matches only
+
+# Threads used by async views for model inference
+CROP_INFERENCE_WORKERS = config('CROP_INFERENCE_WORKERS', default=os.cpu_count() or 1, cast=int)
+
+# Shared inference process (manage.py run_inference_sidecar); empty means each worker loads the models
+INFERENCE_SIDECAR_SOCKET = config('INFERENCE_SIDECAR_SOCKET', default='')
+INFERENCE_SIDECAR_WORKERS = config('INFERENCE_SIDECAR_WORKERS', default=os.cpu_count() or 1, cast=int)
+INFERENCE_SIDECAR_TIMEOUT = config('INFERENCE_SIDECAR_TIMEOUT', default=30, cast=float)  # seconds
+
+# Batch recommendations (/api/recommend/batch/)
+RECOMMEND_BATCH_MAX_PLOTS = config('RECOMMEND_BATCH_MAX_PLOTS', default=500, cast=int)
+RECOMMEND_BATCH_CONCURRENCY = config('RECOMMEND_BATCH_CONCURRENCY', default=8, cast=int)
+
+# agro_bot answers cached per process for repeated and rephrased questions (bot/cache.py)
+BOT_CACHE_MAXSIZE = config('BOT_CACHE_MAXSIZE', default=5000, cast=int)  # 0 disables the cache
+BOT_CACHE_TTL = config('BOT_CACHE_TTL', default=7 * 24 * 3600, cast=int)  # seconds
+BOT_CACHE_THRESHOLD = config('BOT_CACHE_THRESHOLD', default=0.75, cast=float)  # shingle Jaccard similarity; 1 = exact only
+
+# Local BM25 retrieval over the bundled disease/crop data and education articles (bot/retrieval.py).
+# Questions that name a passage's subject and whose IDF weight it covers at least BOT_RETRIEVAL_ANSWER_COVERAGE
+# are answered from it; otherwise up to BOT_RETRIEVAL_TOP_K passages are sent to the LLM as context.
+BOT_RETRIEVAL_LOCAL_ANSWERS = config('BOT_RETRIEVAL_LOCAL_ANSWERS', default=True, cast=bool)
+BOT_RETRIEVAL_ANSWER_COVERAGE = config('BOT_RETRIEVAL_ANSWER_COVERAGE', default=0.8, cast=float)
+BOT_RETRIEVAL_TOP_K = config('BOT_RETRIEVAL_TOP_K', default=3, cast=int)  # 0 sends questions without context
+BOT_RETRIEVAL_MIN_SCORE = config('BOT_RETRIEVAL_MIN_SCORE', default=2.0, cast=float)  # BM25 score
+BOT_RETRIEVAL_CONTEXT_CHARS = config('BOT_RETRIEVAL_CONTEXT_CHARS', default=1200, cast=int)
+BOT_RETRIEVAL_REFRESH_INTERVAL = config('BOT_RETRIEVAL_REFRESH_INTERVAL', default=60, cast=int)  # seconds; 0 = signals only
+
+# Shared outbound HTTP clients (see crop_recommendation/http_clients.py)
+HTTP_CLIENT_HTTP2 = config('HTTP_CLIENT_HTTP2', default=False, cast=bool)  # needs the 'h2' package
+HTTP_CONNECT_TIMEOUT = config('HTTP_CONNECT_TIMEOUT', default=5.0, cast=float)  # seconds
+HTTP_READ_TIMEOUT = config('HTTP_READ_TIMEOUT', default=30.0, cast=float)  # seconds
+HTTP_MAX_CONNECTIONS = config('HTTP_MAX_CONNECTIONS', default=50, cast=int)
+HTTP_MAX_CONNECTIONS_PER_HOST = config('HTTP_MAX_CONNECTIONS_PER_HOST', default=10, cast=int)
+HTTP_KEEPALIVE_EXPIRY = config('HTTP_KEEPALIVE_EXPIRY', default=30.0, cast=float)  # seconds
+HTTP_RETRIES = config('HTTP_RETRIES', default=2, cast=int)
+HTTP_BACKOFF_BASE = config('HTTP_BACKOFF_BASE', default=0.5, cast=float)  # seconds
+HTTP_BACKOFF_MAX = config('HTTP_BACKOFF_MAX', default=8.0, cast=float)  # seconds
+HTTP_CIRCUIT_FAILURES = config('HTTP_CIRCUIT_FAILURES', default=5, cast=int)
+HTTP_CIRCUIT_RESET_TIMEOUT = config('HTTP_CIRCUIT_RESET_TIMEOUT', default=30.0, cast=float)  # seconds
+
+# External data integrations (iSDA soil, OpenWeatherMap, geocoding)
+ISDA_MAX_CONCURRENCY = config('ISDA_MAX_CONCURRENCY', default=7, cast=int)
+
+# Soil properties are cached per grid cell of SOIL_CACHE_CELL_DEGREES (0.005° ≈ 550 m)
+SOIL_CACHE_CELL_DEGREES = config('SOIL_CACHE_CELL_DEGREES', default=0.005, cast=float)
+SOIL_CACHE_TTL = config('SOIL_CACHE_TTL', default=365 * 24 * 3600, cast=int)  # seconds
+SOIL_CACHE_MAXSIZE = config('SOIL_CACHE_MAXSIZE', default=10000, cast=int)
+
+# Offline soil tiles built with `manage.py build_soil_tiles`; used before the cache and iSDA
+SOIL_TILE_DIR = config('SOIL_TILE_DIR', default=str(BASE_DIR / 'crop_predictor' / 'data' / 'soil_tiles'))
+SOIL_TILE_INTERPOLATE = config('SOIL_TILE_INTERPOLATE', default=False, cast=bool)
+# Rebuilt tiles are picked up by running workers within this many seconds (0 = only after a restart)
+SOIL_TILE_CHECK_INTERVAL = config('SOIL_TILE_CHECK_INTERVAL', default=30, cast=int)
+
+# Geocoding results are cached by normalized address (forward) and grid cell (reverse)
+GEOCODE_CACHE_TTL = config('GEOCODE_CACHE_TTL', default=90 * 24 * 3600, cast=int)  # seconds
+GEOCODE_NEGATIVE_TTL = config('GEOCODE_NEGATIVE_TTL', default=24 * 3600, cast=int)  # seconds
+GEOCODE_CACHE_MAXSIZE = config('GEOCODE_CACHE_MAXSIZE', default=10000, cast=int)
+REVERSE_GEOCODE_CELL_DEGREES = config('REVERSE_GEOCODE_CELL_DEGREES', default=0.01, cast=float)
+
+# District boundary polygons (GeoJSON) for offline reverse geocoding; Nominatim is used when absent
+REGION_BOUNDARIES_PATH = config('REGION_BOUNDARIES_PATH', default=str(BASE_DIR / 'crop_predictor' / 'data' / 'boundaries.geojson'))
+REGION_BOUNDARIES_REGION_FIELD = config('REGION_BOUNDARIES_REGION_FIELD', default='region')
+REGION_BOUNDARIES_DISTRICT_FIELD = config('REGION_BOUNDARIES_DISTRICT_FIELD', default='district')
+
+# Weather is cached per grid cell of WEATHER_CACHE_CELL_DEGREES (0.1° ≈ 11 km); concurrent
+# misses for one cell wait up to WEATHER_FETCH_LEASE seconds for a single upstream call
+WEATHER_CACHE_CELL_DEGREES = config('WEATHER_CACHE_CELL_DEGREES', default=0.1, cast=float)
+WEATHER_CACHE_TTL = config('WEATHER_CACHE_TTL', default=20 * 60, cast=int)  # seconds
+WEATHER_NEGATIVE_TTL = config('WEATHER_NEGATIVE_TTL', default=60, cast=int)  # seconds
+WEATHER_CACHE_MAXSIZE = config('WEATHER_CACHE_MAXSIZE', default=5000, cast=int)
+WEATHER_FETCH_LEASE = config('WEATHER_FETCH_LEASE', default=15, cast=int)  # seconds
+
 # Django AllAuth settings
 SITE_ID = 1
 AUTHENTICATION_BACKENDS = [
@@ -12,6 +12,7 @@ urlpatterns = [
     path('api/auth/', include('authentication.urls')),
     path('api/bot/', include('bot.urls')),
     path('api/education/', include('education.urls')),
+    path('api/models/', include('prediction_api.urls')),
 ] 
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -0,0 +1,117 @@
+"""
+Micro-batching for disease model inference.
+
+Concurrent requests put their preprocessed (1, 224, 224, 3) tensors on a
+queue. One worker thread collects them into a batch until it holds
+DISEASE_BATCH_MAX_SIZE tensors or DISEASE_BATCH_MAX_WAIT_MS has passed since
+the first one arrived, runs a single forward pass and hands each caller its
+own row of the output.
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import numpy as np
+
+
+class QueueFullError(RuntimeError):
+    """Raised when more requests are waiting than the queue allows."""
+
+
+class MicroBatcher:
+    def __init__(self, predict_batch, max_batch_size=16, max_wait_ms=5, max_queue=256):
+        self.predict_batch = predict_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0, max_wait_ms) / 1000
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._worker = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._errors = 0
+        self._last_batch_size = 0
+        self._max_queue_depth = 0
+        self._batch_sizes = {}
+        self._wait_seconds = 0.0
+
+    def _ensure_worker(self):
+        # Started on first use, and again in a forked child, which does not inherit threads
+        if self._worker is None or self._pid != os.getpid() or not self._worker.is_alive():
+            with self._start_lock:
+                if self._worker is None or self._pid != os.getpid() or not self._worker.is_alive():
+                    if self._pid != os.getpid():
+                        self._queue = queue.Queue(maxsize=self._queue.maxsize)
+                    self._pid = os.getpid()
+                    self._worker = threading.Thread(target=self._run, name="disease-batcher", daemon=True)
+                    self._worker.start()
+
+    def submit(self, tensor):
+        """Queues one (1, H, W, C) tensor; the returned future resolves to its prediction row."""
+        self._ensure_worker()
+        future = Future()
+        try:
+            self._queue.put_nowait((tensor, future, time.monotonic()))
+        except queue.Full:
+            raise QueueFullError("Disease detection is busy, please try again shortly.")
+        with self._stats_lock:
+            self._max_queue_depth = max(self._max_queue_depth, self._queue.qsize())
+        return future
+
+    def predict(self, tensor, timeout=None):
+        return self.submit(tensor).result(timeout=timeout)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.monotonic()
+            try:
+                outputs = self.predict_batch(np.concatenate([tensor for tensor, _, _ in batch]))
+            except Exception as e:
+                with self._stats_lock:
+                    self._errors += 1
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            for row, (_, future, _) in zip(outputs, batch):
+                future.set_result(row)
+
+            with self._stats_lock:
+                self._batches += 1
+                self._items += len(batch)
+                self._last_batch_size = len(batch)
+                self._batch_sizes[len(batch)] = self._batch_sizes.get(len(batch), 0) + 1
+                self._wait_seconds += sum(started - queued for _, _, queued in batch)
+
+    def metrics(self):
+        with self._stats_lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self._max_queue_depth,
+                "queue_capacity": self._queue.maxsize,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+                "batches": self._batches,
+                "items": self._items,
+                "errors": self._errors,
+                "last_batch_size": self._last_batch_size,
+                "mean_batch_size": round(self._items / self._batches, 3) if self._batches else 0,
+                "mean_queue_wait_ms": round(self._wait_seconds / self._items * 1000, 3) if self._items else 0,
+                "batch_sizes": {str(size): count for size, count in sorted(self._batch_sizes.items())},
+            }
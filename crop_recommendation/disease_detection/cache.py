@@ -0,0 +1,142 @@
+"""
+Result cache for repeated disease-detection uploads.
+
+An upload is first looked up by the SHA-256 of its bytes. If that misses,
+it is looked up by perceptual hashes of the decoded image, so a re-encoded,
+resized or forwarded copy of the same photo also hits. Both a pHash (DCT)
+and a dHash (gradient) must be within `max_distance` bits; two different
+leaf photos rarely match on both. Entries are evicted least recently used.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+import cv2
+import numpy as np
+
+# Content hashes remembered per entry for near-duplicates that hit it
+MAX_ALIASES = 16
+
+_BIT_WEIGHTS = (1 << np.arange(63, -1, -1, dtype=np.uint64)).astype(np.uint64)
+
+
+def _pack_bits(bits):
+    return np.uint64(np.bitwise_or.reduce(_BIT_WEIGHTS[bits.ravel()]))
+
+
+def perceptual_hashes(img):
+    """Returns (phash, dhash) of a decoded BGR image as 64-bit integers."""
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].ravel()
+    # The DC term only reflects overall brightness
+    phash = _pack_bits(low > np.median(low[1:]))
+
+    tiny = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA).astype(np.int16)
+    dhash = _pack_bits(tiny[:, 1:] > tiny[:, :-1])
+    return phash, dhash
+
+
+def content_hash(data):
+    return hashlib.sha256(data).digest()
+
+
+class PerceptualCache:
+    def __init__(self, maxsize=2048, max_distance=6):
+        self.maxsize = maxsize
+        self.max_distance = max_distance
+        self._lock = threading.Lock()
+        self._order = OrderedDict()  # slot -> None, least recently used first
+        self._digests = {}  # content hash -> slot
+        self._slot_digests = [set() for _ in range(maxsize)]
+        self._results = [None] * maxsize
+        self._phashes = np.zeros(maxsize, dtype=np.uint64)
+        self._dhashes = np.zeros(maxsize, dtype=np.uint64)
+        self._used = np.zeros(maxsize, dtype=bool)
+        self._owner = None
+        self._exact_hits = 0
+        self._similar_hits = 0
+        self._misses = 0
+
+    def bind(self, model):
+        """Drops every entry when the model changes, so results always come from the current one."""
+        with self._lock:
+            if model is not self._owner:
+                self._owner = model
+                self._clear()
+
+    def _clear(self):
+        self._order.clear()
+        self._digests.clear()
+        for digests in self._slot_digests:
+            digests.clear()
+        self._results = [None] * self.maxsize
+        self._used[:] = False
+
+    def _hit(self, slot):
+        self._order.move_to_end(slot)
+        return dict(self._results[slot])
+
+    def get_exact(self, digest):
+        with self._lock:
+            slot = self._digests.get(digest)
+            if slot is None:
+                return None
+            self._exact_hits += 1
+            return self._hit(slot)
+
+    def get_similar(self, phash, dhash, digest=None):
+        """Returns the result of the closest cached image within max_distance bits, or None."""
+        with self._lock:
+            if self.max_distance < 0 or not self._used.any():
+                self._misses += 1
+                return None
+            distance = np.maximum(
+                np.bitwise_count(self._phashes ^ phash), np.bitwise_count(self._dhashes ^ dhash)
+            ).astype(np.int16)
+            distance[~self._used] = np.iinfo(np.int16).max
+            slot = int(np.argmin(distance))
+            if distance[slot] > self.max_distance:
+                self._misses += 1
+                return None
+            self._similar_hits += 1
+            if digest is not None and len(self._slot_digests[slot]) < MAX_ALIASES:
+                # The next identical resend then takes the exact path
+                self._digests[digest] = slot
+                self._slot_digests[slot].add(digest)
+            return self._hit(slot)
+
+    def set(self, digest, phash, dhash, result):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            if digest in self._digests:
+                slot = self._digests[digest]
+            elif len(self._order) < self.maxsize:
+                slot = int(np.argmin(self._used))
+            else:
+                slot, _ = self._order.popitem(last=False)
+                for old in self._slot_digests[slot]:
+                    self._digests.pop(old, None)
+                self._slot_digests[slot].clear()
+
+            self._digests[digest] = slot
+            self._slot_digests[slot].add(digest)
+            self._results[slot] = dict(result)
+            self._phashes[slot] = phash
+            self._dhashes[slot] = dhash
+            self._used[slot] = True
+            self._order[slot] = None
+            self._order.move_to_end(slot)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._order),
+                "maxsize": self.maxsize,
+                "max_distance": self.max_distance,
+                "exact_hits": self._exact_hits,
+                "similar_hits": self._similar_hits,
+                "misses": self._misses,
+            }
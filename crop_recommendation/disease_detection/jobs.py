@@ -0,0 +1,174 @@
+"""
+Submit/poll mode for disease detection.
+
+Uploads are stored as DiseaseDetectionJob rows, which act as the queue.
+Workers claim a job with a conditional UPDATE, so any number of threads and
+processes (web workers, `manage.py run_disease_jobs`) can share the table
+without taking a job twice. A job left running longer than
+DISEASE_JOB_TIMEOUT (its worker died), or put back because the model's queue
+was full, is claimed again, up to DISEASE_JOB_MAX_ATTEMPTS times.
+"""
+
+import io
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F, Q
+from django.utils import timezone
+from .batching import QueueFullError
+from .models import DiseaseDetectionJob
+
+# Seconds a worker waits after putting a job back on a full model queue, doubled per attempt
+BUSY_RETRY_DELAY = 0.5
+
+# Seconds between deletions of jobs finished more than DISEASE_JOB_RETENTION ago
+PURGE_INTERVAL = 3600
+
+
+def _claimable(now):
+    stale = now - timedelta(seconds=settings.DISEASE_JOB_TIMEOUT)
+    return Q(status=DiseaseDetectionJob.PENDING) | Q(status=DiseaseDetectionJob.RUNNING, started_at__lt=stale)
+
+
+def claim_next_job():
+    """Marks the oldest claimable job as running and returns it, or None if there is none."""
+    while True:
+        now = timezone.now()
+        candidates = DiseaseDetectionJob.objects.filter(_claimable(now)).order_by('created_at')
+        job_id = candidates.values_list('id', flat=True).first()
+        if job_id is None:
+            return None
+        claimed = DiseaseDetectionJob.objects.filter(_claimable(now), id=job_id).update(
+            status=DiseaseDetectionJob.RUNNING, started_at=now, attempts=F('attempts') + 1
+        )
+        if claimed:
+            return DiseaseDetectionJob.objects.get(id=job_id)
+        # Another worker took it first; try the next one
+
+
+def run_job(job):
+    """
+    Runs detection for a claimed job and stores the result or the error.
+    Returns False when the model was too busy and the job went back to pending.
+    """
+    from .utils import predict_disease
+
+    if job.attempts > settings.DISEASE_JOB_MAX_ATTEMPTS:
+        finish_job(job, error="Detection did not finish after several attempts.")
+        return True
+
+    try:
+        result = predict_disease(io.BytesIO(bytes(job.image)))
+    except QueueFullError as e:
+        # Overload is temporary; only the last attempt turns it into a failure
+        if job.attempts < settings.DISEASE_JOB_MAX_ATTEMPTS:
+            requeue_job(job)
+            return False
+        finish_job(job, error=str(e))
+    except Exception as e:
+        finish_job(job, error=str(e) or 'Prediction failed.')
+    else:
+        finish_job(job, result=result)
+    return True
+
+
+def requeue_job(job):
+    DiseaseDetectionJob.objects.filter(id=job.id, status=DiseaseDetectionJob.RUNNING).update(
+        status=DiseaseDetectionJob.PENDING, started_at=None
+    )
+
+
+def finish_job(job, result=None, error=''):
+    DiseaseDetectionJob.objects.filter(id=job.id, status=DiseaseDetectionJob.RUNNING).update(
+        status=DiseaseDetectionJob.FAILED if error else DiseaseDetectionJob.DONE,
+        result=result,
+        error=error,
+        image=b'',
+        finished_at=timezone.now(),
+    )
+
+
+def run_pending_jobs(limit=None):
+    """Processes jobs until the queue is empty (or `limit` jobs ran); returns how many ran."""
+    count = 0
+    while limit is None or count < limit:
+        job = claim_next_job()
+        if job is None:
+            break
+        if not run_job(job):
+            time.sleep(BUSY_RETRY_DELAY * 2 ** (job.attempts - 1))
+        count += 1
+    return count
+
+
+def purge_finished_jobs(older_than):
+    """Deletes finished jobs older than `older_than` seconds."""
+    cutoff = timezone.now() - timedelta(seconds=older_than)
+    deleted, _ = DiseaseDetectionJob.objects.filter(
+        status__in=[DiseaseDetectionJob.DONE, DiseaseDetectionJob.FAILED], finished_at__lt=cutoff
+    ).delete()
+    return deleted
+
+
+class JobRunner:
+    """
+    Runs queued jobs inside a web worker on at most `workers` threads.
+    wake() starts a draining thread, or tells a busy one to look at the queue again.
+    Draining threads also purge old finished jobs, at most once per PURGE_INTERVAL.
+    """
+
+    def __init__(self, workers):
+        self.workers = max(1, workers)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='disease-job')
+        self._lock = threading.Lock()
+        self._active = 0
+        self._woken = False
+        self._purged_at = None
+
+    def wake(self):
+        with self._lock:
+            self._woken = True
+            if self._active >= self.workers:
+                return
+            self._active += 1
+        self._executor.submit(self._drain)
+
+    def _drain(self):
+        try:
+            while True:
+                with self._lock:
+                    self._woken = False
+                try:
+                    run_pending_jobs()
+                    self._purge_if_due()
+                except Exception as e:
+                    print(f"Disease job runner error: {e}")
+                with self._lock:
+                    # A job queued after our last empty claim must not be left waiting
+                    if not self._woken:
+                        self._active -= 1
+                        return
+        finally:
+            close_old_connections()
+
+    def _purge_if_due(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._purged_at is not None and now - self._purged_at < PURGE_INTERVAL:
+                return
+            self._purged_at = now
+        purge_finished_jobs(settings.DISEASE_JOB_RETENTION)
+
+
+runner = JobRunner(settings.DISEASE_JOB_WORKERS)
+
+
+def submit_job(image_bytes):
+    """Queues an image and returns the job; it runs in this process unless DISEASE_JOBS_IN_PROCESS is off."""
+    job = DiseaseDetectionJob.objects.create(image=image_bytes)
+    if settings.DISEASE_JOBS_IN_PROCESS:
+        runner.wake()
+    return job
@@ -0,0 +1,87 @@
+import os
+import time
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from disease_detection.utils import CLASS_NAMES, TFLiteModel
+from .export_disease_tflite import find_images, load_input
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the Keras and TFLite disease models on a labelled folder: "
+        "<folder>/<class name>/<image>. Reports accuracy, top-1 agreement and latency."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("folder", help="One sub-folder per class, named as in class_indices.json")
+        parser.add_argument("--model", default=None, help="Keras model (default: ML_MODELS['disease']['path'])")
+        parser.add_argument("--tflite", default=None, help="TFLite model (default: ML_MODELS['disease']['tflite_path'])")
+        parser.add_argument("--limit", type=int, default=None, help="Images to evaluate at most")
+
+    def handle(self, *args, **options):
+        import tensorflow as tf
+
+        config = settings.ML_MODELS["disease"]
+        tflite_path = options["tflite"] or config["tflite_path"]
+        if not os.path.exists(tflite_path):
+            raise CommandError(f"{tflite_path} does not exist; run export_disease_tflite first")
+
+        keras_model = tf.keras.models.load_model(options["model"] or config["path"])
+        tflite_model = TFLiteModel(tflite_path, num_threads=settings.DISEASE_TFLITE_THREADS)
+
+        class_index = {name.casefold(): index for index, name in enumerate(CLASS_NAMES)}
+        images = find_images(options["folder"])[:options["limit"]]
+        if not images:
+            raise CommandError(f"No images found in {options['folder']}")
+
+        # Warm both up so the first image's timing is not the graph build
+        warm = np.zeros((1, 224, 224, 3), dtype=np.float32)
+        keras_model.predict(warm, verbose=0)
+        tflite_model.predict(warm)
+
+        keras_times, tflite_times = [], []
+        keras_correct = tflite_correct = agree = labelled = 0
+        max_difference = 0.0
+        for path in images:
+            try:
+                batch = load_input(path)
+            except ValueError:
+                self.stderr.write(f"Skipping unreadable {path}")
+                continue
+
+            start = time.perf_counter()
+            keras_scores = keras_model.predict(batch, verbose=0)[0]
+            keras_times.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            tflite_scores = tflite_model.predict(batch)[0]
+            tflite_times.append(time.perf_counter() - start)
+
+            keras_top, tflite_top = int(np.argmax(keras_scores)), int(np.argmax(tflite_scores))
+            agree += keras_top == tflite_top
+            max_difference = max(max_difference, float(np.abs(keras_scores - tflite_scores).max()))
+
+            label = class_index.get(os.path.basename(os.path.dirname(path)).casefold())
+            if label is not None:
+                labelled += 1
+                keras_correct += keras_top == label
+                tflite_correct += tflite_top == label
+
+        evaluated = len(keras_times)
+        if not evaluated:
+            raise CommandError("No image could be read")
+
+        self.stdout.write(f"Images: {evaluated} ({labelled} with a known class folder)")
+        self.stdout.write(f"Top-1 agreement: {agree / evaluated:.2%}")
+        self.stdout.write(f"Largest probability difference: {max_difference:.4f}")
+        if labelled:
+            self.stdout.write(
+                f"Accuracy: keras {keras_correct / labelled:.2%}, tflite {tflite_correct / labelled:.2%}"
+            )
+        for name, times in (("keras", keras_times), ("tflite", tflite_times)):
+            ms = np.array(times) * 1000
+            self.stdout.write(
+                f"Latency {name}: mean {ms.mean():.1f} ms, p50 {np.percentile(ms, 50):.1f} ms, "
+                f"p95 {np.percentile(ms, 95):.1f} ms"
+            )
+        self.stdout.write(f"Speedup: {np.mean(keras_times) / np.mean(tflite_times):.1f}x")
@@ -0,0 +1,91 @@
+import os
+import random
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from disease_detection.utils import decode_image, preprocess_image
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def find_images(directory):
+    """Image files under `directory`, recursively, in a stable order."""
+    paths = []
+    for root, _, files in os.walk(directory):
+        paths.extend(os.path.join(root, name) for name in files if name.lower().endswith(IMAGE_EXTENSIONS))
+    return sorted(paths)
+
+
+def load_input(path):
+    """Reads an image file into a model input exactly as predict_disease does."""
+    with open(path, "rb") as f:
+        return preprocess_image(decode_image(f.read()))
+
+
+class Command(BaseCommand):
+    help = (
+        "Converts the Keras disease model to TFLite with int8 or float16 quantization. "
+        "int8 is calibrated on a representative image folder. "
+        "Serve it with DISEASE_MODEL_BACKEND=tflite."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--quantization", choices=["int8", "float16", "dynamic"], default="int8")
+        parser.add_argument("--calibration-dir", default=None, help="Representative images (required for int8)")
+        parser.add_argument("--samples", type=int, default=200, help="Calibration images to use")
+        parser.add_argument("--model", default=None, help="Keras model (default: ML_MODELS['disease']['path'])")
+        parser.add_argument("--output", default=None, help="Output file (default: ML_MODELS['disease']['tflite_path'])")
+
+    def handle(self, *args, **options):
+        import tensorflow as tf
+
+        config = settings.ML_MODELS["disease"]
+        model_path = options["model"] or config["path"]
+        output = options["output"] or config["tflite_path"]
+        quantization = options["quantization"]
+
+        try:
+            model = tf.keras.models.load_model(model_path)
+        except Exception as e:
+            raise CommandError(f"Could not load {model_path}: {e}")
+
+        converter = tf.lite.TFLiteConverter.from_keras_model(model)
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+        if quantization == "float16":
+            converter.target_spec.supported_types = [tf.float16]
+        elif quantization == "int8":
+            if not options["calibration_dir"]:
+                raise CommandError("int8 quantization needs --calibration-dir")
+            images = find_images(options["calibration_dir"])
+            if not images:
+                raise CommandError(f"No images found in {options['calibration_dir']}")
+            random.Random(0).shuffle(images)
+            images = images[:options["samples"]]
+            self.stdout.write(f"Calibrating on {len(images)} images")
+
+            def representative_dataset():
+                for path in images:
+                    try:
+                        yield [load_input(path).astype(np.float32)]
+                    except ValueError:
+                        continue
+
+            converter.representative_dataset = representative_dataset
+            # Integer kernels throughout; inputs and outputs stay float32 so callers need no changes
+            converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+
+        try:
+            flatbuffer = converter.convert()
+        except Exception as e:
+            raise CommandError(f"Conversion failed: {e}")
+
+        temporary = output + ".tmp"
+        with open(temporary, "wb") as f:
+            f.write(flatbuffer)
+        os.replace(temporary, output)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {output} ({quantization}, {len(flatbuffer) / 1e6:.1f} MB; "
+            f"Keras file is {os.path.getsize(model_path) / 1e6:.1f} MB)"
+        ))
@@ -0,0 +1,57 @@
+import threading
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from disease_detection.jobs import PURGE_INTERVAL, purge_finished_jobs, run_pending_jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Processes queued disease detection jobs on a pool of worker threads. "
+        "Run it alongside the web server (optionally with DISEASE_JOBS_IN_PROCESS=False)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=None, help="Worker threads (default: DISEASE_JOB_WORKERS)")
+        parser.add_argument("--poll-interval", type=float, default=1.0, help="Seconds to wait when the queue is empty")
+        parser.add_argument("--once", action="store_true", help="Process the current queue and exit")
+
+    def handle(self, *args, **options):
+        if options["once"]:
+            count = run_pending_jobs()
+            self.stdout.write(f"Processed {count} job(s).")
+            return
+
+        workers = max(1, options["workers"] or settings.DISEASE_JOB_WORKERS)
+        stop = threading.Event()
+
+        def work():
+            while not stop.is_set():
+                try:
+                    ran = run_pending_jobs(limit=10)
+                except Exception as e:
+                    print(f"Disease job worker error: {e}")
+                    ran = 0
+                finally:
+                    close_old_connections()
+                if not ran:
+                    stop.wait(options["poll_interval"])
+
+        threads = [threading.Thread(target=work, daemon=True) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        self.stdout.write(f"Processing disease jobs with {workers} worker(s).")
+
+        try:
+            while True:
+                deleted = purge_finished_jobs(settings.DISEASE_JOB_RETENTION)
+                if deleted:
+                    self.stdout.write(f"Deleted {deleted} finished job(s).")
+                close_old_connections()
+                time.sleep(PURGE_INTERVAL)
+        except KeyboardInterrupt:
+            stop.set()
+            for thread in threads:
+                thread.join()
+            self.stdout.write("Stopped.")
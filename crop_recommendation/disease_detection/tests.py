@@ -1,3 +1,474 @@
-from django.test import TestCase
+import io
+import os
+import tempfile
+import threading
+import time
+import uuid
+from datetime import timedelta
+from unittest import mock
+import cv2
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from . import jobs, utils
+from .batching import MicroBatcher, QueueFullError
+from .cache import PerceptualCache, content_hash, perceptual_hashes
+from .models import DiseaseDetectionJob
 
-# Create your tests here.
+
+@override_settings(DISEASE_JOB_MAX_ATTEMPTS=3, DISEASE_JOB_TIMEOUT=300)
+class DiseaseJobTests(TestCase):
+
+    def setUp(self):
+        self.job = DiseaseDetectionJob.objects.create(image=b"image")
+        sleep = mock.patch.object(jobs.time, "sleep")
+        self.sleep = sleep.start()
+        self.addCleanup(sleep.stop)
+
+    def run_with(self, **predict):
+        with mock.patch("disease_detection.utils.predict_disease", **predict) as predict_disease:
+            jobs.run_pending_jobs()
+        self.job.refresh_from_db()
+        return predict_disease
+
+    def test_result_is_stored(self):
+        self.run_with(return_value={"disease": "Tomato___Late_blight"})
+        self.assertEqual(self.job.status, DiseaseDetectionJob.DONE)
+        self.assertEqual(self.job.result, {"disease": "Tomato___Late_blight"})
+        self.assertEqual(self.job.image, b"")
+
+    def test_error_fails_the_job(self):
+        self.run_with(side_effect=ValueError("Image is not a plant."))
+        self.assertEqual(self.job.status, DiseaseDetectionJob.FAILED)
+        self.assertEqual(self.job.error, "Image is not a plant.")
+
+    def test_full_queue_is_retried(self):
+        predict = self.run_with(side_effect=[QueueFullError("busy"), {"disease": "healthy"}])
+        self.assertEqual(predict.call_count, 2)
+        self.assertEqual(self.job.status, DiseaseDetectionJob.DONE)
+        self.assertEqual(self.job.attempts, 2)
+        self.sleep.assert_called_once()
+
+    def test_full_queue_fails_after_max_attempts(self):
+        predict = self.run_with(side_effect=QueueFullError("busy"))
+        self.assertEqual(predict.call_count, 3)
+        self.assertEqual(self.job.status, DiseaseDetectionJob.FAILED)
+        self.assertEqual(self.job.error, "busy")
+
+    def test_stale_running_job_is_claimed_again(self):
+        DiseaseDetectionJob.objects.filter(id=self.job.id).update(
+            status=DiseaseDetectionJob.RUNNING, attempts=1, started_at=timezone.now() - timedelta(seconds=60)
+        )
+        self.assertIsNone(jobs.claim_next_job())
+        DiseaseDetectionJob.objects.filter(id=self.job.id).update(started_at=timezone.now() - timedelta(seconds=600))
+        claimed = jobs.claim_next_job()
+        self.assertEqual(claimed.id, self.job.id)
+        self.assertEqual(claimed.attempts, 2)
+
+    def test_purge_finished_jobs(self):
+        self.run_with(return_value={"disease": "healthy"})
+        self.assertEqual(jobs.purge_finished_jobs(3600), 0)
+        DiseaseDetectionJob.objects.filter(id=self.job.id).update(finished_at=timezone.now() - timedelta(hours=2))
+        self.assertEqual(jobs.purge_finished_jobs(3600), 1)
+
+
+    @override_settings(DISEASE_JOB_RETENTION=3600)
+    def test_in_process_runner_purges_old_jobs(self):
+        def finished(age):
+            return DiseaseDetectionJob.objects.create(
+                status=DiseaseDetectionJob.DONE, finished_at=timezone.now() - timedelta(seconds=age)
+            )
+
+        def drain():
+            runner._active = 1
+            runner._drain()
+
+        self.job.delete()
+        old, recent = finished(7200), finished(600)
+        runner = jobs.JobRunner(1)
+        with mock.patch.object(jobs, "close_old_connections"):
+            drain()
+            self.assertFalse(DiseaseDetectionJob.objects.filter(id=old.id).exists())
+            self.assertTrue(DiseaseDetectionJob.objects.filter(id=recent.id).exists())
+
+            # At most once per PURGE_INTERVAL
+            older = finished(7200)
+            drain()
+            self.assertTrue(DiseaseDetectionJob.objects.filter(id=older.id).exists())
+            with mock.patch.object(jobs.time, "monotonic", return_value=time.monotonic() + jobs.PURGE_INTERVAL):
+                drain()
+            self.assertFalse(DiseaseDetectionJob.objects.filter(id=older.id).exists())
+        runner._executor.shutdown()
+
+class DiseaseMetricsTests(TestCase):
+
+    def test_staff_only(self):
+        url = reverse('disease-metrics')
+        self.assertIn(self.client.get(url).status_code, (401, 403))
+        user = get_user_model().objects.create_user(username='farmer', password='x')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        user.is_staff = True
+        user.save()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('cache', response.json())
+
+
+def encode_image(color=(40, 160, 40), size=(80, 100), ext=".png", seed=0):
+    """
+    A (height, width) BGR image of one colour under a coarse brightness pattern
+    picked by `seed`, so images with different seeds have different perceptual hashes.
+    """
+    pattern = np.random.default_rng(seed).integers(-30, 31, (8, 8)).astype(np.float32)
+    shade = cv2.resize(pattern, (size[1], size[0]), interpolation=cv2.INTER_NEAREST)
+    img = np.clip(np.asarray(color, dtype=np.float32) + shade[..., None], 0, 255).astype(np.uint8)
+    return cv2.imencode(ext, img)[1].tobytes()
+
+
+def upload(data, name="leaf.png"):
+    return SimpleUploadedFile(name, data, content_type="image/png")
+
+
+class FakeDiseaseModel:
+    """Predicts class `label` for every image."""
+
+    def __init__(self, label=3):
+        self.label = label
+        self.calls = []
+
+    def predict(self, batch, verbose=0):
+        self.calls.append(len(batch))
+        output = np.full((len(batch), len(utils.CLASS_NAMES)), 0.01, dtype=np.float32)
+        output[:, self.label] = 0.9
+        return output
+
+
+class ImageDecodingTests(TestCase):
+
+    def test_decodes_bytes_and_files_in_memory(self):
+        data = encode_image()
+        from_bytes = utils.decode_image(data)
+        from_file = utils.decode_image(io.BytesIO(data))
+        self.assertEqual(from_bytes.shape, (80, 100, 3))
+        np.testing.assert_array_equal(from_bytes, from_file)
+
+    def test_unreadable_image(self):
+        with self.assertRaises(ValueError):
+            utils.decode_image(b"not an image")
+
+    def test_preprocess_resizes_and_converts_to_rgb(self):
+        img = np.zeros((80, 100, 3), dtype=np.uint8)
+        img[..., 0] = 255
+        batch = utils.preprocess_image(img)
+        self.assertEqual(batch.shape, (1, 224, 224, 3))
+        self.assertEqual(batch.dtype, np.float32)
+        np.testing.assert_allclose(batch[0, 0, 0], [0.0, 0.0, 1.0])
+
+    def test_plant_check(self):
+        self.assertTrue(utils.is_valid_plant_image(utils.decode_image(encode_image())))
+        self.assertFalse(utils.is_valid_plant_image(utils.decode_image(encode_image(color=(128, 128, 128)))))
+
+    @override_settings(DISEASE_BATCHING=False)
+    def test_predict_disease(self):
+        model = FakeDiseaseModel()
+        with mock.patch.object(utils.registry, "get", return_value=model):
+            result = utils.predict_disease(io.BytesIO(encode_image(seed=1)))
+            with self.assertRaisesMessage(ValueError, "Image is not a plant."):
+                utils.predict_disease(io.BytesIO(encode_image(color=(128, 128, 128), seed=2)))
+        self.assertEqual(result["disease"], utils.CLASS_NAMES[3])
+        self.assertEqual(result["confidence"], 0.9)
+        self.assertEqual(model.calls, [1])
+
+
+class MicroBatcherTests(TestCase):
+
+    def test_concurrent_requests_share_a_forward_pass(self):
+        batches = []
+
+        def predict_batch(batch):
+            batches.append(len(batch))
+            return batch[:, 0, 0, :] * 2
+
+        batcher = MicroBatcher(predict_batch, max_batch_size=8, max_wait_ms=200)
+        tensors = [np.full((1, 2, 2, 3), i, dtype=np.float32) for i in range(5)]
+        futures = [batcher.submit(tensor) for tensor in tensors]
+        for i, future in enumerate(futures):
+            np.testing.assert_array_equal(future.result(timeout=5), [2 * i] * 3)
+        self.assertEqual(batches, [5])
+
+        metrics = batcher.metrics()
+        self.assertEqual((metrics["batches"], metrics["items"]), (1, 5))
+        self.assertEqual(metrics["batch_sizes"], {"5": 1})
+
+    def test_batches_are_capped(self):
+        batches = []
+        batcher = MicroBatcher(lambda batch: batches.append(len(batch)) or batch, max_batch_size=2, max_wait_ms=200)
+        futures = [batcher.submit(np.zeros((1, 1))) for _ in range(5)]
+        for future in futures:
+            future.result(timeout=5)
+        self.assertEqual(batches, [2, 2, 1])
+
+    def test_errors_reach_every_caller(self):
+        batcher = MicroBatcher(mock.Mock(side_effect=RuntimeError("Model not loaded.")), max_wait_ms=50)
+        futures = [batcher.submit(np.zeros((1, 1))) for _ in range(3)]
+        for future in futures:
+            with self.assertRaisesMessage(RuntimeError, "Model not loaded."):
+                future.result(timeout=5)
+        self.assertEqual(batcher.metrics()["errors"], 1)
+
+    def test_full_queue(self):
+        release = threading.Event()
+        batcher = MicroBatcher(lambda batch: release.wait(5) and batch, max_batch_size=1, max_wait_ms=0, max_queue=2)
+        try:
+            batcher.submit(np.zeros((1, 1)))
+            # The worker holds the first tensor; two more fill the queue
+            time.sleep(0.1)
+            batcher.submit(np.zeros((1, 1)))
+            batcher.submit(np.zeros((1, 1)))
+            with self.assertRaises(QueueFullError):
+                batcher.submit(np.zeros((1, 1)))
+        finally:
+            release.set()
+
+
+class TFLiteBackendTests(TestCase):
+    """Exports a tiny Keras model with export_disease_tflite and serves it through TFLiteModel."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        import tensorflow as tf
+
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.model_path = os.path.join(cls.directory.name, "model.keras")
+        tf.keras.utils.set_random_seed(0)
+        cls.keras_model = tf.keras.Sequential([
+            tf.keras.Input((224, 224, 3)),
+            tf.keras.layers.Conv2D(4, 3, strides=4, activation="relu"),
+            tf.keras.layers.GlobalAveragePooling2D(),
+            tf.keras.layers.Dense(len(utils.CLASS_NAMES), activation="softmax"),
+        ])
+        cls.keras_model.save(cls.model_path)
+
+        cls.calibration_dir = os.path.join(cls.directory.name, "calibration")
+        os.makedirs(cls.calibration_dir)
+        for seed in range(8):
+            with open(os.path.join(cls.calibration_dir, f"{seed}.png"), "wb") as f:
+                f.write(encode_image(seed=seed))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+        super().tearDownClass()
+
+    def export(self, quantization):
+        output = os.path.join(self.directory.name, f"model-{quantization}.tflite")
+        call_command(
+            "export_disease_tflite", quantization=quantization, calibration_dir=self.calibration_dir,
+            model=self.model_path, output=output, stdout=io.StringIO(),
+        )
+        return output
+
+    def inputs(self, count):
+        return np.concatenate([
+            utils.preprocess_image(utils.decode_image(encode_image(seed=seed))) for seed in range(count)
+        ])
+
+    def test_float16_matches_keras_across_batch_sizes(self):
+        model = utils.TFLiteModel(self.export("float16"))
+        for count in (1, 3, 2):
+            with self.subTest(count=count):
+                batch = self.inputs(count)
+                np.testing.assert_allclose(
+                    model.predict(batch), self.keras_model.predict(batch, verbose=0), atol=1e-3
+                )
+
+    def test_int8_is_close_to_keras(self):
+        model = utils.TFLiteModel(self.export("int8"))
+        # Integer kernels inside, float32 at the edges
+        self.assertIn(np.int8, {tensor["dtype"] for tensor in model.interpreter.get_tensor_details()})
+        self.assertEqual(model.input["dtype"], np.float32)
+        batch = self.inputs(4)
+        output = model.predict(batch)
+        self.assertEqual(output.dtype, np.float32)
+        np.testing.assert_allclose(output, self.keras_model.predict(batch, verbose=0), atol=0.02)
+
+    def test_int8_needs_calibration_images(self):
+        with self.assertRaisesMessage(CommandError, "--calibration-dir"):
+            call_command("export_disease_tflite", quantization="int8", model=self.model_path, stdout=io.StringIO())
+
+    @override_settings(DISEASE_TFLITE_THREADS=1)
+    def test_registry_config_picks_the_backend(self):
+        path = self.export("dynamic")
+        self.assertIsInstance(utils.load_disease_model({"backend": "tflite", "tflite_path": path}), utils.TFLiteModel)
+
+
+class PerceptualCacheTests(TestCase):
+
+    def entry(self, data):
+        return content_hash(data), *perceptual_hashes(utils.decode_image(data))
+
+    def setUp(self):
+        self.cache = PerceptualCache(maxsize=2)
+        self.cache.bind(object())
+        self.photo = encode_image(seed=1)
+
+    def test_exact_and_reencoded_copies_hit(self):
+        digest, phash, dhash = self.entry(self.photo)
+        self.cache.set(digest, phash, dhash, {"disease": "healthy"})
+        self.assertEqual(self.cache.get_exact(digest), {"disease": "healthy"})
+
+        img = utils.decode_image(self.photo)
+        resent = cv2.imencode(".jpg", cv2.resize(img, (150, 120)), [cv2.IMWRITE_JPEG_QUALITY, 70])[1].tobytes()
+        resent_digest, phash, dhash = self.entry(resent)
+        self.assertIsNone(self.cache.get_exact(resent_digest))
+        self.assertEqual(self.cache.get_similar(phash, dhash, resent_digest), {"disease": "healthy"})
+        # The copy's bytes now take the exact path
+        self.assertEqual(self.cache.get_exact(resent_digest), {"disease": "healthy"})
+
+    def test_different_photo_misses(self):
+        self.cache.set(*self.entry(self.photo), {"disease": "healthy"})
+        _, phash, dhash = self.entry(encode_image(seed=2))
+        self.assertIsNone(self.cache.get_similar(phash, dhash))
+        self.assertEqual(self.cache.stats()["misses"], 1)
+
+    def test_negative_distance_allows_exact_hits_only(self):
+        cache = PerceptualCache(max_distance=-1)
+        digest, phash, dhash = self.entry(self.photo)
+        cache.set(digest, phash, dhash, {"disease": "healthy"})
+        self.assertIsNone(cache.get_similar(phash, dhash))
+        self.assertEqual(cache.get_exact(digest), {"disease": "healthy"})
+
+    def test_least_recently_used_is_evicted(self):
+        entries = [self.entry(encode_image(seed=seed)) for seed in range(3)]
+        self.cache.set(*entries[0], {"n": 0})
+        self.cache.set(*entries[1], {"n": 1})
+        self.cache.get_exact(entries[0][0])
+        self.cache.set(*entries[2], {"n": 2})
+        self.assertEqual(self.cache.get_exact(entries[0][0]), {"n": 0})
+        self.assertIsNone(self.cache.get_exact(entries[1][0]))
+        self.assertEqual(self.cache.stats()["size"], 2)
+
+    def test_new_model_clears_entries(self):
+        digest, phash, dhash = self.entry(self.photo)
+        self.cache.set(digest, phash, dhash, {"disease": "healthy"})
+        self.cache.bind(object())
+        self.assertIsNone(self.cache.get_exact(digest))
+        self.assertIsNone(self.cache.get_similar(phash, dhash))
+
+    def test_results_are_copies(self):
+        digest, phash, dhash = self.entry(self.photo)
+        self.cache.set(digest, phash, dhash, {"disease": "healthy"})
+        self.cache.get_exact(digest)["disease"] = "changed"
+        self.assertEqual(self.cache.get_exact(digest), {"disease": "healthy"})
+
+    @override_settings(DISEASE_BATCHING=False)
+    def test_repeat_upload_skips_the_model(self):
+        model = FakeDiseaseModel()
+        with mock.patch.object(utils.registry, "get", return_value=model):
+            first = utils.predict_disease(io.BytesIO(encode_image(seed=11)))
+            second = utils.predict_disease(io.BytesIO(encode_image(seed=11)))
+        self.assertEqual(first, second)
+        self.assertEqual(model.calls, [1])
+
+
+class LargeUploadTests(TestCase):
+
+    def test_large_jpeg_is_decoded_reduced(self):
+        data = encode_image(size=(1800, 2400), ext=".jpg")
+        for min_side in (256, 224, 500):
+            with self.subTest(min_side=min_side):
+                shorter = min(utils.decode_image(data, min_side=min_side).shape[:2])
+                self.assertGreaterEqual(shorter, min_side)
+                self.assertLess(shorter, 2 * min_side)
+        self.assertEqual(utils.decode_image(data, min_side=0).shape, (1800, 2400, 3))
+
+    def test_large_png_is_shrunk(self):
+        img = utils.decode_image(encode_image(size=(1000, 1200)), min_side=256)
+        self.assertEqual(img.shape, (256, 307, 3))
+
+    def test_small_images_keep_their_size(self):
+        self.assertEqual(utils.decode_image(encode_image(size=(300, 400), ext=".jpg"), min_side=256).shape, (300, 400, 3))
+
+    @override_settings(DISEASE_MAX_IMAGE_PIXELS=1000 * 1000)
+    def test_pixel_limit(self):
+        with self.assertRaisesMessage(ValueError, "more than 1000000 pixels"):
+            utils.decode_image(encode_image(size=(1000, 1001), ext=".jpg"))
+
+    @override_settings(DISEASE_MAX_UPLOAD_BYTES=100)
+    def test_upload_size_limit(self):
+        self.assertEqual(utils.read_upload(io.BytesIO(b"x" * 100)), b"x" * 100)
+        with self.assertRaisesMessage(ValueError, "larger than"):
+            utils.read_upload(io.BytesIO(b"x" * 101))
+        # The declared size is checked before anything is read
+        upload = mock.Mock(size=101)
+        with self.assertRaises(ValueError):
+            utils.read_upload(upload)
+        upload.read.assert_not_called()
+
+
+@override_settings(DISEASE_JOBS_IN_PROCESS=False, DISEASE_BATCHING=False)
+class DiseaseJobViewTests(TestCase):
+
+    def test_submit_then_poll(self):
+        response = self.client.post(reverse('disease-jobs'), {'image': upload(encode_image(seed=21))})
+        self.assertEqual(response.status_code, 202)
+        status_url = response.json()['status_url']
+        self.assertEqual(self.client.get(status_url).json()['status'], DiseaseDetectionJob.PENDING)
+
+        with mock.patch.object(utils.registry, "get", return_value=FakeDiseaseModel()):
+            jobs.run_pending_jobs()
+        job = self.client.get(status_url).json()
+        self.assertEqual(job['status'], DiseaseDetectionJob.DONE)
+        self.assertEqual(job['result']['disease'], utils.CLASS_NAMES[3])
+
+    def test_missing_image_and_unknown_job(self):
+        self.assertEqual(self.client.post(reverse('disease-jobs')).status_code, 400)
+        self.assertEqual(self.client.get(reverse('disease-job', args=[uuid.uuid4()])).status_code, 404)
+
+
+@override_settings(DISEASE_BATCH_MAX_IMAGES=3)
+class DiseaseBatchViewTests(TestCase):
+
+    def post(self, *images):
+        return self.client.post(reverse('disease-detect-batch'), {'images': list(images)})
+
+    def test_images_share_one_forward_pass(self):
+        model = FakeDiseaseModel()
+        with mock.patch.object(utils.registry, "get", return_value=model):
+            response = self.post(
+                upload(encode_image(seed=31), "a.png"),
+                upload(b"not an image", "b.png"),
+                upload(encode_image(seed=32), "c.png"),
+            )
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual(model.calls, [2])
+        self.assertEqual([result['filename'] for result in results], ['a.png', 'b.png', 'c.png'])
+        self.assertEqual(results[0]['disease'], utils.CLASS_NAMES[3])
+        self.assertEqual(results[1]['error'], "Cannot read the image.")
+        self.assertEqual(response.json()['diagnosis']['images'], 2)
+
+    def test_image_limits(self):
+        self.assertEqual(self.post().status_code, 400)
+        images = [upload(encode_image(seed=seed)) for seed in range(4)]
+        self.assertEqual(self.post(*images).status_code, 400)
+
+    def test_diagnosis_votes_by_summed_confidence(self):
+        a, b = utils.CLASS_NAMES[:2]
+        diagnosis = utils.diagnose([
+            {"disease": a, "confidence": 0.5},
+            {"disease": a, "confidence": 0.5},
+            {"disease": b, "confidence": 0.9},
+            {"error": "Image is not a plant."},
+        ])
+        self.assertEqual(diagnosis["disease"], a)
+        self.assertEqual((diagnosis["images"], diagnosis["share"]), (2, 0.6667))
+        self.assertEqual(list(diagnosis["votes"]), [a, b])
+        self.assertIsNone(utils.diagnose([{"error": "Cannot read the image."}]))
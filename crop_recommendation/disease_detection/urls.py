@@ -1,6 +1,10 @@
 from django.urls import path
-from .views import PredictDiseaseView  # <- Make sure this import is present
+from .views import DiseaseJobStatusView, DiseaseJobView, PredictDiseaseBatchView, PredictDiseaseView, disease_metrics  # <- Make sure this import is present
 
 urlpatterns = [
     path("detect", PredictDiseaseView.as_view(), name="disease-detect"),
+    path("detect/batch", PredictDiseaseBatchView.as_view(), name="disease-detect-batch"),
+    path("metrics", disease_metrics, name="disease-metrics"),
+    path("jobs", DiseaseJobView.as_view(), name="disease-jobs"),
+    path("jobs/<uuid:job_id>", DiseaseJobStatusView.as_view(), name="disease-job"),
 ]
@@ -1,24 +1,120 @@
+import io
 import os
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-import tensorflow as tf
-from PIL import Image
 import cv2
-import tempfile
+from PIL import Image
+from django.conf import settings
+from prediction_api import registry, sidecar
+from .batching import MicroBatcher
+from .cache import PerceptualCache, content_hash, perceptual_hashes
 
 # === Paths ===
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-MODEL_PATH = os.path.join(BASE_DIR, "disease_detection", "ml_models", "plant_disease_model1.keras")
 DISEASE_INFO_PATH = os.path.join(BASE_DIR, "disease_detection", "ml_models", "disease_info.json")
 CLASS_INDICES_PATH = os.path.join(BASE_DIR, "disease_detection", "ml_models", "class_indices.json")
 
-# === Load Model ===
-try:
-    model = tf.keras.models.load_model(MODEL_PATH)
-    print("Model loaded successfully.")
-except Exception as e:
-    print(f"Error loading model: {e}")
-    model = None
+# === Model (loaded lazily through the model registry) ===
+def _tflite_interpreter_class():
+    """The lightest available TFLite runtime; TensorFlow itself is the last resort."""
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+
+            Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+
+class TFLiteModel:
+    """
+    A converted (float16 or int8 quantized) model behind the Keras `predict`
+    interface used by the rest of this module. Quantized inputs and outputs
+    are converted with the tensors' own scale and zero point.
+    """
+
+    def __init__(self, path, num_threads=None):
+        self.interpreter = _tflite_interpreter_class()(model_path=path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        self._batch_size = int(self.input["shape"][0])
+        # An interpreter must not be invoked from two threads at once
+        self._lock = threading.Lock()
+
+    def predict(self, batch, verbose=0):
+        batch = np.asarray(batch, dtype=np.float32)
+        with self._lock:
+            if batch.shape[0] != self._batch_size:
+                self.interpreter.resize_tensor_input(self.input["index"], list(batch.shape))
+                self.interpreter.allocate_tensors()
+                self.input = self.interpreter.get_input_details()[0]
+                self.output = self.interpreter.get_output_details()[0]
+                self._batch_size = batch.shape[0]
+
+            scale, zero_point = self.input["quantization"]
+            if scale:
+                info = np.iinfo(self.input["dtype"])
+                batch = np.clip(np.round(batch / scale + zero_point), info.min, info.max)
+            self.interpreter.set_tensor(self.input["index"], batch.astype(self.input["dtype"]))
+            self.interpreter.invoke()
+            output = self.interpreter.get_tensor(self.output["index"])
+
+        scale, zero_point = self.output["quantization"]
+        if scale:
+            output = (output.astype(np.float32) - zero_point) * scale
+        return output
+
+
+def load_disease_model(config):
+    if config.get("backend") == "tflite":
+        return TFLiteModel(config["tflite_path"], num_threads=settings.DISEASE_TFLITE_THREADS)
+
+    import tensorflow as tf
+
+    return tf.keras.models.load_model(config["path"])
+
+
+def disease_model_files(config):
+    return [config.get("tflite_path") if config.get("backend") == "tflite" else config.get("path")]
+
+
+def warm_up_disease_model(model):
+    model.predict(np.zeros((1, 224, 224, 3), dtype=np.float32), verbose=0)
+
+
+registry.register("disease", load_disease_model, warmup=warm_up_disease_model, files=disease_model_files)
+
+
+def predict_disease_batch(batch: np.ndarray) -> np.ndarray:
+    """Runs one forward pass over an (n, 224, 224, 3) batch."""
+    model = registry.get("disease")
+    if model is None:
+        raise RuntimeError("Model not loaded.")
+    return model.predict(batch, verbose=0)
+
+
+# Concurrent requests share forward passes through this batcher
+batcher = MicroBatcher(
+    predict_disease_batch,
+    max_batch_size=settings.DISEASE_BATCH_MAX_SIZE,
+    max_wait_ms=settings.DISEASE_BATCH_MAX_WAIT_MS,
+    max_queue=settings.DISEASE_BATCH_MAX_QUEUE,
+)
+
+# Decoding and validation of multi-image requests (cv2 releases the GIL)
+preprocess_executor = ThreadPoolExecutor(max_workers=settings.DISEASE_PREPROCESS_WORKERS)
+
+# Results of recent uploads, keyed by content and perceptual hashes
+result_cache = PerceptualCache(
+    maxsize=settings.DISEASE_CACHE_MAXSIZE,
+    max_distance=settings.DISEASE_CACHE_MAX_DISTANCE,
+)
 
 # === Load Disease Info ===
 try:
@@ -39,11 +135,62 @@ except Exception as e:
     print(f"Error loading class indices: {e}")
     CLASS_NAMES = []
 
+# === Image Decoding ===
+def read_upload(image_file) -> bytes:
+    """Reads an upload into memory, refusing files over DISEASE_MAX_UPLOAD_BYTES."""
+    limit = settings.DISEASE_MAX_UPLOAD_BYTES
+    too_large = ValueError(f"Image is larger than {limit / (1024 * 1024):g} MB.")
+    if (getattr(image_file, "size", None) or 0) > limit:
+        raise too_large
+    data = image_file.read(limit + 1)
+    if len(data) > limit:
+        raise too_large
+    return data
+
+
+def decode_image(image_file, min_side=None) -> np.ndarray:
+    """
+    Decodes an upload (file-like or bytes) once, in memory, into a BGR uint8 array
+    whose shorter side is close to `min_side` (DISEASE_DECODE_MIN_SIDE; 0 keeps full size).
+    JPEGs are scaled by 1/2, 1/4 or 1/8 while decoding, so full-resolution pixels are never
+    materialized; other formats are decoded and then shrunk.
+    EXIF orientation is ignored so the model sees the pixels as stored, as it did with PIL.
+    """
+    data = image_file if isinstance(image_file, (bytes, bytearray, memoryview)) else image_file.read()
+    min_side = settings.DISEASE_DECODE_MIN_SIDE if min_side is None else min_side
+
+    # The header gives the size without decoding any pixels
+    try:
+        with Image.open(io.BytesIO(data)) as header:
+            width, height = header.size
+            image_format = header.format
+    except Exception:
+        raise ValueError("Cannot read the image.")
+    if width * height > settings.DISEASE_MAX_IMAGE_PIXELS:
+        raise ValueError(f"Image has more than {settings.DISEASE_MAX_IMAGE_PIXELS} pixels.")
+
+    flags = cv2.IMREAD_COLOR
+    if image_format == "JPEG" and min_side:
+        for factor, reduced in ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2)):
+            if min(width, height) // factor >= min_side:
+                flags = reduced
+                break
+
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flags | cv2.IMREAD_IGNORE_ORIENTATION)
+    if img is None:
+        raise ValueError("Cannot read the image.")
+
+    shorter = min(img.shape[:2])
+    if min_side and shorter >= 2 * min_side:
+        scale = min_side / shorter
+        img = cv2.resize(img, (round(img.shape[1] * scale), round(img.shape[0] * scale)), interpolation=cv2.INTER_AREA)
+    return img
+
 # === Image Validation ===
-def is_valid_plant_image(image_path: str, green_threshold=2.0) -> bool:
-    """Check if image contains at least `green_threshold`% green pixels."""
+def is_valid_plant_image(image, green_threshold=2.0) -> bool:
+    """Check if a decoded BGR image (or image path) contains at least `green_threshold`% green pixels."""
     try:
-        img = cv2.imread(image_path)
+        img = cv2.imread(image) if isinstance(image, str) else image
         if img is None:
             return False
         hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
@@ -53,7 +200,7 @@ def is_valid_plant_image(image_path: str, green_threshold=2.0) -> bool:
         upper_green = np.array([90, 255, 255])
         
         mask = cv2.inRange(hsv, lower_green, upper_green)
-        green_pixels = np.sum(mask > 0)
+        green_pixels = cv2.countNonZero(mask)
         total_pixels = img.shape[0] * img.shape[1]
         green_pct = (green_pixels / total_pixels) * 100
         
@@ -64,43 +211,60 @@ def is_valid_plant_image(image_path: str, green_threshold=2.0) -> bool:
         return False
 
 # === Image Preprocessing ===
-def preprocess_image(image_path_or_file, target_size=(224, 224)) -> np.ndarray:
-    """Resize and normalize image for model input."""
-    if isinstance(image_path_or_file, str):
-        img = cv2.imread(image_path_or_file)
+def preprocess_image(image, target_size=(224, 224)) -> np.ndarray:
+    """Resize and normalize a decoded BGR image (or image path / file) for model input."""
+    if isinstance(image, str):
+        img = cv2.imread(image)
         if img is None:
             raise ValueError("Cannot read image at path")
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    elif isinstance(image, np.ndarray):
+        img = image
     else:
-        pil_img = Image.open(image_path_or_file).convert("RGB")
-        img = np.array(pil_img)
+        img = decode_image(image)
 
+    # Resizing first means only the 224x224 result is converted to RGB and float
     img = cv2.resize(img, target_size)
-    img = img / 255.0
-    return np.expand_dims(img, axis=0)
+    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    batch = img[np.newaxis].astype(np.float32)
+    np.divide(batch, 255.0, out=batch)
+    return batch
 
 # === Prediction ===
-def predict_disease(image_file) -> dict:
+def _get_model():
+    model = registry.get("disease")
     if model is None:
         raise RuntimeError("Model not loaded.")
     if not CLASS_NAMES:
         raise RuntimeError("CLASS_NAMES is empty. Check class_indices.json.")
+    # Cached results are only valid for the model that produced them
+    result_cache.bind(model)
+    return model
 
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tmp:
-        tmp.write(image_file.read())
-        tmp.flush()
-        tmp_path = tmp.name
 
-    try:
-        if not is_valid_plant_image(tmp_path):
-            raise ValueError("Image is not a plant.")
-        image_file.seek(0)
-        processed_img = preprocess_image(image_file)
-    finally:
-        if os.path.exists(tmp_path):
-            os.remove(tmp_path)
-
-    predictions = model.predict(processed_img)[0]
+def prepare_image(data: bytes):
+    """
+    Returns (cached result, None, None) for a cached image, or
+    (None, cache keys, model input) after one in-memory decode shared by the
+    hashes, the plant check and the preprocessing.
+    """
+    digest = content_hash(data)
+    cached = result_cache.get_exact(digest)
+    if cached is not None:
+        return cached, None, None
+
+    img = decode_image(data)
+    phash, dhash = perceptual_hashes(img)
+    cached = result_cache.get_similar(phash, dhash, digest)
+    if cached is not None:
+        return cached, None, None
+
+    if not is_valid_plant_image(img):
+        raise ValueError("Image is not a plant.")
+    return None, (digest, phash, dhash), preprocess_image(img)
+
+
+def build_result(predictions) -> dict:
+    """Turns one row of model output into the API result."""
     pred_idx = int(np.argmax(predictions))
 
     if pred_idx >= len(CLASS_NAMES):
@@ -117,3 +281,105 @@ def predict_disease(image_file) -> dict:
         "treatment": disease_details.get("treatment", "No treatment specified."),
         "preventive_measures": disease_details.get("preventive_measures", "No preventive measures specified.")
     }
+
+
+def predict_disease(image_file) -> dict:
+    if sidecar.enabled():
+        return sidecar.get_client().predict_disease(read_upload(image_file))
+
+    model = _get_model()
+
+    # Resent photos are answered from the cache without running the model
+    cached, keys, processed_img = prepare_image(read_upload(image_file))
+    if cached is not None:
+        return cached
+
+    if settings.DISEASE_BATCHING:
+        predictions = batcher.predict(processed_img)
+    else:
+        predictions = model.predict(processed_img)[0]
+
+    result = build_result(predictions)
+    result_cache.set(*keys, result)
+    return result
+
+
+def _read_or_error(image_file):
+    try:
+        return image_file if isinstance(image_file, bytes) else read_upload(image_file)
+    except ValueError as e:
+        return e
+
+
+def _prepare_or_error(data):
+    if isinstance(data, Exception):
+        return data
+    try:
+        return prepare_image(data)
+    except Exception as e:
+        return e
+
+
+def predict_diseases(image_files) -> list:
+    """
+    Predicts several images (uploads or bytes) with one forward pass. Decoding
+    and validation run in parallel on preprocess_executor. Returns one result per
+    image, in order; images that could not be used get {"error": message}.
+    """
+    images = [_read_or_error(image_file) for image_file in image_files]
+    if sidecar.enabled():
+        readable = [i for i, data in enumerate(images) if not isinstance(data, Exception)]
+        remote = sidecar.get_client().predict_diseases([images[i] for i in readable]) if readable else []
+        results = [{"error": str(data)} if isinstance(data, Exception) else None for data in images]
+        for i, result in zip(readable, remote):
+            results[i] = result
+        return results
+
+    model = _get_model()
+    prepared = list(preprocess_executor.map(_prepare_or_error, images))
+
+    results = [None] * len(prepared)
+    pending = []
+    for i, item in enumerate(prepared):
+        if isinstance(item, Exception):
+            results[i] = {"error": str(item) or "Prediction failed."}
+        elif item[0] is not None:
+            results[i] = item[0]
+        else:
+            pending.append(i)
+
+    if pending:
+        predictions = model.predict(np.concatenate([prepared[i][2] for i in pending]), verbose=0)
+        for i, row in zip(pending, predictions):
+            results[i] = build_result(row)
+            result_cache.set(*prepared[i][1], results[i])
+
+    return results
+
+
+def diagnose(results) -> dict:
+    """
+    Field-level diagnosis from per-image results: the disease with the largest
+    summed confidence across the images, or None if no image could be used.
+    """
+    votes = {}
+    for result in results:
+        if "disease" in result:
+            count, total = votes.get(result["disease"], (0, 0.0))
+            votes[result["disease"]] = (count + 1, total + result["confidence"])
+    if not votes:
+        return None
+
+    disease_name, (count, total) = max(votes.items(), key=lambda item: item[1][1])
+    valid = sum(count for count, _ in votes.values())
+    disease_details = DISEASE_INFO.get(disease_name, {})
+    return {
+        "disease": disease_name,
+        "images": count,
+        "share": round(count / valid, 4),
+        "mean_confidence": round(total / count, 4),
+        "votes": {name: count for name, (count, _) in sorted(votes.items(), key=lambda item: -item[1][1])},
+        "description": disease_details.get("description", "No description available."),
+        "treatment": disease_details.get("treatment", "No treatment specified."),
+        "preventive_measures": disease_details.get("preventive_measures", "No preventive measures specified.")
+    }
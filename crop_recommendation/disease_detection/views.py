@@ -1,8 +1,16 @@
+from django.conf import settings
 from django.views.decorators.csrf import csrf_exempt
 from django.http import JsonResponse
+from django.urls import reverse
 from django.utils.decorators import method_decorator
 from django.views import View
-from .utils import predict_disease
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from .batching import QueueFullError
+from .jobs import submit_job
+from .models import DiseaseDetectionJob
+from .utils import batcher, diagnose, predict_disease, predict_diseases, read_upload, result_cache
 
 @method_decorator(csrf_exempt, name='dispatch')  # Disable CSRF for testing only; enable in production
 class PredictDiseaseView(View):
@@ -17,9 +25,85 @@ class PredictDiseaseView(View):
         except ValueError as ve:
             # Raised when image is invalid (e.g., not enough green pixels)
             return JsonResponse({'error': str(ve)}, status=400)
+        except QueueFullError as qe:
+            # Too many requests are already waiting for the model
+            return JsonResponse({'error': str(qe)}, status=503)
         except RuntimeError as re:
             # Raised if model is not loaded or class names missing
             return JsonResponse({'error': str(re)}, status=500)
         except Exception as e:
             # Catch-all for unexpected errors
             return JsonResponse({'error': 'Prediction failed.', 'details': str(e)}, status=500)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class PredictDiseaseBatchView(View):
+    """Several leaf photos from one field: per-image predictions plus a field-level diagnosis."""
+    def post(self, request, *args, **kwargs):
+        image_files = request.FILES.getlist('images') or request.FILES.getlist('image')
+        if not image_files:
+            return JsonResponse({'error': 'No image files provided.'}, status=400)
+        if len(image_files) > settings.DISEASE_BATCH_MAX_IMAGES:
+            return JsonResponse(
+                {'error': f'At most {settings.DISEASE_BATCH_MAX_IMAGES} images are allowed per request.'}, status=400
+            )
+
+        try:
+            results = predict_diseases(image_files)
+        except ValueError as ve:
+            return JsonResponse({'error': str(ve)}, status=400)
+        except QueueFullError as qe:
+            return JsonResponse({'error': str(qe)}, status=503)
+        except RuntimeError as re:
+            return JsonResponse({'error': str(re)}, status=500)
+        except Exception as e:
+            return JsonResponse({'error': 'Prediction failed.', 'details': str(e)}, status=500)
+
+        return JsonResponse({
+            'results': [
+                {'index': index, 'filename': image_file.name, **result}
+                for index, (image_file, result) in enumerate(zip(image_files, results))
+            ],
+            'diagnosis': diagnose(results),
+        })
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def disease_metrics(request):
+    """Micro-batcher (batch sizes, queue depth) and result cache counters for this process."""
+    return Response({**batcher.metrics(), 'cache': result_cache.stats()})
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class DiseaseJobView(View):
+    """Queues an image for detection and answers immediately; poll the returned status_url."""
+    def post(self, request, *args, **kwargs):
+        image_file = request.FILES.get('image')
+        if not image_file:
+            return JsonResponse({'error': 'No image file provided.'}, status=400)
+
+        try:
+            job = submit_job(read_upload(image_file))
+        except ValueError as ve:
+            return JsonResponse({'error': str(ve)}, status=400)
+
+        return JsonResponse({
+            'id': str(job.id),
+            'status': job.status,
+            'status_url': request.build_absolute_uri(reverse('disease-job', args=[job.id])),
+        }, status=202)
+
+
+class DiseaseJobStatusView(View):
+    def get(self, request, job_id, *args, **kwargs):
+        job = (
+            DiseaseDetectionJob.objects
+            .filter(id=job_id)
+            .values('id', 'status', 'result', 'error', 'created_at', 'finished_at')
+            .first()
+        )
+        if job is None:
+            return JsonResponse({'error': 'Job not found.'}, status=404)
+        job['id'] = str(job['id'])
+        return JsonResponse(job)
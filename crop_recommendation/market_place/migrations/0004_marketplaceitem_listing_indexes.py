@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market_place', '0003_marketplaceitem_image'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='marketplaceitem',
+            index=models.Index(fields=['-created_at', '-id'], name='market_item_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='marketplaceitem',
+            index=models.Index(fields=['category', '-created_at', '-id'], name='market_item_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='marketplaceitem',
+            index=models.Index(fields=['location', '-created_at', '-id'], name='market_item_location_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='marketplaceitem',
+            index=models.Index(fields=['category', 'price'], name='market_item_category_price_idx'),
+        ),
+    ]
@@ -14,5 +14,14 @@ class MarketplaceItem(models.Model):
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # Listing is newest first by (created_at, id), optionally filtered (market_place/pagination.py)
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='market_item_recent_idx'),
+            models.Index(fields=['category', '-created_at', '-id'], name='market_item_category_idx'),
+            models.Index(fields=['location', '-created_at', '-id'], name='market_item_location_idx'),
+            models.Index(fields=['category', 'price'], name='market_item_category_price_idx'),
+        ]
+
     def __str__(self):
         return self.name
@@ -2,6 +2,15 @@ from rest_framework import serializers
 from .models import MarketplaceItem
 
 class MarketplaceItemSerializer(serializers.ModelSerializer):
+    """
+    Pass fields=[...] to serialize only those fields (the ?fields= sparse fieldset).
+    """
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
     class Meta:
         model = MarketplaceItem
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
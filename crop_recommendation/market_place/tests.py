@@ -1,3 +1,76 @@
+from datetime import timedelta
+from decimal import Decimal
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from .models import MarketplaceItem
+from .pagination import KeysetPagination
+
+
+class MarketplaceListingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        for i in range(25):
+            MarketplaceItem.objects.create(
+                name=f"Item {i}", description="", price=Decimal(100 + i), category='SEEDS' if i % 2 else 'TOOLS',
+                location='Arusha', contact_info='+255700000000',
+                # Pairs share a timestamp, so pages must also order by id
+                created_at=now - timedelta(minutes=i // 2),
+            )
+
+    def get(self, **params):
+        return self.client.get(reverse('marketplaceitem-list'), params)
+
+    def test_pages_cover_every_item_once(self):
+        seen = []
+        response = self.get(limit=10)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            seen.extend(item['id'] for item in response.json()['results'])
+            if not response.json()['next']:
+                break
+            response = self.client.get(response.json()['next'])
+        expected = list(MarketplaceItem.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_cursor_round_trip(self):
+        item = MarketplaceItem.objects.first()
+        paginator = KeysetPagination()
+        self.assertEqual(paginator.decode_cursor(paginator.encode_cursor(item)), (item.created_at, item.pk))
+
+    def test_invalid_cursor_is_404(self):
+        self.assertEqual(self.get(cursor='not-a-cursor').status_code, 404)
+
+    def test_filters(self):
+        results = self.get(category='SEEDS', min_price='110', max_price='120', limit=100).json()['results']
+        self.assertTrue(results)
+        for item in results:
+            self.assertEqual(item['category'], 'SEEDS')
+            self.assertTrue(Decimal('110') <= Decimal(item['price']) <= Decimal('120'))
+
+    def test_non_finite_prices_are_400(self):
+        for params in ({'min_price': 'NaN'}, {'max_price': 'Infinity'}, {'min_price': '-inf'}, {'max_price': 'cheap'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.get(**params).status_code, 400)
+
+    def test_limit(self):
+        for limit in ('0', '-5', 'ten'):
+            with self.subTest(limit=limit):
+                self.assertEqual(self.get(limit=limit).status_code, 400)
+        self.assertEqual(len(self.get(limit=500).json()['results']), 25)
+        self.assertEqual(len(self.get().json()['results']), 20)
+
+    def test_sparse_fields(self):
+        results = self.get(fields='name,price').json()['results']
+        self.assertEqual(set(results[0]), {'name', 'price'})
+        self.assertEqual(self.get(fields='name,secret').status_code, 400)
+
+    def test_documented_path_and_page_shape(self):
+        # api_docs.md documents this path and the {"next", "results"} object that replaced the bare array
+        self.assertEqual(reverse('marketplaceitem-list'), '/market/items/')
+        page = self.client.get('/market/items/').json()
+        self.assertEqual(set(page), {'next', 'results'})
+        self.assertTrue(page['next'].startswith('http://testserver/market/items/?cursor='))
 
-# Create your tests here.
@@ -1,8 +1,11 @@
+from decimal import Decimal, InvalidOperation
 from django.shortcuts import render
 from rest_framework import viewsets, status
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import AllowAny  
 from rest_framework.response import Response
 from .models import MarketplaceItem
+from .pagination import KeysetPagination
 from .serializers import MarketplaceItemSerializer
 
 class MarketplaceItemViewSet(viewsets.ModelViewSet):
@@ -13,11 +16,51 @@ class MarketplaceItemViewSet(viewsets.ModelViewSet):
     queryset = MarketplaceItem.objects.all()
     serializer_class = MarketplaceItemSerializer
     permission_classes = [AllowAny]  
+    pagination_class = KeysetPagination
 
     def list(self, request):
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        """
+        Newest first, a page at a time (see KeysetPagination).
+        Filters: ?category=, ?location= (exact), ?min_price=, ?max_price=.
+        ?fields=id,name,price returns only those fields.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+
+        for param, lookup in (('category', 'category'), ('location', 'location')):
+            value = request.query_params.get(param)
+            if value:
+                queryset = queryset.filter(**{lookup: value})
+        for param, lookup in (('min_price', 'price__gte'), ('max_price', 'price__lte')):
+            value = request.query_params.get(param)
+            if value:
+                try:
+                    price = Decimal(value)
+                except InvalidOperation:
+                    price = None
+                # Decimal also parses "NaN" and "Infinity", which the database cannot compare
+                if price is None or not price.is_finite():
+                    raise ValidationError({param: 'Must be a number.'})
+                queryset = queryset.filter(**{lookup: price})
+
+        fields = self.get_sparse_fields(request)
+        if fields is not None:
+            # The cursor needs created_at and id whatever the client asked for
+            queryset = queryset.only(*({'id', 'created_at'} | set(fields)))
+
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True, fields=fields)
+        return self.get_paginated_response(serializer.data)
+
+    def get_sparse_fields(self, request):
+        value = request.query_params.get('fields')
+        if not value:
+            return None
+        fields = [name.strip() for name in value.split(',') if name.strip()]
+        known = {field.name for field in MarketplaceItem._meta.concrete_fields}
+        unknown = [name for name in fields if name not in known]
+        if unknown or not fields:
+            raise ValidationError({'fields': f"Unknown fields: {', '.join(unknown)}" if unknown else 'No fields given.'})
+        return fields
 
     def create(self, request):
         serializer = self.get_serializer(data=request.data)
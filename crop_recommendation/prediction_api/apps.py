@@ -1,6 +1,17 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class PredictionApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'prediction_api'
+
+    def ready(self):
+        # With an inference sidecar the models live in that process, not in the web workers
+        if settings.MODEL_PRELOAD and not settings.INFERENCE_SIDECAR_SOCKET:
+            # Importing the apps' model modules registers their loaders
+            import crop_predictor.services  # noqa: F401
+            import disease_detection.utils  # noqa: F401
+            from . import registry
+
+            registry.preload()
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from prediction_api import sidecar
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs the shared inference process holding the crop and disease models. "
+        "Web workers use it when INFERENCE_SIDECAR_SOCKET points at the same socket."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--socket", default=None, help="Unix socket path (default: INFERENCE_SIDECAR_SOCKET)")
+        parser.add_argument("--workers", type=int, default=None, help="Concurrent predictions (default: INFERENCE_SIDECAR_WORKERS)")
+
+    def handle(self, *args, **options):
+        path = options["socket"] or settings.INFERENCE_SIDECAR_SOCKET
+        if not path:
+            raise CommandError("Pass --socket or set INFERENCE_SIDECAR_SOCKET")
+        try:
+            sidecar.serve(path, max(1, options["workers"] or settings.INFERENCE_SIDECAR_WORKERS))
+        except KeyboardInterrupt:
+            self.stdout.write("Inference sidecar stopped.")
@@ -0,0 +1,151 @@
+"""
+Registry of the ML models served by the project.
+
+Each model has a name, a version and file path(s) configured in
+settings.ML_MODELS, and a loader registered by the app that uses it.
+Models load lazily on first use (optionally warmed up), and are reloaded when
+their files change or on request. A reload builds the new model completely
+before swapping the reference, so requests already holding the old model
+finish on it.
+"""
+
+import os
+import threading
+import time
+from django.conf import settings
+from django.utils import timezone
+
+
+class ModelEntry:
+    def __init__(self, name, loader, warmup=None, files=None):
+        self.name = name
+        self.loader = loader
+        self.warmup = warmup
+        self.files = files
+        self.model = None
+        self.version = None
+        self.loaded_at = None
+        self.error = None
+        self._mtime = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def config(self):
+        return settings.ML_MODELS.get(self.name, {})
+
+    @property
+    def paths(self):
+        """The files the loader reads with the current config: watched for changes and touched on reload."""
+        config = self.config
+        if self.files is not None:
+            return [path for path in self.files(config) if path]
+        return [value for key, value in config.items() if key.endswith("path") and value]
+
+    def _files_mtime(self):
+        mtimes = [os.path.getmtime(path) for path in self.paths if os.path.exists(path)]
+        return max(mtimes) if mtimes else None
+
+    def get(self):
+        """Returns the current model, loading or reloading it if needed; None if it cannot load."""
+        interval = settings.MODEL_RELOAD_CHECK_INTERVAL
+        now = time.monotonic()
+        if self.model is None:
+            # Failed loads are retried at most once per check interval
+            if self._last_check == 0.0 or now - self._last_check >= max(interval, 1):
+                self.load()
+        elif interval and now - self._last_check >= interval:
+            self._last_check = now
+            mtime = self._files_mtime()
+            if mtime is not None and mtime != self._mtime:
+                self.load()
+        return self.model
+
+    def load(self, force=False):
+        """Loads (and warms up) a fresh copy, then swaps it in. Keeps the old model on failure."""
+        with self._lock:
+            self._last_check = time.monotonic()
+            config = self.config
+            mtime = self._files_mtime()
+            if not force and self.model is not None and mtime == self._mtime:
+                # Another thread already loaded these files while we waited for the lock
+                return self.model
+
+            try:
+                model = self.loader(config)
+                if self.warmup is not None and settings.MODEL_WARMUP:
+                    self.warmup(model)
+            except Exception as e:
+                print(f"Error loading model {self.name}: {e}")
+                self.error = str(e)
+                return self.model
+
+            self.model = model
+            self.version = config.get("version")
+            self.loaded_at = timezone.now()
+            self.error = None
+            self._mtime = mtime
+            print(f"Model {self.name} version {self.version} loaded.")
+            return model
+
+    def describe(self):
+        return {
+            "name": self.name,
+            "version": self.version if self.model is not None else self.config.get("version"),
+            "paths": self.paths,
+            "loaded": self.model is not None,
+            "loaded_at": self.loaded_at,
+            "error": self.error,
+        }
+
+
+_entries = {}
+_entries_lock = threading.Lock()
+
+
+def register(name, loader, warmup=None, files=None):
+    """
+    Registers `loader(config) -> model` for settings.ML_MODELS[name].
+    `warmup(model)` runs after each load when MODEL_WARMUP is on.
+    `files(config)` lists the paths the loader reads; by default every
+    config key ending in "path".
+    """
+    with _entries_lock:
+        if name not in _entries:
+            _entries[name] = ModelEntry(name, loader, warmup, files)
+        return _entries[name]
+
+
+def get(name):
+    """Returns the current model registered as `name`, or None if it is unavailable."""
+    entry = _entries.get(name)
+    if entry is None:
+        raise KeyError(f"No model registered as {name!r}")
+    return entry.get()
+
+
+def reload(name=None):
+    """
+    Reloads one model (or all) in this process and touches its files, so the
+    file watchers in the other workers reload it on their next check too.
+    """
+    entries = [_entries[name]] if name else list(_entries.values())
+    for entry in entries:
+        for path in entry.paths:
+            if os.path.exists(path):
+                try:
+                    os.utime(path)
+                except OSError as e:
+                    # e.g. a read-only mount: this worker still reloads, the others only on their own
+                    print(f"Could not touch {path} to signal a reload of {entry.name}: {e}")
+        entry.load(force=True)
+    return [entry.describe() for entry in entries]
+
+
+def describe():
+    return [entry.describe() for entry in _entries.values()]
+
+
+def preload():
+    for entry in list(_entries.values()):
+        entry.get()
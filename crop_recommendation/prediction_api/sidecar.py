@@ -0,0 +1,337 @@
+"""
+Optional inference sidecar: one local process holds the crop and disease
+models and serves the web workers over a Unix socket, so each gunicorn worker
+no longer loads TensorFlow and its own copy of the models.
+
+Every message is a frame: a 1-byte op (or status in replies), a 4-byte
+big-endian payload length, then the payload.
+
+  OP_CROP     request:  uint32 known labels epoch, uint32 known labels generation, uint32 k,
+                        float64 rows (n x 7, little-endian)
+              reply:    uint32 labels epoch, uint32 labels generation, uint32 n, uint32 k,
+                        int32 indices (n x k), float64 scores (n x k), then the JSON class
+                        labels if the (epoch, generation) differs from the one the client sent
+  OP_DISEASE  request:  raw image bytes
+              reply:    the predict_disease() result as JSON
+  OP_DISEASE_BATCH  request:  uint32 n, n x uint32 image sizes, then the images back to back
+                    reply:    the predict_diseases() results as JSON
+                    (the client splits larger batches over several requests)
+  OP_PING     empty request and reply
+
+Failed replies carry an error message; the status says which exception to
+re-raise in the client, so the views keep their error responses.
+"""
+
+import io
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from django.conf import settings
+from disease_detection.batching import QueueFullError
+
+OP_PING, OP_CROP, OP_DISEASE, OP_DISEASE_BATCH = 0, 1, 2, 3
+STATUS_OK, STATUS_VALUE_ERROR, STATUS_RUNTIME_ERROR, STATUS_ERROR, STATUS_BUSY = 0, 1, 2, 3, 4
+
+HEADER = struct.Struct("!BI")
+CROP_REQUEST = struct.Struct("!III")
+CROP_REPLY = struct.Struct("!IIII")
+COUNT = struct.Struct("!I")
+MAX_PAYLOAD = 64 * 1024 * 1024
+N_FEATURES = 7
+
+# True inside the sidecar process, where predictions must run locally
+_serving = False
+
+
+def enabled():
+    """Whether predictions should be sent to the sidecar instead of running in this process."""
+    return bool(settings.INFERENCE_SIDECAR_SOCKET) and not _serving
+
+
+def _recv_exactly(sock, size):
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if not count:
+            raise ConnectionError("Inference sidecar closed the connection")
+        received += count
+    return bytes(buffer)
+
+
+def send_frame(sock, code, payload=b""):
+    sock.sendall(HEADER.pack(code, len(payload)) + payload)
+
+
+def recv_frame(sock):
+    code, length = HEADER.unpack(_recv_exactly(sock, HEADER.size))
+    if length > MAX_PAYLOAD:
+        raise ConnectionError(f"Frame of {length} bytes exceeds the {MAX_PAYLOAD} byte limit")
+    return code, _recv_exactly(sock, length)
+
+
+# === Client ===
+
+class SidecarClient:
+    """One persistent connection per thread; reconnects once if the sidecar restarted."""
+
+    def __init__(self, path, timeout):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._labels_lock = threading.Lock()
+        self._labels = ((0, 0), None)
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.path)
+        self._local.sock = sock
+        return sock
+
+    def _close(self):
+        sock = getattr(self._local, "sock", None)
+        self._local.sock = None
+        if sock is not None:
+            sock.close()
+
+    def call(self, op, payload=b""):
+        for attempt in range(2):
+            try:
+                sock = getattr(self._local, "sock", None) or self._connect()
+                send_frame(sock, op, payload)
+                status, reply = recv_frame(sock)
+                break
+            except (ConnectionError, socket.timeout, OSError) as e:
+                self._close()
+                # A stale connection fails immediately; retry once on a fresh one
+                if attempt or isinstance(e, socket.timeout):
+                    raise RuntimeError(f"Inference sidecar unavailable: {e}")
+
+        if status == STATUS_OK:
+            return reply
+        message = reply.decode("utf-8", "replace")
+        if status == STATUS_VALUE_ERROR:
+            raise ValueError(message)
+        if status == STATUS_BUSY:
+            raise QueueFullError(message)
+        if status == STATUS_RUNTIME_ERROR:
+            raise RuntimeError(message)
+        raise Exception(message)
+
+    def predict_crop(self, features, k=2):
+        """Returns (indices, scores, class_labels) like predict_crop_batch on the sidecar's model."""
+        rows = np.ascontiguousarray(features, dtype="<f8").reshape(-1, N_FEATURES)
+        generation, labels = self._labels
+        reply = self.call(OP_CROP, CROP_REQUEST.pack(*generation, k) + rows.tobytes())
+
+        reply_epoch, reply_number, n, k = CROP_REPLY.unpack_from(reply)
+        reply_generation = (reply_epoch, reply_number)
+        offset = CROP_REPLY.size
+        indices = np.frombuffer(reply, dtype="<i4", count=n * k, offset=offset).reshape(n, k)
+        offset += indices.nbytes
+        scores = np.frombuffer(reply, dtype="<f8", count=n * k, offset=offset).reshape(n, k)
+        offset += scores.nbytes
+
+        if reply_generation != generation:
+            labels = json.loads(reply[offset:])
+            with self._labels_lock:
+                self._labels = (reply_generation, labels)
+        return indices, scores, labels
+
+    def predict_disease(self, image_bytes):
+        if len(image_bytes) > MAX_PAYLOAD:
+            raise ValueError(f"Image is larger than {MAX_PAYLOAD // (1024 * 1024)} MB.")
+        return json.loads(self.call(OP_DISEASE, image_bytes))
+
+    def predict_diseases(self, images):
+        """Sends the images in as many frames as needed to keep each under MAX_PAYLOAD."""
+        results = []
+        for chunk in _frame_chunks(images):
+            sizes = np.array([len(image) for image in chunk], dtype=">u4")
+            payload = COUNT.pack(len(chunk)) + sizes.tobytes() + b"".join(chunk)
+            results.extend(json.loads(self.call(OP_DISEASE_BATCH, payload)))
+        return results
+
+    def ping(self):
+        self.call(OP_PING)
+
+
+def _frame_chunks(images):
+    """Splits images into runs whose OP_DISEASE_BATCH payload fits in one frame."""
+    chunk, size = [], COUNT.size
+    for image in images:
+        image_size = COUNT.size + len(image)
+        if COUNT.size + image_size > MAX_PAYLOAD:
+            raise ValueError(f"Image is larger than {MAX_PAYLOAD // (1024 * 1024)} MB.")
+        if chunk and size + image_size > MAX_PAYLOAD:
+            yield chunk
+            chunk, size = [], COUNT.size
+        chunk.append(image)
+        size += image_size
+    if chunk:
+        yield chunk
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None or _client.path != settings.INFERENCE_SIDECAR_SOCKET:
+            _client = SidecarClient(settings.INFERENCE_SIDECAR_SOCKET, settings.INFERENCE_SIDECAR_TIMEOUT)
+        return _client
+
+
+# === Server ===
+
+class _LabelGenerations:
+    """
+    Numbers each crop model object the sidecar serves, so clients refetch labels
+    after a reload. Generations are (epoch, n): the random per-process epoch keeps
+    a restarted sidecar's generation 1 from matching the labels of the last one.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._model = None
+        self._epoch = int.from_bytes(os.urandom(4), "big") or 1
+        self._generation = 0
+
+    def of(self, crop_model):
+        with self._lock:
+            if crop_model is not self._model:
+                self._model = crop_model
+                self._generation += 1
+            return self._epoch, self._generation
+
+
+_generations = _LabelGenerations()
+
+
+def handle_crop(payload):
+    from crop_predictor.services import predict_crop_batch
+    from . import registry
+
+    known_epoch, known_number, k = CROP_REQUEST.unpack_from(payload)
+    rows = np.frombuffer(payload, dtype="<f8", offset=CROP_REQUEST.size).reshape(-1, N_FEATURES)
+    crop_model = registry.get("crop")
+    if crop_model is None:
+        raise RuntimeError("Model not loaded properly.")
+    indices, scores = predict_crop_batch(rows, k=k, crop_model=crop_model)
+
+    generation = _generations.of(crop_model)
+    parts = [
+        CROP_REPLY.pack(*generation, indices.shape[0], indices.shape[1]),
+        np.ascontiguousarray(indices, dtype="<i4").tobytes(),
+        np.ascontiguousarray(scores, dtype="<f8").tobytes(),
+    ]
+    if generation != (known_epoch, known_number):
+        parts.append(json.dumps([str(label) for label in crop_model.model.classes_]).encode("utf-8"))
+    return b"".join(parts)
+
+
+def handle_disease(payload):
+    from disease_detection.utils import predict_disease
+
+    return json.dumps(predict_disease(io.BytesIO(payload))).encode("utf-8")
+
+
+def handle_disease_batch(payload):
+    from disease_detection.utils import predict_diseases
+
+    (count,) = COUNT.unpack_from(payload)
+    sizes = np.frombuffer(payload, dtype=">u4", count=count, offset=COUNT.size)
+    offset = COUNT.size + sizes.nbytes
+    images = []
+    for size in sizes.tolist():
+        images.append(payload[offset:offset + size])
+        offset += size
+    return json.dumps(predict_diseases(images)).encode("utf-8")
+
+
+HANDLERS = {
+    OP_PING: lambda payload: b"",
+    OP_CROP: handle_crop,
+    OP_DISEASE: handle_disease,
+    OP_DISEASE_BATCH: handle_disease_batch,
+}
+
+
+def dispatch(op, payload):
+    """Runs one request and returns (status, reply payload)."""
+    handler = HANDLERS.get(op)
+    if handler is None:
+        return STATUS_ERROR, f"Unknown op {op}".encode("utf-8")
+    try:
+        return STATUS_OK, handler(payload)
+    except ValueError as e:
+        return STATUS_VALUE_ERROR, str(e).encode("utf-8")
+    except QueueFullError as e:
+        return STATUS_BUSY, str(e).encode("utf-8")
+    except RuntimeError as e:
+        return STATUS_RUNTIME_ERROR, str(e).encode("utf-8")
+    except Exception as e:
+        print(f"Inference sidecar error: {e}")
+        return STATUS_ERROR, str(e).encode("utf-8")
+
+
+class _ConnectionHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                op, payload = recv_frame(self.request)
+            except (ConnectionError, OSError):
+                return
+            # Connections are cheap threads; the pool bounds how many predictions run at once
+            status, reply = self.server.executor.submit(dispatch, op, payload).result()
+            try:
+                send_frame(self.request, status, reply)
+            except OSError:
+                return
+
+
+class InferenceServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    # Every worker thread of every web worker may connect at once
+    request_queue_size = 256
+
+    def __init__(self, path, workers):
+        if os.path.exists(path):
+            os.remove(path)
+        super().__init__(path, _ConnectionHandler)
+        os.chmod(path, 0o660)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=False)
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+
+def serve(path, workers):
+    """Loads both models in this process and serves them until interrupted."""
+    global _serving
+    _serving = True
+
+    # Importing the apps' model modules registers their loaders
+    import crop_predictor.services  # noqa: F401
+    import disease_detection.utils  # noqa: F401
+    from . import registry
+
+    registry.preload()
+    server = InferenceServer(path, workers)
+    print(f"Inference sidecar listening on {path} with {workers} workers")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
@@ -1,3 +1,179 @@
-from django.test import TestCase
+import json
+import os
+import socket
+import tempfile
+from unittest import mock
+import numpy as np
+from django.test import SimpleTestCase, override_settings
+from . import registry, sidecar
+
+
+class SidecarFrameTests(SimpleTestCase):
+    def test_frame_round_trip(self):
+        left, right = socket.socketpair()
+        with left, right:
+            sidecar.send_frame(left, sidecar.OP_DISEASE, b"image bytes")
+            self.assertEqual(sidecar.recv_frame(right), (sidecar.OP_DISEASE, b"image bytes"))
+            sidecar.send_frame(left, sidecar.OP_PING)
+            self.assertEqual(sidecar.recv_frame(right), (sidecar.OP_PING, b""))
+
+    def test_oversized_frame_is_refused(self):
+        left, right = socket.socketpair()
+        with left, right:
+            left.sendall(sidecar.HEADER.pack(sidecar.OP_DISEASE, sidecar.MAX_PAYLOAD + 1))
+            with self.assertRaises(ConnectionError):
+                sidecar.recv_frame(right)
+
+    def test_dispatch_maps_exceptions_to_statuses(self):
+        with mock.patch.dict(sidecar.HANDLERS, {sidecar.OP_DISEASE: mock.Mock(side_effect=ValueError("bad image"))}):
+            self.assertEqual(sidecar.dispatch(sidecar.OP_DISEASE, b""), (sidecar.STATUS_VALUE_ERROR, b"bad image"))
+        self.assertEqual(sidecar.dispatch(99, b"")[0], sidecar.STATUS_ERROR)
+
+
+class SidecarDiseaseBatchTests(SimpleTestCase):
+    def fake_call(self, op, payload):
+        # Decodes the request like handle_disease_batch, answering with each image's size
+        self.assertEqual(op, sidecar.OP_DISEASE_BATCH)
+        self.assertLessEqual(len(payload), sidecar.MAX_PAYLOAD)
+        self.frames += 1
+        (count,) = sidecar.COUNT.unpack_from(payload)
+        sizes = [sidecar.COUNT.unpack_from(payload, sidecar.COUNT.size * (i + 1))[0] for i in range(count)]
+        return json.dumps([{"size": size} for size in sizes]).encode("utf-8")
+
+    def setUp(self):
+        self.frames = 0
+        self.client = sidecar.SidecarClient("/nonexistent.sock", 1)
+        self.client.call = self.fake_call
+
+    def test_large_batch_is_split_across_frames(self):
+        images = [b"x" * 300 for _ in range(10)]
+        with mock.patch.object(sidecar, "MAX_PAYLOAD", 1000):
+            results = self.client.predict_diseases(images)
+        self.assertEqual(results, [{"size": 300}] * 10)
+        # Three 300-byte images (plus their sizes) fit in each 1000-byte frame
+        self.assertEqual(self.frames, 4)
+
+    def test_small_batch_is_one_frame(self):
+        self.assertEqual(self.client.predict_diseases([b"a", b"bb"]), [{"size": 1}, {"size": 2}])
+        self.assertEqual(self.frames, 1)
+
+    def test_image_over_frame_limit_is_a_value_error(self):
+        with mock.patch.object(sidecar, "MAX_PAYLOAD", 100), self.assertRaises(ValueError):
+            self.client.predict_diseases([b"x" * 200])
+
+
+class SidecarCropLabelsTests(SimpleTestCase):
+    """The client caches the class labels and only receives them again when the generation changes."""
+
+    def crop_model(self, labels):
+        return mock.Mock(model=mock.Mock(classes_=np.array(labels)))
+
+    def serve(self, crop_model):
+        def call(op, payload):
+            self.replies.append(sidecar.dispatch(op, payload)[1])
+            return self.replies[-1]
+
+        indices, scores = np.array([[1, 0]]), np.array([[0.9, 0.1]])
+        self.client.call = call
+        return (
+            mock.patch("prediction_api.registry.get", return_value=crop_model),
+            mock.patch("crop_predictor.services.predict_crop_batch", return_value=(indices, scores)),
+        )
+
+    def predict(self, crop_model):
+        first, second = self.serve(crop_model)
+        with first, second:
+            return self.client.predict_crop(np.zeros((1, sidecar.N_FEATURES)))
+
+    def setUp(self):
+        self.replies = []
+        self.client = sidecar.SidecarClient("/nonexistent.sock", 1)
+
+    def test_labels_are_sent_once_per_generation(self):
+        model = self.crop_model(["maize", "rice"])
+        with mock.patch.object(sidecar, "_generations", sidecar._LabelGenerations()):
+            self.assertEqual(self.predict(model)[2], ["maize", "rice"])
+            _, _, labels = self.predict(model)
+        self.assertEqual(labels, ["maize", "rice"])
+        self.assertGreater(len(self.replies[0]), len(self.replies[1]))
+
+    def test_restarted_sidecar_sends_new_labels(self):
+        with mock.patch.object(sidecar, "_generations", sidecar._LabelGenerations()):
+            self.predict(self.crop_model(["maize", "rice"]))
+        # A new process numbers its first model 1 again, under a different epoch
+        with mock.patch.object(sidecar, "_generations", sidecar._LabelGenerations()):
+            _, _, labels = self.predict(self.crop_model(["beans", "cassava"]))
+        self.assertEqual(labels, ["beans", "cassava"])
+
+
+class RegistryTests(SimpleTestCase):
+
+    @staticmethod
+    def read(config):
+        with open(config["path"]) as f:
+            return f.read()
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "model.bin")
+        with open(self.path, "w") as f:
+            f.write("v1")
+        self.loader = mock.Mock(side_effect=self.read)
+        self.settings = override_settings(
+            ML_MODELS={"test": {"version": "1", "path": self.path}}, MODEL_RELOAD_CHECK_INTERVAL=0, MODEL_WARMUP=False
+        )
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+        self.addCleanup(registry._entries.pop, "test", None)
+        registry.register("test", self.loader)
+
+    def test_loads_once_on_first_use(self):
+        self.assertEqual(registry.get("test"), "v1")
+        self.assertEqual(registry.get("test"), "v1")
+        self.assertEqual(self.loader.call_count, 1)
+        self.assertTrue(registry.describe()[-1]["loaded"])
+
+    def test_unknown_model(self):
+        with self.assertRaises(KeyError):
+            registry.get("missing")
+
+    def test_reload_keeps_old_model_on_failure(self):
+        registry.get("test")
+        self.loader.side_effect = OSError("corrupt file")
+        (described,) = registry.reload("test")
+        self.assertEqual(registry.get("test"), "v1")
+        self.assertEqual(described["error"], "corrupt file")
+
+    def test_reload_when_files_cannot_be_touched(self):
+        registry.get("test")
+        with open(self.path, "w") as f:
+            f.write("v2")
+        with mock.patch("prediction_api.registry.os.utime", side_effect=PermissionError("read-only")):
+            (described,) = registry.reload("test")
+        self.assertTrue(described["loaded"])
+        self.assertEqual(registry.get("test"), "v2")
+
+    def test_only_files_the_loader_reads_are_watched(self):
+        from crop_predictor.services import crop_model_files
+        from disease_detection.utils import disease_model_files
+
+        tflite_path = self.path + ".tflite"
+        with open(tflite_path, "w") as f:
+            f.write("quantized")
+        config = {"version": "1", "backend": "keras", "path": self.path, "tflite_path": tflite_path}
+        self.addCleanup(registry._entries.pop, "files", None)
+        entry = registry.register("files", self.loader, files=disease_model_files)
+
+        with override_settings(ML_MODELS={"files": config}):
+            self.assertEqual(entry.paths, [self.path])
+            with mock.patch("prediction_api.registry.os.utime") as utime:
+                registry.reload("files")
+            utime.assert_called_once_with(self.path)
+        with override_settings(ML_MODELS={"files": {**config, "backend": "tflite"}}):
+            self.assertEqual(entry.paths, [tflite_path])
+
+        crop = {"path": "model.joblib", "scaler_path": "scaler.joblib", "compiled_path": ""}
+        self.assertEqual(crop_model_files(crop), ["model.joblib", "scaler.joblib"])
+        self.assertEqual(crop_model_files({**crop, "compiled_path": "model.npz"}), ["model.npz", "scaler.joblib"])
 
-# Create your tests here.
@@ -0,0 +1,7 @@
+from django.urls import path
+from .views import list_models, reload_models
+
+urlpatterns = [
+    path('', list_models, name='list_models'),
+    path('reload/', reload_models, name='reload_models'),
+]
@@ -1,3 +1,22 @@
-from django.shortcuts import render
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from . import registry
 
-# Create your views here.
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def list_models(request):
+    return Response({'models': registry.describe()})
+
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def reload_models(request):
+    """Reloads one model ({"name": "crop"}) or all of them, without a restart."""
+    name = request.data.get('name')
+    try:
+        models = registry.reload(name)
+    except KeyError:
+        return Response({'error': f'Unknown model: {name}'}, status=404)
+    return Response({'models': models})